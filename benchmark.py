@@ -0,0 +1,308 @@
+"""
+Benchmarks of the cost of the protocol, for the report.
+
+Each experiment sweeps one parameter of the computed expression (number of parties, additions, multiplications,
+additions and multiplications of scalars) and runs the protocol a number of times for each value. A run reports the
+end-to-end wall time and the communication rounds (slowest party, as measured by its communication metrics), and the
+bytes, requests and CPU time per party, which are summarized with their mean and confidence interval over the runs.
+The results are written as JSON and/or CSV for regression tracking.
+
+One server is started per experiment, on a free port, and every run is a separate session on it. Its pool of workers
+is sized for the largest number of parties of the experiment, so that the parties never wait for a worker. The
+parties wait on a barrier before they start, so neither the start of the server nor the start of the party processes
+is measured.
+
+Usage: python benchmark.py [--experiment NAME ...] [--values N ...] [--repeats N] [--opening NAME ...]
+                           [--json PATH] [--csv PATH]
+"""
+
+import argparse
+import csv
+import json
+import math
+import random
+import socket
+import statistics
+import time
+from multiprocessing import Barrier, Process, Queue
+from timeit import default_timer as timer
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from communication import create_session, DEFAULT_POOL_SIZE
+from expression import Expression, Scalar, Secret
+from protocol import ProtocolSpec, DEFAULT_OPENING, OPENING_STRATEGIES
+import randomness
+from secret_sharing import FIELD_MODULUS
+from server import run, DEFAULT_WORKERS
+from smc_party import SMCParty
+
+# Time in seconds to wait for the server to accept requests.
+SERVER_START_TIMEOUT = 30.0
+# Time in seconds a party waits for the others on the start barrier.
+PARTY_START_TIMEOUT = 120.0
+
+# Quantiles of Student's t distribution for a two-sided 95% confidence interval, by degrees of freedom.
+T_QUANTILES_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980,
+}
+# Quantile of the normal distribution, used above the largest degrees of freedom of the table.
+Z_QUANTILE_95 = 1.960
+
+# Metrics of a run, summarized over the runs of each value of an experiment. The first ones are the maximum over the
+# parties of the run, the others the mean per party, see run_once.
+SLOWEST_PARTY_METRICS = ["wall_s", "rounds"]
+METRICS = SLOWEST_PARTY_METRICS + ["cpu_s", "bytes", "requests", "poll_retries"]
+
+Parties = Dict[str, Dict[Secret, int]]
+
+
+def random_value() -> int:
+    return random.randint(0, FIELD_MODULUS - 1)
+
+
+def parties_expression(num_parties: int) -> Tuple[Parties, Expression]:
+    """ Two parties with secrets and num_parties - 2 parties without, a fixed expression. """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    parties: Parties = {"Alice": {alice_secret: random_value()}, "Bob": {bob_secret: random_value()}}
+    for i in range(num_parties - 2):
+        parties[f"party{i}"] = {}
+    expr = ((alice_secret + bob_secret) * alice_secret + Scalar(random_value())) * Scalar(random_value())
+    return parties, expr
+
+
+def additions_expression(num_additions: int) -> Tuple[Parties, Expression]:
+    """ A chain of num_additions additions of secrets. """
+    return _chain_expression(num_additions, lambda expr, secret: expr + secret)
+
+
+def multiplications_expression(num_multiplications: int) -> Tuple[Parties, Expression]:
+    """ A chain of num_multiplications multiplications of secrets. """
+    return _chain_expression(num_multiplications, lambda expr, secret: expr * secret)
+
+
+def scalar_additions_expression(num_additions: int) -> Tuple[Parties, Expression]:
+    """ The sum of two secrets plus num_additions scalars. """
+    return _scalar_expression(num_additions, lambda expr, scalar: expr + scalar)
+
+
+def scalar_multiplications_expression(num_multiplications: int) -> Tuple[Parties, Expression]:
+    """ The sum of two secrets times num_multiplications scalars. """
+    return _scalar_expression(num_multiplications, lambda expr, scalar: expr * scalar)
+
+
+def _chain_expression(length: int, combine: Callable[[Expression, Secret], Expression]) -> Tuple[Parties, Expression]:
+    alice_secret = Secret()
+    bob_secret = Secret()
+    parties: Parties = {"Alice": {alice_secret: random_value()}, "Bob": {bob_secret: random_value()}}
+    expr: Expression = alice_secret
+    for i in range(length):
+        expr = combine(expr, bob_secret if i % 2 == 0 else alice_secret)
+    return parties, expr
+
+
+def _scalar_expression(length: int, combine: Callable[[Expression, Scalar], Expression]) -> Tuple[Parties, Expression]:
+    alice_secret = Secret()
+    bob_secret = Secret()
+    parties: Parties = {"Alice": {alice_secret: random_value()}, "Bob": {bob_secret: random_value()}}
+    expr = alice_secret + bob_secret
+    for _ in range(length):
+        expr = combine(expr, Scalar(random_value()))
+    return parties, expr
+
+
+# Expression builder and default values of every experiment.
+EXPERIMENTS: Dict[str, Tuple[Callable[[int], Tuple[Parties, Expression]], List[int]]] = {
+    "parties": (parties_expression, [2, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100]),
+    "additions": (additions_expression, [1, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200, 250]),
+    "multiplications": (multiplications_expression, [1, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200, 250]),
+    "scalar_additions": (scalar_additions_expression, [1, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200, 250]),
+    "scalar_multiplications": (
+        scalar_multiplications_expression, [1, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200, 250]
+    ),
+}
+
+
+def confidence_interval(samples: List[float]) -> Tuple[float, float, float]:
+    """
+    Returns the mean of the samples and the bounds of its 95% confidence interval (Student's t distribution).
+    """
+    mean = statistics.fmean(samples)
+    if len(samples) < 2:
+        return mean, mean, mean
+    degrees = len(samples) - 1
+    known = [key for key in T_QUANTILES_95 if key <= degrees]
+    quantile = T_QUANTILES_95[max(known)] if degrees <= max(T_QUANTILES_95) else Z_QUANTILE_95
+    half_width = quantile * statistics.stdev(samples) / math.sqrt(len(samples))
+    return mean, mean - half_width, mean + half_width
+
+
+def free_port() -> int:
+    """ Returns a TCP port that is free on localhost. """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(host: str, port: int, timeout: float = SERVER_START_TIMEOUT) -> None:
+    """ Polls the server until it answers, instead of sleeping for a fixed time. """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if requests.get(f"http://{host}:{port}/codecs", timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"The server on port {port} did not start within {timeout} s")
+        time.sleep(0.05)
+
+
+def benchmark_party(
+        client_id: str,
+        port: int,
+        prot: ProtocolSpec,
+        value_dict: Dict[Secret, int],
+        barrier: Barrier,
+        queue: Queue
+) -> None:
+    """ Runs one party once all the parties are ready, and reports its cost. """
+    cli = SMCParty(client_id, "localhost", port, protocol_spec=prot, value_dict=value_dict)
+    barrier.wait(PARTY_START_TIMEOUT)
+    start = timer()
+    cpu_start = time.process_time()
+    cli.run()
+    cpu = time.process_time() - cpu_start
+    wall = timer() - start
+    total = cli.communication_report()["total"]
+    queue.put({
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "bytes": cli.bytes_consumed,
+        "requests": total["requests"],
+        "rounds": total["rounds"],
+        "poll_retries": total["poll_retries"],
+    })
+
+
+def run_once(port: int, parties: Parties, expr: Expression, opening: str = DEFAULT_OPENING) -> Dict[str, float]:
+    """
+    Runs the protocol once, in a new session, and returns the cost of the run: wall time and rounds of the slowest
+    party, and mean per party of the CPU time, bytes, requests and poll retries.
+    """
+    participants = list(parties)
+    session_id = create_session("localhost", port, participants)
+    prot = ProtocolSpec(expr=expr, participant_ids=participants, session_id=session_id, opening=opening)
+    barrier = Barrier(len(participants))
+    queue: Queue = Queue()
+    processes = [
+        Process(target=benchmark_party, args=(name, port, prot, value_dict, barrier, queue))
+        for name, value_dict in parties.items()
+    ]
+    for process in processes:
+        process.start()
+    # read the results before joining, a process does not exit before its queue is flushed
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    cost = {metric: max(result[metric] for result in results) for metric in SLOWEST_PARTY_METRICS}
+    for metric in METRICS[len(SLOWEST_PARTY_METRICS):]:
+        cost[metric] = statistics.fmean(result[metric] for result in results)
+    return cost
+
+
+def run_experiment(
+        name: str,
+        values: Optional[List[int]] = None,
+        repeats: int = 10,
+        openings: Tuple[str, ...] = (DEFAULT_OPENING,)
+) -> List[Dict[str, object]]:
+    """
+    Runs an experiment of EXPERIMENTS repeats times for each of its values (default: the values of the experiment)
+    and each of the provided opening strategies. Returns one record per value and opening strategy, with the summary
+    of each metric.
+    """
+    build, default_values = EXPERIMENTS[name]
+    runs_by_value = [(value, *build(value)) for value in (default_values if values is None else values)]
+    # every party may have a request in flight on each connection of its pool
+    max_parties = max(len(parties) for _, parties, _ in runs_by_value)
+    workers = max(DEFAULT_WORKERS, DEFAULT_POOL_SIZE * max_parties)
+    port = free_port()
+    server = Process(target=run, args=("localhost", port, [], workers))
+    server.start()
+    try:
+        wait_until_ready("localhost", port)
+        records = []
+        for value, parties, expr in runs_by_value:
+            for opening in openings:
+                runs = [run_once(port, parties, expr, opening) for _ in range(repeats)]
+                record: Dict[str, object] = {
+                    "experiment": name,
+                    "value": value,
+                    "opening": opening,
+                    "parties": len(parties),
+                    "repeats": repeats,
+                }
+                for metric in METRICS:
+                    mean, low, high = confidence_interval([result[metric] for result in runs])
+                    record[metric] = {"mean": mean, "ci95_low": low, "ci95_high": high}
+                records.append(record)
+        return records
+    finally:
+        server.terminate()
+        server.join()
+
+
+def write_json(records: List[Dict[str, object]], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(records, f, indent=2)
+
+
+def write_csv(records: List[Dict[str, object]], path: str) -> None:
+    """ One row per record, with the mean and confidence interval of every metric in their own columns. """
+    fixed_columns = ["experiment", "value", "opening", "parties", "repeats"]
+    columns = fixed_columns + [f"{metric}_{key}" for metric in METRICS for key in ("mean", "ci95_low", "ci95_high")]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        for record in records:
+            row = {column: record[column] for column in fixed_columns}
+            for metric in METRICS:
+                for key, value in record[metric].items():  # type: ignore
+                    row[f"{metric}_{key}"] = value
+            writer.writerow(row)
+
+
+def main(args: Optional[List[str]] = None) -> List[Dict[str, object]]:
+    parser = argparse.ArgumentParser(description="Benchmarks of the cost of the protocol.")
+    parser.add_argument("--experiment", nargs="+", choices=list(EXPERIMENTS), default=list(EXPERIMENTS))
+    parser.add_argument("--values", nargs="+", type=int, help="values of the swept parameter (default: per experiment)")
+    parser.add_argument("--repeats", type=int, default=10, help="runs per value")
+    parser.add_argument("--opening", nargs="+", choices=OPENING_STRATEGIES, default=[DEFAULT_OPENING],
+                        help="opening strategies to compare")
+    parser.add_argument("--seed", type=int, help="seed of the secret and scalar values, the shares and the ids")
+    parser.add_argument("--json", help="path of the JSON output")
+    parser.add_argument("--csv", help="path of the CSV output")
+    options = parser.parse_args(args)
+
+    if options.seed is not None:
+        random.seed(options.seed)
+        randomness.seed(options.seed)
+    records = []
+    for name in options.experiment:
+        records += run_experiment(name, options.values, options.repeats, tuple(options.opening))
+    if options.json:
+        write_json(records, options.json)
+    if options.csv:
+        write_csv(records, options.csv)
+    if not options.json and not options.csv:
+        print(json.dumps(records, indent=2))
+    return records
+
+
+if __name__ == "__main__":
+    main()
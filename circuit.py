@@ -0,0 +1,293 @@
+"""
+Compiled form of an arithmetic expression.
+
+An expression is lowered into a flat list of instructions stored in arrays. Each instruction writes one register
+(its own index) and reads the registers of its operands, so a party evaluates the circuit with a single loop over
+the arrays instead of walking the expression objects.
+
+The instructions are ordered level by level: the multiplications of two secrets of a level come first, followed by
+the local instructions that depend on them, so that all the beaver constants of a level can be opened together.
+DataflowSchedule groups the multiplications by what they wait for instead, so that independent parts of the expression
+do not wait for each other.
+"""
+
+from __future__ import annotations
+
+import json
+from array import array
+from typing import Callable, Dict, FrozenSet, Hashable, List, Tuple
+
+from expression import (
+    Expression,
+    Secret,
+    Scalar,
+    SubOperation,
+    MultOperation,
+    is_operation,
+    multiplicative_depths
+)
+
+# Load the share of a secret, arg is the index in secret_ids.
+OP_SECRET = 0
+# Load a public constant, arg is the index in scalars.
+OP_SCALAR = 1
+# Add two operands that are both secret or both public.
+OP_ADD = 2
+# Add a public operand (right) to a secret one (left): only the leader adds it.
+OP_ADD_CONSTANT = 3
+# Multiply two operands, at least one of them public.
+OP_MULT = 4
+# Multiply two secret operands with a beaver triplet, arg is the index in op_ids.
+OP_BEAVER_MULT = 5
+# Subtract two operands that are both secret or both public.
+OP_SUB = 6
+# Subtract a public operand (right) from a secret one (left): only the leader subtracts it.
+OP_SUB_CONSTANT = 7
+# Subtract a secret operand (right) from a public one (left): only the leader adds the public operand.
+OP_CONSTANT_SUB = 8
+
+# Marks an unused operand.
+NO_OPERAND = -1
+
+
+class Circuit:
+    """
+    Flat, array-backed instruction list of an expression.
+
+    Attributes:
+        opcodes: kind of each instruction (one of the OP_* constants)
+        left: register of the left operand of each instruction, NO_OPERAND if unused
+        right: register of the right operand of each instruction, NO_OPERAND if unused
+        args: index in secret_ids, scalars or op_ids, depending on the kind of the instruction
+        lengths: vector length of the value of each instruction
+        secret_ids: ids of the secrets loaded by the circuit, each id once
+        scalars: values of the public constants
+        op_ids: ids of the multiplications of two secrets, in instruction order
+        level_bounds: for level d, the beaver multiplications are the instructions in
+            [level_bounds[2d], level_bounds[2d + 1]) and the local ones are in [level_bounds[2d + 1], level_bounds[2d + 2])
+        output: register holding the value of the expression
+    """
+
+    def __init__(
+            self,
+            opcodes: array,
+            left: array,
+            right: array,
+            args: array,
+            lengths: array,
+            secret_ids: List[bytes],
+            scalars: List[int],
+            op_ids: List[bytes],
+            level_bounds: array,
+            output: int
+    ):
+        self.opcodes = opcodes
+        self.left = left
+        self.right = right
+        self.args = args
+        self.lengths = lengths
+        self.secret_ids = secret_ids
+        self.scalars = scalars
+        self.op_ids = op_ids
+        self.level_bounds = level_bounds
+        self.output = output
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self)} instructions, {self.num_levels} levels)"
+
+    @property
+    def num_levels(self) -> int:
+        """ Number of levels, including level 0 which has no beaver multiplication. """
+        return (len(self.level_bounds) - 1) // 2
+
+    def level(self, level: int) -> Tuple[range, range]:
+        """ Returns the registers of the beaver multiplications and of the local instructions of a level. """
+        bounds = self.level_bounds
+        return range(bounds[2 * level], bounds[2 * level + 1]), range(bounds[2 * level + 1], bounds[2 * level + 2])
+
+    def op_lengths(self) -> List[int]:
+        """ Returns the vector length of each multiplication of two secrets, in the order of op_ids. """
+        return [self.lengths[i] for i in range(len(self)) if self.opcodes[i] == OP_BEAVER_MULT]
+
+    def serialize(self):
+        """Generate a representation suitable for caching or passing in a message."""
+        return json.dumps({
+            "opcodes": self.opcodes.tolist(),
+            "left": self.left.tolist(),
+            "right": self.right.tolist(),
+            "args": self.args.tolist(),
+            "lengths": self.lengths.tolist(),
+            "secret_ids": [secret_id.decode() for secret_id in self.secret_ids],
+            "scalars": self.scalars,
+            "op_ids": [op_id.decode() for op_id in self.op_ids],
+            "level_bounds": self.level_bounds.tolist(),
+            "output": self.output,
+        })
+
+    @staticmethod
+    def deserialize(serialized) -> Circuit:
+        """Restore object from its serialized representation."""
+        dict_obj = json.loads(serialized)
+        return Circuit(
+            array("B", dict_obj["opcodes"]),
+            array("l", dict_obj["left"]),
+            array("l", dict_obj["right"]),
+            array("l", dict_obj["args"]),
+            array("l", dict_obj["lengths"]),
+            [secret_id.encode() for secret_id in dict_obj["secret_ids"]],
+            dict_obj["scalars"],
+            [op_id.encode() for op_id in dict_obj["op_ids"]],
+            array("l", dict_obj["level_bounds"]),
+            dict_obj["output"],
+        )
+
+
+class DataflowSchedule:
+    """
+    Order in which the instructions of a circuit can be executed as soon as their operands are ready.
+
+    The multiplications of two secrets are grouped in batches whose beaver constants are opened together: the
+    multiplications with the same key (e.g. their leader) that wait for the same batches, so that all the
+    multiplications of a batch are ready at the same time. A local instruction waits for the batches its operands
+    wait for. Every party computes the same batches from the same circuit, so a batch can be identified by its index.
+
+    Attributes:
+        batches: registers of the multiplications of each batch, a batch only waits for batches with a lower index
+        dependencies: batches each batch waits for
+        ready: local registers that wait for no batch, in register order
+        groups: local registers that wait for the same batches, in register order
+        counts: number of batches each group waits for
+        releases: groups each batch is waited for by
+    """
+
+    def __init__(self, circuit: Circuit, key: Callable[[int], Hashable] = lambda register: None):
+        self.batches: List[List[int]] = []
+        self.dependencies: List[List[int]] = []
+        self.ready: List[int] = []
+        self.groups: List[List[int]] = []
+        self.counts: List[int] = []
+        self.releases: List[List[int]] = []
+
+        # batches each register waits for: its own batch for a multiplication of secrets
+        waits: List[FrozenSet[int]] = [frozenset()] * len(circuit)
+        batch_ids: Dict[Tuple[Hashable, FrozenSet[int]], int] = {}
+        group_ids: Dict[FrozenSet[int], int] = {}
+        opcodes, left, right = circuit.opcodes, circuit.left, circuit.right
+        for i in range(len(circuit)):
+            operands = waits[left[i]] | waits[right[i]] if left[i] != NO_OPERAND else waits[i]
+            if opcodes[i] == OP_BEAVER_MULT:
+                batch = batch_ids.setdefault((key(i), operands), len(self.batches))
+                if batch == len(self.batches):
+                    self.batches.append([])
+                    self.dependencies.append(sorted(operands))
+                    self.releases.append([])
+                self.batches[batch].append(i)
+                waits[i] = frozenset((batch,))
+            elif not operands:
+                self.ready.append(i)
+            else:
+                waits[i] = operands
+                group = group_ids.setdefault(operands, len(self.groups))
+                if group == len(self.groups):
+                    self.groups.append([])
+                    self.counts.append(len(operands))
+                    for batch in operands:
+                        self.releases[batch].append(group)
+                self.groups[group].append(i)
+
+    def __len__(self):
+        return len(self.batches)
+
+
+def compile_expression(expr: Expression) -> Circuit:
+    """
+    Lowers an expression into a circuit. A node shared by several parents (DAG) is compiled once.
+    """
+    # Walk the expression once to find the kind, the level and whether it holds a secret of every node.
+    nodes: List[Expression] = []
+    kinds: List[int] = []
+    node_levels: List[int] = []
+    # maps id() of a node to its position in nodes
+    positions: Dict[int, int] = {}
+    is_secret: List[bool] = []
+    for node, level, secret in multiplicative_depths(expr):
+        if is_operation(node):
+            left = positions[id(node.left)]
+            right = positions[id(node.right)]
+            if isinstance(node, MultOperation):
+                kind = OP_BEAVER_MULT if is_secret[left] and is_secret[right] else OP_MULT
+            elif isinstance(node, SubOperation):
+                if is_secret[left] == is_secret[right]:
+                    kind = OP_SUB
+                else:
+                    kind = OP_SUB_CONSTANT if is_secret[left] else OP_CONSTANT_SUB
+            else:
+                kind = OP_ADD_CONSTANT if is_secret[left] != is_secret[right] else OP_ADD
+        elif isinstance(node, Secret):
+            kind = OP_SECRET
+        elif isinstance(node, Scalar):
+            kind = OP_SCALAR
+        else:
+            raise ValueError("Unsupported expression type")
+        positions[id(node)] = len(nodes)
+        nodes.append(node)
+        kinds.append(kind)
+        node_levels.append(level)
+        is_secret.append(secret)
+
+    # Order the instructions level by level, the beaver multiplications of a level before its local instructions.
+    num_levels = max(node_levels) + 1
+    beaver_order: List[List[int]] = [[] for _ in range(num_levels)]
+    local_order: List[List[int]] = [[] for _ in range(num_levels)]
+    for position, (kind, level) in enumerate(zip(kinds, node_levels)):
+        (beaver_order if kind == OP_BEAVER_MULT else local_order)[level].append(position)
+    order: List[int] = []
+    level_bounds = array("l")
+    for level in range(num_levels):
+        level_bounds.append(len(order))
+        order.extend(beaver_order[level])
+        level_bounds.append(len(order))
+        order.extend(local_order[level])
+    level_bounds.append(len(order))
+
+    registers = [0] * len(nodes)
+    for register, position in enumerate(order):
+        registers[position] = register
+
+    opcodes = array("B")
+    left_operands = array("l")
+    right_operands = array("l")
+    args = array("l")
+    lengths = array("l")
+    secret_ids: Dict[bytes, int] = {}
+    scalars: List[int] = []
+    op_ids: List[bytes] = []
+    for position in order:
+        node = nodes[position]
+        kind = kinds[position]
+        left, right, arg = NO_OPERAND, NO_OPERAND, NO_OPERAND
+        if kind == OP_SECRET:
+            arg = secret_ids.setdefault(node.id, len(secret_ids))
+        elif kind == OP_SCALAR:
+            arg = len(scalars)
+            scalars.append(node.value)
+        else:
+            left = registers[positions[id(node.left)]]
+            right = registers[positions[id(node.right)]]
+            if kind == OP_ADD_CONSTANT and not is_secret[positions[id(node.left)]]:
+                # keep the secret operand on the left
+                left, right = right, left
+            if kind == OP_BEAVER_MULT:
+                arg = len(op_ids)
+                op_ids.append(node.id)
+        opcodes.append(kind)
+        left_operands.append(left)
+        right_operands.append(right)
+        args.append(arg)
+        lengths.append(node.length)
+
+    return Circuit(opcodes, left_operands, right_operands, args, lengths, list(secret_ids), scalars, op_ids,
+                   level_bounds, registers[positions[id(expr)]])
@@ -0,0 +1,169 @@
+"""
+Communication cost of a client: bytes sent and received, requests, rounds, poll retries and latencies, per protocol
+phase.
+
+The phase of a request is held in a context variable, see CommunicationMetrics.phase, so that requests made in
+worker threads by AsyncCommunication (asyncio.to_thread copies the context) are attributed to the right phase even
+when several phases are in flight at the same time.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import threading
+from timeit import default_timer as timer
+from typing import Dict, Iterator, List, Optional
+
+# Phase of the requests made outside of any phase.
+DEFAULT_PHASE = "other"
+
+# Upper bounds in seconds of the buckets of the latency histograms, the last bucket holds the slower requests.
+LATENCY_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0]
+
+_current_phase: contextvars.ContextVar[str] = contextvars.ContextVar("phase", default=DEFAULT_PHASE)
+
+
+class LatencyHistogram:
+    """
+    Histogram of request latencies, with fixed buckets (see LATENCY_BUCKETS).
+    """
+
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = LATENCY_BUCKETS if buckets is None else buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile (the maximum for the last bucket), 0 without observations.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets + ["inf"], self.counts)},
+        }
+
+
+class PhaseMetrics:
+    """
+    Communication cost of one phase.
+
+    Attributes:
+        requests: number of HTTP requests
+        rounds: number of waits for messages of other parties (one per retrieval, however many requests it takes)
+        bytes_sent: bytes of the requests on the wire (request lines, headers and bodies)
+        bytes_received: bytes of the responses on the wire (status lines, headers and bodies)
+        poll_retries: number of requests repeated because the messages were not ready yet
+        seconds: time spent in the phase
+        latency: histogram of the request latencies
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.rounds = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.poll_retries = 0
+        self.seconds = 0.0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "requests": self.requests,
+            "rounds": self.rounds,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "poll_retries": self.poll_retries,
+            "seconds": self.seconds,
+            "latency": self.latency.to_dict(),
+        }
+
+
+class CommunicationMetrics:
+    """
+    Thread-safe communication cost of a client, per phase.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases: Dict[str, PhaseMetrics] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Attributes the requests made in the block to the given phase, and adds the time spent in it.
+        """
+        token = _current_phase.set(name)
+        start = timer()
+        try:
+            yield
+        finally:
+            elapsed = timer() - start
+            _current_phase.reset(token)
+            with self.lock:
+                self._phase(name).seconds += elapsed
+
+    def record_request(self, bytes_sent: int, bytes_received: int, seconds: float) -> None:
+        with self.lock:
+            metrics = self._phase(_current_phase.get())
+            metrics.requests += 1
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+            metrics.latency.observe(seconds)
+
+    def record_round(self) -> None:
+        with self.lock:
+            self._phase(_current_phase.get()).rounds += 1
+
+    def record_poll_retry(self) -> None:
+        with self.lock:
+            self._phase(_current_phase.get()).poll_retries += 1
+
+    @property
+    def bytes_sent(self) -> int:
+        with self.lock:
+            return sum(metrics.bytes_sent for metrics in self.phases.values())
+
+    @property
+    def bytes_received(self) -> int:
+        with self.lock:
+            return sum(metrics.bytes_received for metrics in self.phases.values())
+
+    def report(self) -> Dict[str, Dict[str, object]]:
+        """
+        Breakdown of the communication cost per phase, in the order the phases started, and in total.
+        """
+        with self.lock:
+            report = {name: metrics.to_dict() for name, metrics in self.phases.items()}
+            report["total"] = {
+                key: sum(metrics[key] for metrics in report.values())  # type: ignore
+                for key in ("requests", "rounds", "bytes_sent", "bytes_received", "poll_retries")
+            }
+            return report
+
+    def _phase(self, name: str) -> PhaseMetrics:
+        if name not in self.phases:
+            self.phases[name] = PhaseMetrics()
+        return self.phases[name]
@@ -3,13 +3,67 @@ Utilities for client communication with the trusted server.
 You should not need to change this file.
 """
 
-import json
+import asyncio
+import base64
+import contextvars
+import functools
+import itertools
+import logging
+import threading
 import time
-from typing import Union, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar, Union, Tuple
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from comm_metrics import CommunicationMetrics
+from log_utils import get_logger, log_event
+from secret_sharing import Share, ShareVector
+from wire_format import DEFAULT_CODEC, SharesList, get_codec
+
+LOG = get_logger("communication")
+# The iterations of the poll loops are logged to their own logger, which is sampled, see log_utils.configure_logging.
+POLL_LOG = get_logger("communication.poll")
+
+# Default time in seconds a long-polling retrieval waits on the server before asking again.
+DEFAULT_LONG_POLL_TIMEOUT = 10.0
+# Default number of connections to the server used at the same time.
+DEFAULT_POOL_SIZE = 4
+# Default number of times a request is retried on connection errors.
+DEFAULT_MAX_RETRIES = 3
+# Default time in seconds to wait for the server to answer a request (on top of the long-polling timeout).
+DEFAULT_REQUEST_TIMEOUT = 30.0
+# Default number of worker threads of an AsyncCommunication, i.e. of its requests in flight at the same time.
+DEFAULT_ASYNC_WORKERS = 64
+# Maximum number of messages asked for in a single batch retrieval, to keep the URL reasonably short.
+MAX_BATCH_RETRIEVAL = 256
+
+T = TypeVar("T")
+
+
+def encode_payload(message: Union[bytes, str]) -> str:
+    """
+    Encode a message payload for the JSON body of a batch request.
+    """
+    if isinstance(message, str):
+        message = message.encode("utf-8")
+    return base64.b64encode(message).decode("ascii")
+
 
-from secret_sharing import Share
+def header_size(start_line: str, headers: Iterable[Tuple[str, str]]) -> int:
+    """
+    Number of bytes of the head of an HTTP/1.1 message: its start line and its headers, each ended by CRLF, and the
+    empty line before the body.
+    """
+    size = len(start_line.encode("latin-1")) + 4
+    for name, value in headers:
+        size += len(name.encode("latin-1")) + len(str(value).encode("latin-1")) + 4
+    return size
 
 
 def sanitize_url_param(url_param: Union[bytes, str]) -> str:
@@ -26,6 +80,56 @@ def sanitize_url_param(url_param: Union[bytes, str]) -> str:
     return url_param.replace("/", "_").replace("+", "-") # type: ignore
 
 
+def create_session(
+        server_host: str,
+        server_port: int,
+        participants: List[str],
+        session_id: Optional[str] = None,
+        protocol: str = "http",
+        timeout: float = DEFAULT_REQUEST_TIMEOUT
+    ) -> str:
+    """
+    Create a session for a new protocol run on the server, and return its id. Without a session id, the server
+    generates a random one.
+    """
+
+    url = f"{protocol}://{server_host}:{server_port}/sessions"
+    log_event(LOG, logging.DEBUG, "request", method="POST", url=url)
+    body = {"participants": participants}
+    if session_id is not None:
+        body["session_id"] = sanitize_url_param(session_id)
+    res = requests.post(url, json=body, timeout=timeout)
+    res.raise_for_status()
+    return res.json()["session_id"]
+
+
+class ConnectionCountingMixin:
+    """
+    Counts the TCP connections a urllib3 pool actually opens. Its num_connections only counts the connection objects
+    it creates, not their reconnections once the server closed them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_connects = 0
+        self.connects_lock = threading.Lock()
+
+    def _make_request(self, conn, *args, **kwargs):
+        # the connection object only opens a socket when it sends a request without one
+        if conn.sock is None:
+            with self.connects_lock:
+                self.num_connects += 1
+        return super()._make_request(conn, *args, **kwargs)
+
+
+class CountingHTTPConnectionPool(ConnectionCountingMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(ConnectionCountingMixin, HTTPSConnectionPool):
+    pass
+
+
 class Communication:
     """
     Network communications with the server.
@@ -36,6 +140,14 @@ class Communication:
         client_id: Identifier of this client
         poll_delay: delay between requests in seconds (default: 0.2 s)
         protocol: network protocol to use (default: "http")
+        long_poll_timeout: if set, retrievals block on the server for up to this many seconds instead of polling
+            every poll_delay seconds (default: None)
+        pool_size: number of connections to the server used at the same time (default: 4)
+        max_retries: number of times a request is retried on connection errors (default: 3)
+        timeout: time in seconds to wait for the server to answer a request (default: 30 s)
+        codec: wire format of the payloads generated by the server (default: json), see negotiate_codec
+        session_id: session of the protocol run on the server, see create_session (default: None, the default session)
+        metrics: communication cost of the client, per phase, see phase
     """
 
     def __init__(
@@ -44,11 +156,111 @@ class Communication:
             server_port: int,
             client_id: str,
             poll_delay: float = 0.2,
-            protocol: str = "http"
+            protocol: str = "http",
+            long_poll_timeout: Optional[float] = None,
+            pool_size: int = DEFAULT_POOL_SIZE,
+            max_retries: int = DEFAULT_MAX_RETRIES,
+            timeout: float = DEFAULT_REQUEST_TIMEOUT,
+            session_id: Optional[str] = None
     ):
         self.base_url = f"{protocol}://{server_host}:{server_port}"
+        if session_id is not None:
+            self.base_url += f"/session/{sanitize_url_param(session_id)}"
+        self.session_id = session_id
         self.client_id = client_id
         self.poll_delay = poll_delay
+        self.long_poll_timeout = long_poll_timeout
+        self.timeout = timeout
+        self.codec = get_codec(DEFAULT_CODEC)
+        self.metrics = CommunicationMetrics()
+
+        # Labels of the private messages received and not acknowledged yet. They are sent along the next private
+        # retrievals, so that the server frees them, see _wait_for_messages.
+        self.acks: Dict[str, None] = {}
+        self.acks_lock = threading.Lock()
+
+        # All requests go through one session, so that TCP connections to the server are reused when it keeps them
+        # open (werkzeug's server closes them after every response, see connection_stats).
+        # Connection errors are retried for every method, failed reads only for the idempotent ones (GET): reading a
+        # message does not remove it, the server only frees a private message once it is acknowledged.
+        retries = Retry(total=max_retries, backoff_factor=0.1)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        adapter.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+        self.session = requests.Session()
+        self.session.mount(f"{protocol}://", adapter)
+
+
+    def close(self) -> None:
+        """
+        Close the connections to the server.
+        """
+        self.session.close()
+
+
+    def phase(self, name: str):
+        """
+        Context manager attributing the requests made in its block to the given protocol phase, see metrics.
+        """
+        return self.metrics.phase(name)
+
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the keep-alive session and record its cost: bytes sent and received on the wire (request
+        line, status line, headers and bodies), and latency.
+        """
+        start = timer()
+        res = self.session.request(method, url, **kwargs)
+        elapsed = timer() - start
+        body = res.request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        request_headers = list(res.request.headers.items())
+        if "Host" not in res.request.headers:
+            # added by the HTTP connection when the request is sent
+            request_headers.append(("Host", urlsplit(res.request.url).netloc))
+        bytes_sent = header_size(f"{method} {res.request.path_url} HTTP/1.1", request_headers) + len(body)
+        bytes_received = header_size(f"HTTP/1.1 {res.status_code} {res.reason}", res.raw.headers.items())
+        self.metrics.record_request(bytes_sent, bytes_received + len(res.content), elapsed)
+        return res
+
+
+    def negotiate_codec(
+            self,
+            preferred: str
+        ):
+        """
+        Select the preferred wire format if the server supports it, and fall back to json otherwise.
+        Returns the selected codec.
+        """
+
+        url = f"{self.base_url}/codecs"
+        log_event(LOG, logging.DEBUG, "request", method="GET", url=url)
+        res = self._request("GET", url, timeout=self.timeout)
+        if res.status_code == 200 and preferred in res.json():
+            self.codec = get_codec(preferred)
+        else:
+            self.codec = get_codec(DEFAULT_CODEC)
+        return self.codec
+
+
+    def connection_stats(self) -> Dict[str, int]:
+        """
+        Statistics of the connections to the server: number of requests sent, number of TCP connections opened
+        (including the reconnections of a pooled connection the server closed), and number of requests that reused
+        an already open connection.
+        """
+        pools = self.session.get_adapter(self.base_url).poolmanager.pools
+        num_requests = sum(pools[key].num_requests for key in pools.keys())
+        num_connections = sum(pools[key].num_connects for key in pools.keys())
+        return {
+            "requests": num_requests,
+            "connections": num_connections,
+            "reused": num_requests - num_connections,
+        }
 
 
     def send_private_message(
@@ -66,8 +278,9 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/private/{client_id_san}/{receiver_id_san}/{label_san}"
-        print(f"POST {url}")
-        requests.post(url, message)
+        log_event(LOG, logging.DEBUG, "request", method="POST", url=url)
+        res = self._request("POST", url, data=message, timeout=self.timeout)
+        res.raise_for_status()
 
 
     def retrieve_private_message(
@@ -82,14 +295,9 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/private/{client_id_san}/{label_san}"
-        # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
-        while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
-            if res.status_code == 200:
-                return res.content
-            time.sleep(self.poll_delay)
+        message = self._wait_for_message(url, ack=True)
+        self._acknowledge([label_san])
+        return message
 
 
     def publish_message(
@@ -105,8 +313,9 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/public/{client_id_san}/{label_san}"
-        print(f"POST {url}")
-        requests.post(url, message)
+        log_event(LOG, logging.DEBUG, "request", method="POST", url=url)
+        res = self._request("POST", url, data=message, timeout=self.timeout)
+        res.raise_for_status()
 
 
     def retrieve_public_message(
@@ -123,15 +332,210 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/public/{client_id_san}/{sender_id_san}/{label_san}"
+        return self._wait_for_message(url)
 
-        # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
+
+    def send_private_messages(
+            self,
+            messages: List[Tuple[str, str, Union[bytes, str]]]
+        ) -> None:
+        """
+        Send many private messages to the server in a single request.
+        Each message is given as a (receiver_id, label, message) tuple.
+        """
+
+        if not messages:
+            return
+
+        client_id_san = sanitize_url_param(self.client_id)
+        body = [
+            {
+                "receiver": sanitize_url_param(receiver_id),
+                "label": sanitize_url_param(label),
+                "payload": encode_payload(message),
+            }
+            for receiver_id, label, message in messages
+        ]
+
+        url = f"{self.base_url}/batch/private/{client_id_san}"
+        log_event(LOG, logging.DEBUG, "request", method="POST", url=url)
+        res = self._request("POST", url, json=body, timeout=self.timeout)
+        res.raise_for_status()
+
+
+    def retrieve_private_messages(
+            self,
+            labels: List[str]
+        ) -> List[bytes]:
+        """
+        Retrieve many private messages from the server, in the order of the given labels.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+        channels = [(sanitize_url_param(label),) for label in labels]
+
+        url = f"{self.base_url}/batch/private/{client_id_san}"
+        messages = self._wait_for_messages(url, ("label",), channels, ack=True)
+        self._acknowledge([label for label, in channels])
+        return messages
+
+
+    def retrieve_public_messages(
+            self,
+            channels: List[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve many public messages from the server, in the order of the given (sender_id, label) pairs.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+        channels_san = [(sanitize_url_param(sender_id), sanitize_url_param(label)) for sender_id, label in channels]
+
+        url = f"{self.base_url}/batch/public/{client_id_san}"
+        return self._wait_for_messages(url, ("sender", "label"), channels_san)
+
+
+    def _wait_for_messages(
+            self,
+            url: str,
+            fields: Tuple[str, ...],
+            channels: List[Tuple[str, ...]],
+            ack: bool = False
+        ) -> List[bytes]:
+        """
+        Query the batch URL until the messages of all channels are available.
+        A channel is the tuple of values of the query parameters named by fields.
+        With ack, the requests also acknowledge the private messages received before, see _pending_acks.
+        """
+
+        self.metrics.record_round()
+        received: Dict[Tuple[str, ...], bytes] = {}
+        timeout = self.timeout
+        if self.long_poll_timeout is not None:
+            timeout += self.long_poll_timeout
+        first = True
         while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
+            pending = [channel for channel in dict.fromkeys(channels) if channel not in received]
+            if not pending:
+                return [received[channel] for channel in channels]
+            if not first:
+                self.metrics.record_poll_retry()
+            first = False
+            started = timer()
+            for start in range(0, len(pending), MAX_BATCH_RETRIEVAL):
+                params = [
+                    (field, value)
+                    for channel in pending[start:start + MAX_BATCH_RETRIEVAL]
+                    for field, value in zip(fields, channel)
+                ]
+                if self.long_poll_timeout is not None:
+                    params.append(("timeout", str(self.long_poll_timeout)))
+                acks = self._pending_acks() if ack else []
+                params.extend(("ack", label) for label in acks)
+                log_event(POLL_LOG, logging.DEBUG, "poll", url=url, pending=len(pending))
+                res = self._request("GET", url, params=params, timeout=timeout)
+                # e.g. an unknown session (404) or a server error, the acks may not have been processed
+                res.raise_for_status()
+                self._acknowledged(acks)
+                for entry in res.json():
+                    received[tuple(entry[field] for field in fields)] = base64.b64decode(entry["payload"])
+            if any(channel not in received for channel in pending) and self._poll_again_later(started):
+                time.sleep(self.poll_delay)
+
+
+    def _wait_for_message(
+            self,
+            url: str,
+            ack: bool = False
+        ) -> bytes:
+        """
+        Query the server until the message at the given URL is available.
+        With ack, the requests also acknowledge the private messages received before, see _pending_acks.
+        """
+
+        # We can either use a websocket, or do some polling. With long polling, the server holds the request until
+        # the message is stored, so we get it as soon as it is ready without sleeping. AsyncCommunication runs these
+        # blocking calls in worker threads, so that several retrievals can be in flight at the same time.
+        self.metrics.record_round()
+        params = []
+        timeout = self.timeout
+        if self.long_poll_timeout is not None:
+            params.append(("timeout", str(self.long_poll_timeout)))
+            timeout += self.long_poll_timeout
+        while True:
+            acks = self._pending_acks() if ack else []
+            log_event(POLL_LOG, logging.DEBUG, "poll", url=url)
+            started = timer()
+            res = self._request("GET", url, params=params + [("ack", label) for label in acks], timeout=timeout)
+            # 404 means the message is not ready yet, any other error fails the retrieval
+            if res.status_code != 404:
+                res.raise_for_status()
+            self._acknowledged(acks)
             if res.status_code == 200:
                 return res.content
-            time.sleep(self.poll_delay)
+            self.metrics.record_poll_retry()
+            if self._poll_again_later(started):
+                time.sleep(self.poll_delay)
+
+
+    def _acknowledge(
+            self,
+            labels: List[str]
+        ) -> None:
+        """
+        Queue the acknowledgements of the received private messages with the given (sanitized) labels.
+        """
+
+        with self.acks_lock:
+            self.acks.update(dict.fromkeys(labels))
+
+
+    def _pending_acks(self) -> List[str]:
+        """
+        Labels of the private messages to acknowledge with the next private retrieval. They stay queued until a
+        request carrying them got a response, see _acknowledged.
+        """
+
+        with self.acks_lock:
+            return list(itertools.islice(self.acks, MAX_BATCH_RETRIEVAL))
+
+
+    def _acknowledged(
+            self,
+            labels: List[str]
+        ) -> None:
+        """
+        Forget the acknowledgements the server received.
+        """
+
+        with self.acks_lock:
+            for label in labels:
+                self.acks.pop(label, None)
+
+
+    def _poll_again_later(
+            self,
+            started: float
+        ) -> bool:
+        """
+        Whether to wait poll_delay seconds before polling again, after a poll started at the given time did not get
+        all its messages: always without long polling, and when the server cut the long-polling requests short to
+        give their workers back to other clients.
+        """
+
+        return self.long_poll_timeout is None or timer() - started < self.long_poll_timeout
+
+
+    def finish(self) -> None:
+        """
+        Tell the server this client is done with the run, so that it can drop the messages of the run.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+
+        url = f"{self.base_url}/finish/{client_id_san}"
+        log_event(LOG, logging.DEBUG, "request", method="POST", url=url)
+        self._request("POST", url, timeout=self.timeout)
 
 
     def retrieve_beaver_triplet_shares(
@@ -146,7 +550,176 @@ class Communication:
         op_id_san = sanitize_url_param(op_id)
 
         url = f"{self.base_url}/shares/{client_id_san}/{op_id_san}"
-        print(f"GET  {url}")
+        log_event(LOG, logging.DEBUG, "request", method="GET", url=url)
+
+        res = self._request("GET", url, params={"codec": self.codec.name}, timeout=self.timeout)
+        return tuple(self.codec.decode(res.content, SharesList)) # type: ignore
+
+
+    def retrieve_all_beaver_triplet_shares(
+            self,
+            op_ids: List[str],
+            lengths: Optional[List[int]] = None
+        ) -> List[Tuple[Union[Share, ShareVector], ...]]:
+        """
+        Retrieve the triplets of shares of many operations generated by the trusted server, in a single request.
+        Operations on vectors of the provided lengths get triplets of ShareVector(s).
+        """
+
+        if not op_ids:
+            return []
+        if lengths is None:
+            lengths = [1] * len(op_ids)
+
+        client_id_san = sanitize_url_param(self.client_id)
+        op_ids_san = [sanitize_url_param(op_id) for op_id in op_ids]
+
+        url = f"{self.base_url}/shares/{client_id_san}"
+        log_event(LOG, logging.DEBUG, "request", method="POST", url=url)
+
+        body = {"op_ids": op_ids_san, "lengths": lengths}
+        res = self._request("POST", url, params={"codec": self.codec.name}, json=body, timeout=self.timeout)
+        values = [share.value for share in self.codec.decode(res.content, SharesList)]
+
+        triplets = []
+        offset = 0
+        for length in lengths:
+            triplet = []
+            for _ in range(3):
+                if length == 1:
+                    triplet.append(Share(values[offset]))
+                else:
+                    triplet.append(ShareVector(values[offset:offset + length]))
+                offset += length
+            triplets.append(tuple(triplet))
+        return triplets
+
+
+class AsyncCommunication:
+    """
+    Awaitable network communications with the server.
+    Every call runs the corresponding Communication method in a worker thread, over the connection pool of
+    the shared Communication session, so that a coroutine waiting for a slow peer does not block the others.
+    A retrieval holds its worker until the peer sends the message, so the workers are not shared with the default
+    executor of the event loop, which may have too few of them for all the openings in flight of a circuit.
+
+    Attributes:
+        comm: the Communication whose connections are used
+        executor: worker threads running the requests, started on demand
+    """
+
+    def __init__(self, comm: Communication, max_workers: int = DEFAULT_ASYNC_WORKERS):
+        self.comm = comm
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-comm")
+
+
+    async def _call(self, method: Callable[..., T], *args) -> T:
+        """
+        Run a Communication method in a worker thread. The context is copied, like asyncio.to_thread does, so that
+        the request is attributed to the phase of the calling coroutine.
+        """
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, method, *args))
+
+
+    @property
+    def codec(self):
+        """ Wire format of the payloads generated by the server, see Communication.negotiate_codec. """
+        return self.comm.codec
+
+
+    @property
+    def metrics(self):
+        """ Communication cost of the client, see Communication.metrics. """
+        return self.comm.metrics
+
+
+    def phase(self, name: str):
+        """
+        Context manager attributing the requests made in its block to the given protocol phase. The phase is held in
+        a context variable, so it only applies to the coroutine (or task) that enters it.
+        """
+        return self.comm.phase(name)
+
+
+    async def close(self) -> None:
+        """
+        Close the connections to the server.
+        """
+        await self._call(self.comm.close)
+        self.executor.shutdown(wait=False)
+
+
+    async def negotiate_codec(self, preferred: str):
+        """
+        Select the preferred wire format if the server supports it, and fall back to json otherwise.
+        """
+        return await self._call(self.comm.negotiate_codec, preferred)
+
 
-        res = requests.get(url)
-        return tuple([Share.deserialize(s) for s in json.loads(res.text)]) # type: ignore
+    async def send_private_message(self, receiver_id: str, label: str, message: Union[bytes, str]) -> None:
+        """
+        Send a private message to the server.
+        """
+        await self._call(self.comm.send_private_message, receiver_id, label, message)
+
+
+    async def retrieve_private_message(self, label: str) -> bytes:
+        """
+        Retrieve a private message from the server.
+        """
+        return await self._call(self.comm.retrieve_private_message, label)
+
+
+    async def publish_message(self, label: str, message: Union[bytes, str]) -> None:
+        """
+        Publish a message on the server.
+        """
+        await self._call(self.comm.publish_message, label, message)
+
+
+    async def retrieve_public_message(self, sender_id: str, label: str) -> bytes:
+        """
+        Retrieve a public message from the server.
+        """
+        return await self._call(self.comm.retrieve_public_message, sender_id, label)
+
+
+    async def send_private_messages(self, messages: List[Tuple[str, str, Union[bytes, str]]]) -> None:
+        """
+        Send many private messages to the server in a single request.
+        """
+        await self._call(self.comm.send_private_messages, messages)
+
+
+    async def retrieve_private_messages(self, labels: List[str]) -> List[bytes]:
+        """
+        Retrieve many private messages from the server, in the order of the given labels.
+        """
+        return await self._call(self.comm.retrieve_private_messages, labels)
+
+
+    async def retrieve_public_messages(self, channels: List[Tuple[str, str]]) -> List[bytes]:
+        """
+        Retrieve many public messages from the server, in the order of the given (sender_id, label) pairs.
+        """
+        return await self._call(self.comm.retrieve_public_messages, channels)
+
+
+    async def finish(self) -> None:
+        """
+        Tell the server this client is done with the run.
+        """
+        await self._call(self.comm.finish)
+
+
+    async def retrieve_all_beaver_triplet_shares(
+            self,
+            op_ids: List[str],
+            lengths: Optional[List[int]] = None
+        ) -> List[Tuple[Union[Share, ShareVector], ...]]:
+        """
+        Retrieve the triplets of shares of many operations generated by the trusted server, in a single request.
+        """
+        return await self._call(self.comm.retrieve_all_beaver_triplet_shares, op_ids, lengths)
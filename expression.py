@@ -10,24 +10,39 @@ MODIFY THIS FILE.
 """
 
 import base64
-import random
-from typing import Optional, List
+import hashlib
+from typing import Container, Dict, Iterator, Optional, List, Set, Tuple, Union
 
-ID_BYTES = 4
+from randomness import random_bytes
+
+# Random ids must not collide within an expression: with 96 bits, an expression of a million nodes has a collision
+# probability below 1e-17.
+ID_BYTES = 12
 
 
 def gen_id() -> bytes:
-    id_bytes = bytearray(
-        random.getrandbits(8) for _ in range(ID_BYTES)
-    )
-    return base64.b64encode(id_bytes)
+    return base64.b64encode(random_bytes(ID_BYTES))
+
+
+def derive_id(parent_id: bytes, index: Union[int, str]) -> bytes:
+    """
+    Returns an id derived from the id of an existing node and an index (or name) of the derived node, for nodes
+    synthesized by a rewrite. Unlike gen_id, it is the same for all parties that rewrite the same expression.
+    """
+    digest = hashlib.sha256(parent_id + b"/" + str(index).encode()).digest()
+    return base64.b64encode(digest[:ID_BYTES])
 
 
 class Expression:
     """
     Base class for an arithmetic expression.
+
+    Attributes:
+        length: number of elements of the value of the expression (1 unless it involves a SecretVector)
     """
 
+    length = 1
+
     def __init__(
             self,
             id: Optional[bytes] = None
@@ -41,7 +56,7 @@ class Expression:
         return AddOperation(left=self, right=other)
 
     def __sub__(self, other):
-        return AddOperation(left=self, right=MultOperation(left=other, right=Scalar(-1)))
+        return SubOperation(left=self, right=other)
 
     def __mul__(self, other):
         return MultOperation(left=self, right=other)
@@ -66,8 +81,14 @@ class Scalar(Expression):
     def __repr__(self):
         return f"{self.__class__.__name__}({repr(self.value)})"
 
+    def __eq__(self, other):
+        # scalars of the same value are interchangeable, consistently with __hash__
+        if not isinstance(other, Scalar):
+            return NotImplemented
+        return self.value == other.value
+
     def __hash__(self):
-        return
+        return hash(self.value)
 
     # Feel free to add as many methods as you like.
 
@@ -91,6 +112,36 @@ class Secret(Expression):
     # Feel free to add as many methods as you like.
 
 
+class SecretVector(Secret):
+    """
+    Term representing a vector of secret finite field values. The length is public, so that all parties know it.
+    Operations with vectors are applied element-wise, and operands of length 1 are broadcast to every element.
+    """
+
+    def __init__(
+            self,
+            length: int,
+            value: Optional[List[int]] = None,
+            id: Optional[bytes] = None
+    ):
+        if value is not None and len(value) != length:
+            raise ValueError(f"Expected {length} values, got {len(value)}")
+        self.length = length
+        super().__init__(value, id)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.length}{', ' + repr(self.value) if self.value is not None else ''})"
+        )
+
+
+def broadcast_length(left: Expression, right: Expression) -> int:
+    """ Returns the length of the result of an element-wise operation on the provided expressions. """
+    if left.length != right.length and left.length != 1 and right.length != 1:
+        raise ValueError(f"Cannot combine expressions of lengths {left.length} and {right.length}")
+    return max(left.length, right.length)
+
+
 # Feel free to add as many classes as you like.
 class AddOperation(Expression):
     """ Represents an addition operation of two other expressions. """
@@ -98,37 +149,119 @@ class AddOperation(Expression):
     def __init__(self, left: Expression, right: Expression, id: Optional[bytes] = None):
         self.left = left
         self.right = right
+        self.length = broadcast_length(left, right)
         super().__init__(id)
 
     def __repr__(self):
         return f"({repr(self.left)} + {repr(self.right)})"
 
 
+class SubOperation(Expression):
+    """ Represents a subtraction operation of two other expressions. """
+
+    def __init__(self, left: Expression, right: Expression, id: Optional[bytes] = None):
+        self.left = left
+        self.right = right
+        self.length = broadcast_length(left, right)
+        super().__init__(id)
+
+    def __repr__(self):
+        return f"({repr(self.left)} - {repr(self.right)})"
+
+
 class MultOperation(Expression):
     """ Represents a multiplication operation of two other expressions. """
 
     def __init__(self, left: Expression, right: Expression, id: Optional[bytes] = None):
         self.left = left
         self.right = right
+        self.length = broadcast_length(left, right)
         super().__init__(id)
 
     def __repr__(self):
         return f"{repr(self.left)} * {repr(self.right)}"
 
 
+def is_operation(expr: Expression) -> bool:
+    """ Is the expression an operation on two other expressions. """
+    return isinstance(expr, AddOperation) or isinstance(expr, SubOperation) or isinstance(expr, MultOperation)
+
+
+def postorder(expr: Expression, skip: Container[int] = ()) -> Iterator[Expression]:
+    """
+    Iterates over the distinct nodes of the provided expression, children before their parents and left before right.
+    Uses an explicit stack instead of recursion, so arbitrarily deep expressions are supported. A node shared by
+    several parents (DAG) is yielded once. Nodes whose id() is in skip are neither yielded nor descended into.
+    """
+    visited: Set[int] = set()
+    # pairs of (node, whether its children have already been pushed)
+    stack: List[Tuple[Expression, bool]] = [(expr, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            yield node
+            continue
+        if id(node) in visited or id(node) in skip:
+            continue
+        visited.add(id(node))
+        stack.append((node, True))
+        if is_operation(node):
+            stack.append((node.right, False))
+            stack.append((node.left, False))
+
+
 def count_num_secrets(expr: Expression) -> int:
     """ Returns the total number of secrets the provided expression. """
-    if isinstance(expr, AddOperation) or isinstance(expr, MultOperation):
-        return count_num_secrets(expr.left) + count_num_secrets(expr.right)
-    if isinstance(expr, Secret):
-        return 1
-    return 0
+    # maps id() of a visited node to the number of secrets in its subtree (shared subtrees count once per parent)
+    counts: Dict[int, int] = {}
+    for node in postorder(expr):
+        if is_operation(node):
+            counts[id(node)] = counts[id(node.left)] + counts[id(node.right)]
+        else:
+            counts[id(node)] = 1 if isinstance(node, Secret) else 0
+    return counts[id(expr)]
 
 
 def collect_secret_ids(expr: Expression) -> List[bytes]:
-    """ Returns list of ids of all secrets in the provided expression. """
-    if isinstance(expr, AddOperation) or isinstance(expr, MultOperation):
-        return collect_secret_ids(expr.left) + collect_secret_ids(expr.right)
-    if isinstance(expr, Secret):
-        return [expr.id]
-    return []
+    """ Returns list of ids of all secrets in the provided expression, each id once, in left-to-right order. """
+    secret_ids = dict.fromkeys(node.id for node in postorder(expr) if isinstance(node, Secret))
+    return list(secret_ids)
+
+
+def multiplicative_depths(expr: Expression) -> Iterator[Tuple[Expression, int, bool]]:
+    """
+    Iterates over the distinct nodes of the provided expression like postorder, with the multiplicative depth of each
+    node (the number of multiplications of two secret operands on its deepest path) and whether it holds a secret.
+    """
+    # maps id() of a visited node to its (multiplicative depth, contains secret) pair
+    visited: Dict[int, Tuple[int, bool]] = {}
+    for node in postorder(expr):
+        if is_operation(node):
+            left_depth, left_secret = visited[id(node.left)]
+            right_depth, right_secret = visited[id(node.right)]
+            depth = max(left_depth, right_depth)
+            if isinstance(node, MultOperation) and left_secret and right_secret:
+                depth += 1
+            visited[id(node)] = (depth, left_secret or right_secret)
+        else:
+            visited[id(node)] = (0, isinstance(node, Secret))
+        yield (node, *visited[id(node)])
+
+
+def multiplication_levels(expr: Expression) -> List[List[MultOperation]]:
+    """
+    Groups the multiplications of two secret operands (the ones that need a Beaver triplet) by multiplicative depth.
+    All multiplications of a level only depend on multiplications of lower levels, so they can be opened together.
+    A multiplication node that appears several times in the expression is listed only once.
+    """
+    levels: List[List[MultOperation]] = []
+    # maps id() of a visited node to its multiplicative depth
+    depths: Dict[int, int] = {}
+    for node, depth, _ in multiplicative_depths(expr):
+        depths[id(node)] = depth
+        # only a multiplication of two secret operands is deeper than both of its operands
+        if isinstance(node, MultOperation) and depth > max(depths[id(node.left)], depths[id(node.right)]):
+            if len(levels) < depth:
+                levels.append([])
+            levels[depth - 1].append(node)
+    return levels
@@ -3,6 +3,8 @@ import json
 
 def simple_json_encoder(obj):
     """ Returns dict representation of the provided object. """
+    if hasattr(obj, "__slots__"):
+        return {name: getattr(obj, name) for name in obj.__slots__}
     return obj.__dict__
 
 
@@ -0,0 +1,107 @@
+"""
+Logging shared by the server, the communication with it and the parties.
+
+Every module logs structured events (an event name and key=value fields) to a child of the "smc" logger. Nothing is
+printed unless logging is configured, see configure_logging, and a disabled level only costs an isEnabledFor check.
+The level can be set with the SMC_LOG_LEVEL environment variable.
+"""
+
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Any, Optional, TextIO
+
+ROOT_LOGGER_NAME = "smc"
+# Environment variable holding the level of configure_logging, e.g. DEBUG or INFO.
+LOG_LEVEL_ENV = "SMC_LOG_LEVEL"
+DEFAULT_LOG_LEVEL = "WARNING"
+# By default, one poll iteration out of this many is logged.
+DEFAULT_POLL_SAMPLE_RATE = 50
+
+logging.getLogger(ROOT_LOGGER_NAME).addHandler(logging.NullHandler())
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns the logger of a module, e.g. get_logger("server").
+    """
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def log_event(logger: logging.Logger, level: int, event: str, /, **fields: Any) -> None:
+    """
+    Logs an event with its fields, if the level is enabled.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats a record as "time level logger event key=value ...".
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets one record out of rate through, e.g. for the iterations of a poll loop. Records of level WARNING and above
+    always go through.
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self.counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or next(self.counter) % self.rate == 0
+
+
+def configure_logging(
+        level: Optional[str] = None,
+        asynchronous: bool = False,
+        stream: TextIO = sys.stderr,
+        poll_sample_rate: int = DEFAULT_POLL_SAMPLE_RATE
+) -> Optional[logging.handlers.QueueListener]:
+    """
+    Logs the events of the "smc" loggers to a stream, at the provided level (default: SMC_LOG_LEVEL, or WARNING).
+    The poll loops are sampled, and werkzeug's line per request is turned off below WARNING.
+    When asynchronous, records are formatted and written by a background thread, so that logging never blocks a
+    request. Returns the listener of that thread, which should be stopped before exiting, None otherwise.
+    """
+    level = (level or os.environ.get(LOG_LEVEL_ENV) or DEFAULT_LOG_LEVEL).upper()
+    logger = logging.getLogger(ROOT_LOGGER_NAME)
+    logger.setLevel(level)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    poll_logger = get_logger("communication.poll")
+    for old_filter in list(poll_logger.filters):
+        if isinstance(old_filter, SamplingFilter):
+            poll_logger.removeFilter(old_filter)
+    poll_logger.addFilter(SamplingFilter(poll_sample_rate))
+
+    for old_handler in [handler for handler in logger.handlers if not isinstance(handler, logging.NullHandler)]:
+        logger.removeHandler(old_handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(StructuredFormatter())
+    if not asynchronous:
+        logger.addHandler(handler)
+        return None
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
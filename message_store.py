@@ -0,0 +1,178 @@
+"""
+Bounded message store of the trusted server.
+
+Messages are kept in namespaces (one per protocol run), each made of pools ("private", "public") of channels. Reading
+a message does not remove it: a private message is removed once its receiver acknowledges it, and a whole namespace
+is dropped once its run is over, or once it has been inactive for a time to live. Writes that would take the store
+over its size limit are rejected, the unread messages of the active runs are never evicted.
+"""
+
+import collections
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Default time in seconds a namespace is kept without being written or read.
+DEFAULT_TTL = 600.0
+# Default maximum number of bytes of message data kept in the store.
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Namespace of the messages that are not part of a session.
+DEFAULT_NAMESPACE = ""
+
+Channel = Tuple[str, ...]
+# (namespace, pool, channel)
+Key = Tuple[str, str, Channel]
+
+
+class StoreFullError(RuntimeError):
+    """
+    Raised when a write would take the store over its size limit.
+    """
+
+
+class MessageStore:
+    """
+    Thread-safe store of the messages exchanged through the server.
+
+    Attributes:
+        ttl: time in seconds a namespace is kept without being written or read (None: forever)
+        max_bytes: maximum number of bytes of message data kept, writes over the limit are rejected (None: no limit)
+    """
+
+    def __init__(self, ttl: Optional[float] = DEFAULT_TTL, max_bytes: Optional[int] = DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Notified whenever a value is stored, so that long-polling retrievals can return as soon as it is ready.
+        self.condition = threading.Condition()
+        self.messages: Dict[Key, bytes] = {}
+        # namespaces with the time they were last written or read, least recently active first
+        self.activity: "collections.OrderedDict[str, float]" = collections.OrderedDict()
+        self.num_bytes = 0
+        self.num_expired = 0
+        self.num_rejected = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def set_values(self, namespace: str, pool: str, items: List[Tuple[Channel, bytes]]) -> None:
+        """
+        Push data to many channels in a given pool and send a single event.
+        Raises StoreFullError, without storing anything, if the store would hold more than max_bytes.
+        """
+        with self.condition:
+            now = time.monotonic()
+            self._expire(now)
+            if self.max_bytes is not None:
+                new_bytes = self.num_bytes
+                for channel, data in dict(items).items():
+                    old = self.messages.get((namespace, pool, channel))
+                    new_bytes += len(data) - (len(old) if old is not None else 0)
+                if new_bytes > self.max_bytes:
+                    self.num_rejected += 1
+                    raise StoreFullError(f"Storing {len(items)} messages would exceed {self.max_bytes} bytes")
+            for channel, data in items:
+                key = (namespace, pool, channel)
+                self._remove(key)
+                self.messages[key] = data
+                self.num_bytes += len(data)
+            self._touch(namespace, now)
+            self.condition.notify_all()
+
+    def get_values(
+            self,
+            namespace: str,
+            pool: str,
+            channels: List[Channel],
+            timeout: Optional[float] = None,
+            interrupted: Optional[Callable[[], bool]] = None
+    ) -> List[Optional[bytes]]:
+        """
+        Subscribe to many channels in a given pool and get them once all are ready.
+        Without a timeout, returns right away, otherwise waits at most timeout seconds. Missing values are None.
+        The wait also ends when interrupted returns True, it is checked whenever the waiters are woken up, see
+        wake_waiters.
+        """
+        keys = [(namespace, pool, channel) for channel in channels]
+        with self.condition:
+            if timeout is not None:
+                self.condition.wait_for(
+                    lambda: (interrupted is not None and interrupted()) or all(key in self.messages for key in keys),
+                    timeout
+                )
+            now = time.monotonic()
+            self._expire(now)
+            self._touch(namespace, now)
+            return [self.messages.get(key) for key in keys]
+
+    def remove_values(self, namespace: str, pool: str, channels: List[Channel]) -> int:
+        """
+        Remove the messages of many channels in a given pool, e.g. once their receiver acknowledged them.
+        Returns the number of messages removed.
+        """
+        with self.condition:
+            num_messages = len(self.messages)
+            for channel in channels:
+                self._remove((namespace, pool, channel))
+            return num_messages - len(self.messages)
+
+    def wake_waiters(self) -> None:
+        """
+        Wake up the long-polling retrievals, so that they check whether they are interrupted.
+        """
+        with self.condition:
+            self.condition.notify_all()
+
+    def drop_namespace(self, namespace: str) -> int:
+        """
+        Remove all the messages of a namespace. Returns the number of messages removed.
+        """
+        with self.condition:
+            self.activity.pop(namespace, None)
+            keys = [key for key in self.messages if key[0] == namespace]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Memory usage of the store: number of messages and bytes, per pool and per namespace, number of messages
+        expired with their inactive namespace, and number of writes rejected because of the size limit.
+        """
+        with self.condition:
+            pools: Dict[str, Dict[str, int]] = collections.defaultdict(lambda: {"messages": 0, "bytes": 0})
+            namespaces: Dict[str, int] = collections.defaultdict(int)
+            for (namespace, pool, _), data in self.messages.items():
+                pools[pool]["messages"] += 1
+                pools[pool]["bytes"] += len(data)
+                namespaces[namespace] += 1
+            return {
+                "messages": len(self.messages),
+                "bytes": self.num_bytes,
+                "pools": dict(pools),
+                "namespaces": dict(namespaces),
+                "expired": self.num_expired,
+                "rejected": self.num_rejected,
+            }
+
+    def _remove(self, key: Key) -> None:
+        data = self.messages.pop(key, None)
+        if data is not None:
+            self.num_bytes -= len(data)
+
+    def _touch(self, namespace: str, now: float) -> None:
+        self.activity[namespace] = now
+        self.activity.move_to_end(namespace)
+
+    def _expire(self, now: float) -> None:
+        """
+        Drop the namespaces that have not been written or read for ttl seconds.
+        The namespaces are ordered by their last activity, so only the least recently active ones need to be looked at.
+        """
+        if self.ttl is None:
+            return
+        while self.activity:
+            namespace, active_at = next(iter(self.activity.items()))
+            if now - active_at < self.ttl:
+                break
+            self.num_expired += self.drop_namespace(namespace)
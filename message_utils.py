@@ -4,9 +4,10 @@ Communication-related helper models and methods.
 from __future__ import annotations
 
 import json
+from typing import List, Union
 
 from json_utils import json_serialize
-from secret_sharing import Share
+from secret_sharing import Share, ShareVector, share_from_dict
 
 SECRET_SHARE_LABEL = "Secret_Share_"
 RESULT_SHARE_LABEL = "Result_Share_"
@@ -16,9 +17,9 @@ BEAVER_CONST_RESULT_LABEL = "Beaver_Const_Result_"
 
 
 class Message:
-    """ Message class for exchanging an int value. """
+    """ Message class for exchanging an int value (or a list of int values). """
 
-    def __init__(self, value: int):
+    def __init__(self, value: Union[int, List[int]]):
         self.value = value
 
     def serialize(self):
@@ -37,7 +38,7 @@ class Message:
 class ShareMessage:
     """ Message class for exchanging a share of a secret. """
 
-    def __init__(self, id: bytes, value_share: Share):
+    def __init__(self, id: bytes, value_share: Union[Share, ShareVector]):
         self.id = id.decode()
         self.share = value_share
 
@@ -51,18 +52,18 @@ class ShareMessage:
     def deserialize(serialized) -> ShareMessage:
         """Restore object from its serialized representation."""
         dict_obj = json.loads(serialized)
-        share_obj = Share(dict_obj['share']['value'])
+        share_obj = share_from_dict(dict_obj['share'])
         return ShareMessage(dict_obj['id'].encode(), share_obj)
 
 
 class ResultShareMessage:
     """ Message class for exchanging a share of a result. """
 
-    def __init__(self, result_share: Share):
+    def __init__(self, result_share: Union[Share, ShareVector]):
         self.share = result_share
 
     def __repr__(self):
-        return f"{self.__class__.__name__}({repr(self.share.value)})"
+        return f"{self.__class__.__name__}({repr(self.share)})"
 
     def serialize(self):
         return json_serialize(self)
@@ -71,7 +72,7 @@ class ResultShareMessage:
     def deserialize(serialized) -> ResultShareMessage:
         """Restore object from its serialized representation."""
         dict_obj = json.loads(serialized)
-        share_obj = Share(dict_obj['share']['value'])
+        share_obj = share_from_dict(dict_obj['share'])
         return ResultShareMessage(share_obj)
 
 
@@ -115,3 +116,45 @@ class BeaverConstResultMessage:
         """Restore object from its serialized representation."""
         dict_obj = json.loads(serialized)
         return BeaverConstResultMessage(dict_obj['x_part'], dict_obj['y_part'])
+
+
+class BeaverConstSharesMessage:
+    """ Message class for exchanging the shares of beaver constants of all multiplications of one level. """
+
+    def __init__(self, x_parts: List[Share], y_parts: List[Share]):
+        self.x_parts = x_parts
+        self.y_parts = y_parts
+
+    def serialize(self):
+        return json_serialize(self)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.x_parts)})"
+
+    @staticmethod
+    def deserialize(serialized) -> BeaverConstSharesMessage:
+        """Restore object from its serialized representation."""
+        dict_obj = json.loads(serialized)
+        shares_x = [Share(x_part['value']) for x_part in dict_obj['x_parts']]
+        shares_y = [Share(y_part['value']) for y_part in dict_obj['y_parts']]
+        return BeaverConstSharesMessage(shares_x, shares_y)
+
+
+class BeaverConstResultsMessage:
+    """ Message class for exchanging the beaver constants of all multiplications of one level. """
+
+    def __init__(self, x_parts: List[int], y_parts: List[int]):
+        self.x_parts = x_parts
+        self.y_parts = y_parts
+
+    def serialize(self):
+        return json_serialize(self)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.x_parts)})"
+
+    @staticmethod
+    def deserialize(serialized) -> BeaverConstResultsMessage:
+        """Restore object from its serialized representation."""
+        dict_obj = json.loads(serialized)
+        return BeaverConstResultsMessage(dict_obj['x_parts'], dict_obj['y_parts'])
@@ -0,0 +1,240 @@
+"""
+Optimization passes applied to an expression before it is compiled.
+
+The passes only rewrite the expression, the parties still evaluate it with the same protocol. Every party runs them
+on the same expression, so they must be deterministic: a rewritten node keeps the id of the node it replaces, so that
+the ids of the multiplications of two secrets (and the beaver triplets of the server) are the same for all parties.
+"""
+
+import heapq
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from expression import (
+    Expression,
+    Secret,
+    Scalar,
+    AddOperation,
+    SubOperation,
+    MultOperation,
+    derive_id,
+    is_operation,
+    postorder
+)
+from secret_sharing import FIELD_MODULUS
+
+
+def _scalar_value(expr: Expression) -> Optional[int]:
+    """ Returns the value of a scalar reduced in the field, None if the expression is not a scalar. """
+    if isinstance(expr, Scalar):
+        return expr.value % FIELD_MODULUS
+    return None
+
+
+def _split_scalar_factor(expr: Expression):
+    """ Returns the (operand, scalar value) pair of a multiplication by a scalar, None if it is not one. """
+    if not isinstance(expr, MultOperation):
+        return None
+    right = _scalar_value(expr.right)
+    if right is not None:
+        return expr.left, right
+    left = _scalar_value(expr.left)
+    if left is not None:
+        return expr.right, left
+    return None
+
+
+def _simplify_node(node: Expression, left: Expression, right: Expression) -> Expression:
+    """ Rewrites an operation whose operands are already simplified. """
+    left_value = _scalar_value(left)
+    right_value = _scalar_value(right)
+
+    if isinstance(node, AddOperation):
+        if left_value is not None and right_value is not None:
+            return Scalar((left_value + right_value) % FIELD_MODULUS, id=node.id)
+        if right_value == 0:
+            return left
+        if left_value == 0:
+            return right
+        # x + y * -1 is x - y
+        negated = _split_scalar_factor(right)
+        if negated is not None and negated[1] == FIELD_MODULUS - 1:
+            return SubOperation(left, negated[0], id=node.id)
+        negated = _split_scalar_factor(left)
+        if negated is not None and negated[1] == FIELD_MODULUS - 1:
+            return SubOperation(right, negated[0], id=node.id)
+
+    elif isinstance(node, SubOperation):
+        if left_value is not None and right_value is not None:
+            return Scalar((left_value - right_value) % FIELD_MODULUS, id=node.id)
+        if right_value == 0:
+            return left
+
+    elif isinstance(node, MultOperation):
+        if left_value is not None and right_value is not None:
+            return Scalar(left_value * right_value % FIELD_MODULUS, id=node.id)
+        factor = right_value if right_value is not None else left_value
+        operand = left if right_value is not None else right
+        if factor == 1:
+            return operand
+        # a vector times 0 is still a vector, so only a single value collapses to a scalar
+        if factor == 0 and operand.length == 1:
+            return Scalar(0, id=node.id)
+        # (x * K1) * K2 is x * (K1 * K2)
+        inner = _split_scalar_factor(operand) if factor is not None else None
+        if inner is not None:
+            product = inner[1] * factor % FIELD_MODULUS
+            if product == 1:
+                return inner[0]
+            # the folded scalar is a new node, it must not share the id of the multiplication
+            return MultOperation(inner[0], Scalar(product, id=derive_id(node.id, "scalar")), id=node.id)
+
+    if left is node.left and right is node.right:
+        return node
+    return node.__class__(left, right, id=node.id)
+
+
+def simplify(expr: Expression) -> Expression:
+    """
+    Folds the operations on scalars only, removes additions of 0 and multiplications by 1, collapses chains of
+    multiplications by scalars and turns additions of a negated operand into subtractions.
+    Unchanged subtrees are shared with the provided expression, which is not modified.
+    """
+    # maps id() of a node of the provided expression to its simplified node
+    simplified: Dict[int, Expression] = {}
+    for node in postorder(expr):
+        if is_operation(node):
+            simplified[id(node)] = _simplify_node(node, simplified[id(node.left)], simplified[id(node.right)])
+        else:
+            simplified[id(node)] = node
+    return simplified[id(expr)]
+
+
+def eliminate_common_subexpressions(expr: Expression) -> Expression:
+    """
+    Merges the structurally equal subtrees of the provided expression, so that the result is a DAG in which every
+    distinct computation appears once and is evaluated once. Two nodes are equal if they are the same secret, scalars
+    of the same value or the same operation on equal operands, in any order for additions and multiplications.
+    The merged node is the first one in left-to-right order, so that all parties keep the same operation ids.
+    """
+    # maps the structural key of a node to the number of its canonical node
+    numbers: Dict[Hashable, int] = {}
+    canonical_nodes: List[Expression] = []
+    # maps id() of a node of the provided expression to the number of its canonical node
+    canonical: Dict[int, int] = {}
+    for node in postorder(expr):
+        if is_operation(node):
+            left, right = canonical[id(node.left)], canonical[id(node.right)]
+            if isinstance(node, SubOperation):
+                key = (SubOperation, left, right)
+            else:
+                key = (node.__class__, min(left, right), max(left, right))
+        elif isinstance(node, Secret):
+            key = (Secret, node.id)
+        elif isinstance(node, Scalar):
+            key = (Scalar, node.value % FIELD_MODULUS)
+        else:
+            raise ValueError("Unsupported expression type")
+
+        if key not in numbers:
+            merged = node
+            if is_operation(node):
+                left_node, right_node = canonical_nodes[left], canonical_nodes[right]
+                if left_node is not node.left or right_node is not node.right:
+                    merged = node.__class__(left_node, right_node, id=node.id)
+            numbers[key] = len(canonical_nodes)
+            canonical_nodes.append(merged)
+        canonical[id(node)] = numbers[key]
+    return canonical_nodes[canonical[id(expr)]]
+
+
+def _is_associative(node: Expression) -> bool:
+    return isinstance(node, AddOperation) or isinstance(node, MultOperation)
+
+
+def _balanced_chain(
+        root: Expression,
+        operands: List[Expression],
+        depths: Dict[int, Tuple[int, bool]]
+) -> Expression:
+    """
+    Combines the operands of an associative chain with the operation of root, always combining the two operands of
+    lowest multiplicative depth first (public operands before secret ones), so the result has the lowest depth.
+    """
+    is_mult = isinstance(root, MultOperation)
+    # entries of (multiplicative depth, contains secret, position, node), position keeps the order deterministic
+    heap = [(*depths[id(operand)], position, operand) for position, operand in enumerate(operands)]
+    heapq.heapify(heap)
+    position = len(operands)
+    while len(heap) > 2:
+        left_depth, left_secret, _, left = heapq.heappop(heap)
+        right_depth, right_secret, _, right = heapq.heappop(heap)
+        node = root.__class__(left, right, id=derive_id(root.id, position))
+        depth = max(left_depth, right_depth) + (1 if is_mult and left_secret and right_secret else 0)
+        depths[id(node)] = (depth, left_secret or right_secret)
+        heapq.heappush(heap, (depth, left_secret or right_secret, position, node))
+        position += 1
+    (_, _, _, left), (_, _, _, right) = sorted(heap, key=lambda entry: entry[2])
+    return root.__class__(left, right, id=root.id)
+
+
+def rebalance(expr: Expression) -> Expression:
+    """
+    Rebalances the chains of additions and of multiplications, e.g. the left-deep a * b * c * d becomes
+    (a * b) * (c * d), so that a product of n secrets needs a multiplicative depth of log2(n) instead of n - 1.
+    A node shared by several parents is kept as an operand of the chains, so that it is still computed once.
+    The root of a chain keeps its id and the nodes inside it get ids derived from it.
+    """
+    # The nodes inside a chain: same operation as their parent, and no other parent.
+    parent_counts: Dict[int, int] = {}
+    chain_children: Set[int] = set()
+    for node in postorder(expr):
+        if is_operation(node):
+            for child in (node.left, node.right):
+                parent_counts[id(child)] = parent_counts.get(id(child), 0) + 1
+                if _is_associative(node) and child.__class__ is node.__class__:
+                    chain_children.add(id(child))
+    inner = {node_id for node_id in chain_children if parent_counts[node_id] == 1}
+
+    # maps id() of a node of the provided expression to its rebalanced node
+    rebalanced: Dict[int, Expression] = {}
+    # maps id() of a rebalanced node to its (multiplicative depth, contains secret) pair
+    depths: Dict[int, Tuple[int, bool]] = {}
+    for node in postorder(expr):
+        if id(node) in inner:
+            continue
+        if is_operation(node):
+            operands = [node.left, node.right]
+            if _is_associative(node):
+                # gather the operands of the whole chain, left to right
+                operands, stack = [], [node.right, node.left]
+                while stack:
+                    operand = stack.pop()
+                    if id(operand) in inner:
+                        stack.append(operand.right)
+                        stack.append(operand.left)
+                    else:
+                        operands.append(operand)
+            operands = [rebalanced[id(operand)] for operand in operands]
+            if len(operands) > 2:
+                new_node = _balanced_chain(node, operands, depths)
+            elif operands[0] is node.left and operands[1] is node.right:
+                new_node = node
+            else:
+                new_node = node.__class__(operands[0], operands[1], id=node.id)
+            (left_depth, left_secret), (right_depth, right_secret) = (depths[id(new_node.left)],
+                                                                      depths[id(new_node.right)])
+            secret = left_secret or right_secret
+            depth = max(left_depth, right_depth)
+            if isinstance(new_node, MultOperation) and left_secret and right_secret:
+                depth += 1
+        else:
+            new_node = node
+            depth, secret = 0, isinstance(node, Secret)
+        rebalanced[id(node)] = new_node
+        depths[id(new_node)] = (depth, secret)
+    return rebalanced[id(expr)]
+
+
+def optimize_expression(expr: Expression) -> Expression:
+    """ Applies all optimization passes to the provided expression. """
+    return eliminate_common_subexpressions(rebalance(simplify(expr)))
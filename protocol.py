@@ -1,4 +1,22 @@
+from typing import Optional
+
+from circuit import Circuit, compile_expression
 from expression import Expression
+from optimizer import optimize_expression
+
+# Wire format the parties ask the server for, see wire_format.py.
+DEFAULT_WIRE_FORMAT = "binary"
+
+# Opening strategies of the values the parties reconstruct (beaver constants and final result):
+# - leader: the parties send their shares to the leader of each value, which reconstructs it and publishes it (two
+#   exchanges). The leader rotates over the participants with the operation id, see SMCParty.get_leader, so the
+#   inbound load is spread over the parties.
+# - broadcast: every party publishes its shares and reconstructs the values itself (one exchange, every party
+#   downloads the shares of all the others)
+OPENING_LEADER = "leader"
+OPENING_BROADCAST = "broadcast"
+OPENING_STRATEGIES = (OPENING_LEADER, OPENING_BROADCAST)
+DEFAULT_OPENING = OPENING_LEADER
 
 
 class ProtocolSpec:
@@ -7,8 +25,37 @@ class ProtocolSpec:
     Attributes:
         participant_ids: List of IDs of the participating clients
         expr: Expression to be computed
+        wire_format: Name of the wire format of the messages (falls back to json if the server does not support it)
+        optimize: Whether the expression is simplified before it is compiled, see optimizer.py
+        session_id: Session of the run on the server, see communication.create_session (None: the default session)
+        opening: Opening strategy of the beaver constants and of the result, one of OPENING_STRATEGIES
     """
 
-    def __init__(self, participant_ids: list, expr: Expression):
+    def __init__(
+            self,
+            participant_ids: list,
+            expr: Expression,
+            wire_format: str = DEFAULT_WIRE_FORMAT,
+            optimize: bool = True,
+            session_id: Optional[str] = None,
+            opening: str = DEFAULT_OPENING
+    ):
+        if opening not in OPENING_STRATEGIES:
+            raise ValueError(f"Unknown opening strategy {opening}, expected one of {OPENING_STRATEGIES}")
         self.participant_ids = participant_ids
         self.expr = expr
+        self.wire_format = wire_format
+        self.optimize = optimize
+        self.session_id = session_id
+        self.opening = opening
+        # compiled expression, with the expression it was compiled from
+        self._circuit: Optional[Circuit] = None
+        self._circuit_expr: Optional[Expression] = None
+
+    @property
+    def circuit(self) -> Circuit:
+        """ Compiled form of the expression, compiled on first use. """
+        if self._circuit is None or self._circuit_expr is not self.expr:
+            self._circuit = compile_expression(optimize_expression(self.expr) if self.optimize else self.expr)
+            self._circuit_expr = self.expr
+        return self._circuit
@@ -0,0 +1,121 @@
+"""
+Sources of randomness for the shares, the triplets and the ids.
+
+All the random values are drawn from the current source, as bytes in bulk. The default source reads the operating
+system's CSPRNG, a seeded source can be installed to make runs reproducible (e.g. benchmarks).
+"""
+
+import abc
+import hashlib
+import os
+import threading
+from typing import Optional
+
+
+class RandomSource(abc.ABC):
+    """
+    Base class for a source of random bytes.
+    """
+
+    @abc.abstractmethod
+    def random_bytes(self, count: int) -> bytes:
+        """ Draws count random bytes. """
+
+
+class SystemRandomSource(RandomSource):
+    """
+    Reads every draw from the operating system's CSPRNG.
+    """
+
+    def random_bytes(self, count: int) -> bytes:
+        return os.urandom(count)
+
+
+class SeededRandomSource(RandomSource):
+    """
+    Deterministic source: SHAKE-256 of the seed and of a block counter, used as a stream generator.
+    The same seed always yields the same bytes, which makes runs reproducible, so it must not be used to protect
+    actual secrets. A forked child draws from its own stream, keyed by the key of its parent and the number of
+    children the parent forked before it, so that the parties of a seeded run (e.g. the processes of a benchmark)
+    draw different bytes, which are still the same from one run to the next.
+    """
+
+    BLOCK_SIZE = 1 << 14
+
+    def __init__(self, seed: int):
+        self._rekey(hashlib.sha256(str(seed).encode()).digest())
+
+    def _rekey(self, key: bytes) -> None:
+        self.key = key
+        self.counter = 0
+        self.buffer = b""
+        self.offset = 0
+        # number of children forked by this process
+        self.forks = 0
+        self.lock = threading.Lock()
+
+    def before_fork(self) -> None:
+        """ Counts the child about to be forked, see after_fork_in_child. """
+        self.forks += 1
+
+    def after_fork_in_child(self) -> None:
+        """ Switches the forked child to its own stream. """
+        self._rekey(hashlib.sha256(self.key + self.forks.to_bytes(8, "big")).digest())
+
+    def _block(self) -> bytes:
+        block = hashlib.shake_256(self.key + self.counter.to_bytes(8, "big")).digest(self.BLOCK_SIZE)
+        self.counter += 1
+        return block
+
+    def random_bytes(self, count: int) -> bytes:
+        with self.lock:
+            if self.offset + count > len(self.buffer):
+                # the blocks are joined once, so that a large draw takes linear time
+                blocks = [self.buffer[self.offset:]]
+                available = len(blocks[0])
+                while available < count:
+                    blocks.append(self._block())
+                    available += self.BLOCK_SIZE
+                self.buffer = b"".join(blocks)
+                self.offset = 0
+            draw = self.buffer[self.offset:self.offset + count]
+            self.offset += count
+            return draw
+
+
+_source: RandomSource = SystemRandomSource()
+
+
+def get_source() -> RandomSource:
+    """ Returns the current source of randomness. """
+    return _source
+
+
+def set_source(source: Optional[RandomSource] = None) -> None:
+    """ Installs the provided source of randomness, or the default one (operating system's CSPRNG). """
+    global _source
+    _source = source if source is not None else SystemRandomSource()
+
+
+def seed(value: int) -> None:
+    """ Makes the randomness reproducible, see SeededRandomSource. """
+    set_source(SeededRandomSource(value))
+
+
+def random_bytes(count: int) -> bytes:
+    """ Draws count random bytes from the current source. """
+    return _source.random_bytes(count)
+
+
+def _before_fork() -> None:
+    if isinstance(_source, SeededRandomSource):
+        _source.before_fork()
+
+
+def _after_fork_in_child() -> None:
+    if isinstance(_source, SeededRandomSource):
+        _source.after_fork_in_child()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
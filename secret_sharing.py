@@ -5,22 +5,41 @@ Secret sharing scheme.
 from __future__ import annotations
 
 import json
-from random import randint
-from typing import List
+from array import array
+from typing import Iterable, Iterator, List, Optional, Union
 
 from json_utils import json_serialize
+from randomness import random_bytes
 
 FIELD_MODULUS = 1631265511
 
+# Random field elements are drawn as 64-bit integers, the ones at or above the largest multiple of the modulus that fits
+# are rejected so that the elements are uniform.
+_RANDOM_LIMIT = (1 << 64) // FIELD_MODULUS * FIELD_MODULUS
+
+# Type code of the arrays holding field elements: the smallest unsigned integer type that fits the modulus.
+_ARRAY_TYPECODE = "I" if array("I").itemsize >= 4 else "L"
+
 
 class Share:
     """
-    A secret share in a finite field.
+    A secret share in a finite field. Shares are immutable.
     """
 
+    __slots__ = ("value",)
+
     def __init__(self, value, *args, **kwargs):
         # Adapt constructor arguments as you wish
-        self.value = value % FIELD_MODULUS
+        object.__setattr__(self, "value", value % FIELD_MODULUS)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __reduce__(self):
+        return Share, (self.value,)
 
     def __repr__(self):
         # Helps with debugging.
@@ -28,25 +47,32 @@ class Share:
     
     def __add__(self, other):
         if isinstance(other, Share) or isinstance(other, Constant):
-            return Share((self.value + other.value) % FIELD_MODULUS)
+            return _share((self.value + other.value) % FIELD_MODULUS)
         else:
-            raise TypeError("Unsupported operation")
+            return NotImplemented
     
     def __sub__(self, other):
         if isinstance(other, Share) or isinstance(other, Constant):
-            return Share((self.value - other.value) % FIELD_MODULUS)
+            return _share((self.value - other.value) % FIELD_MODULUS)
         else:
-            raise TypeError("Unsupported operation")
+            return NotImplemented
     
     def __mul__(self, other):
         if isinstance(other, Constant):
-            return Share((self.value * other.value) % FIELD_MODULUS)
-        else:
+            return _share((self.value * other.value) % FIELD_MODULUS)
+        elif isinstance(other, Share) or isinstance(other, ShareVector):
             raise TypeError("Beaver triplets! / Unsupported operation")
+        else:
+            return NotImplemented
     
+    def __eq__(self, other):
+        if isinstance(other, Share):
+            return self.value == other.value
+        return NotImplemented
+
     def __hash__(self):
         return hash(self.value)
-    
+
     def serialize(self):
         """Generate a representation suitable for passing in a message."""
         return json_serialize(self)
@@ -60,12 +86,23 @@ class Share:
 
 class Constant:
     """
-    A constant in a finite field.
+    A constant in a finite field. Constants are immutable.
     """
 
+    __slots__ = ("value",)
+
     def __init__(self, value, *args, **kwargs):
         # Adapt constructor arguments as you wish
-        self.value = value % FIELD_MODULUS
+        object.__setattr__(self, "value", value % FIELD_MODULUS)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __reduce__(self):
+        return Constant, (self.value,)
 
     def __repr__(self):
         # Helps with debugging.
@@ -73,27 +110,32 @@ class Constant:
     
     def __add__(self, other):
         if isinstance(other, Share):
-            return Share((self.value + other.value) % FIELD_MODULUS)
+            return _share((self.value + other.value) % FIELD_MODULUS)
         elif isinstance(other, Constant):
-            return Constant((self.value + other.value) % FIELD_MODULUS)
+            return _constant((self.value + other.value) % FIELD_MODULUS)
         else:
-            raise TypeError("Unsupported operation")
+            return NotImplemented
     
     def __sub__(self, other):
         if isinstance(other, Share):
-            return Share((self.value - other.value) % FIELD_MODULUS)
+            return _share((self.value - other.value) % FIELD_MODULUS)
         elif isinstance(other, Constant):
-            return Constant((self.value - other.value) % FIELD_MODULUS)
+            return _constant((self.value - other.value) % FIELD_MODULUS)
         else:
-            raise TypeError("Unsupported operation")
+            return NotImplemented
 
     def __mul__(self, other):
         if isinstance(other, Share):
-            return Share((self.value * other.value) % FIELD_MODULUS)
+            return _share((self.value * other.value) % FIELD_MODULUS)
         elif isinstance(other, Constant):
-            return Constant((self.value * other.value) % FIELD_MODULUS)
+            return _constant((self.value * other.value) % FIELD_MODULUS)
         else:
-            raise TypeError("Unsupported operation")
+            return NotImplemented
+
+    def __eq__(self, other):
+        if isinstance(other, Constant):
+            return self.value == other.value
+        return NotImplemented
 
     def __hash__(self):
         return hash(self.value)
@@ -109,13 +151,205 @@ class Constant:
         return Constant(dict_obj['value'])
 
 
+class ShareVector:
+    """
+    A vector of secret shares in a finite field. Operations are applied element-wise, and a Share or a Constant
+    operand is broadcast to every element.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: List[int]):
+        self.values = [value % FIELD_MODULUS for value in values]
+
+    def __repr__(self):
+        # Helps with debugging.
+        return f"{self.__class__.__name__}({repr(self.values)})"
+
+    def __len__(self):
+        return len(self.values)
+
+    def _operand_values(self, other) -> Optional[List[int]]:
+        """ Returns the element values of the other operand, broadcast to the length of this vector. """
+        if isinstance(other, ShareVector):
+            if len(other.values) != len(self.values):
+                raise ValueError(f"Vector lengths {len(self.values)} and {len(other.values)} do not match")
+            return other.values
+        if isinstance(other, Share) or isinstance(other, Constant):
+            return [other.value] * len(self.values)
+        return None
+
+    def __add__(self, other):
+        other_values = self._operand_values(other)
+        if other_values is None:
+            return NotImplemented
+        return _share_vector([(value + other_value) % FIELD_MODULUS
+                            for value, other_value in zip(self.values, other_values)])
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other_values = self._operand_values(other)
+        if other_values is None:
+            return NotImplemented
+        return _share_vector([(value - other_value) % FIELD_MODULUS
+                            for value, other_value in zip(self.values, other_values)])
+
+    def __rsub__(self, other):
+        other_values = self._operand_values(other)
+        if other_values is None:
+            return NotImplemented
+        return _share_vector([(other_value - value) % FIELD_MODULUS
+                            for value, other_value in zip(self.values, other_values)])
+
+    def __mul__(self, other):
+        if isinstance(other, Constant):
+            return _share_vector([(value * other.value) % FIELD_MODULUS for value in self.values])
+        elif isinstance(other, Share) or isinstance(other, ShareVector):
+            raise TypeError("Beaver triplets! / Unsupported operation")
+        else:
+            return NotImplemented
+
+    __rmul__ = __mul__
+
+    def serialize(self):
+        """Generate a representation suitable for passing in a message."""
+        return json_serialize(self)
+
+    @staticmethod
+    def deserialize(serialized) -> ShareVector:
+        """Restore object from its serialized representation."""
+        dict_obj = json.loads(serialized)
+        return ShareVector(dict_obj['values'])
+
+
+class ShareArray:
+    """
+    A compact sequence of scalar secret shares, e.g. the shares of many triplets: the values are held in a single array
+    of machine integers (struct of arrays) instead of one Share object each. Indexing builds the Share on demand.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        self.values = array(_ARRAY_TYPECODE, [value % FIELD_MODULUS for value in values])
+
+    @staticmethod
+    def from_shares(shares: Iterable[Share]) -> ShareArray:
+        """ Packs the provided shares, their values are already reduced. """
+        share_array = ShareArray()
+        share_array.extend(shares)
+        return share_array
+
+    def __repr__(self):
+        # Helps with debugging.
+        return f"{self.__class__.__name__}({repr(self.values.tolist())})"
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            share_array = ShareArray()
+            share_array.values = self.values[index]
+            return share_array
+        return _share(self.values[index])
+
+    def __iter__(self) -> Iterator[Share]:
+        return map(_share, self.values)
+
+    def append(self, share: Share) -> None:
+        self.values.append(share.value)
+
+    def extend(self, shares: Iterable[Share]) -> None:
+        self.values.extend(share.value for share in shares)
+
+    def to_vector(self) -> ShareVector:
+        """ Returns the shares as a ShareVector, to operate on them element-wise. """
+        return _share_vector(self.values.tolist())
+
+
+def _share(value: int) -> Share:
+    """ Creates a Share of a value that is already reduced, skipping the reduction of the constructor. """
+    share = _new_object(Share)
+    _set_share_value(share, value)
+    return share
+
+
+def _constant(value: int) -> Constant:
+    """ Creates a Constant of a value that is already reduced, skipping the reduction of the constructor. """
+    constant = _new_object(Constant)
+    _set_constant_value(constant, value)
+    return constant
+
+
+def _share_vector(values: List[int]) -> ShareVector:
+    """ Creates a ShareVector of values that are already reduced, skipping the reduction of the constructor. """
+    vector = _new_object(ShareVector)
+    vector.values = values
+    return vector
+
+
+# The slot descriptors set the value of the immutable classes, bypassing their __setattr__.
+_new_object = object.__new__
+_set_share_value = Share.value.__set__  # type: ignore
+_set_constant_value = Constant.value.__set__  # type: ignore
+
+
+def share_from_dict(dict_obj) -> Union[Share, ShareVector]:
+    """ Restores a Share or a ShareVector from the dict of its JSON representation. """
+    if 'values' in dict_obj:
+        return ShareVector(dict_obj['values'])
+    return Share(dict_obj['value'])
+
+
+def random_field_elements(count: int) -> List[int]:
+    """
+    Draw count uniform random field elements from the current source of randomness, in bulk.
+    """
+    elements: List[int] = []
+    while len(elements) < count:
+        missing = count - len(elements)
+        draws = array("Q", random_bytes(8 * missing))
+        elements.extend(draw % FIELD_MODULUS for draw in draws if draw < _RANDOM_LIMIT)
+    return elements
+
+
+def share_secrets(secrets: List[int], num_shares: int) -> List[List[int]]:
+    """
+    Generate secret shares of many secrets at once. Returns the values of the shares of each party: the i-th list
+    holds the i-th share of every secret, in the order of the secrets.
+    """
+    num_secrets = len(secrets)
+    randomness = random_field_elements((num_shares - 1) * num_secrets)
+    shares = [randomness[i * num_secrets:(i + 1) * num_secrets] for i in range(num_shares - 1)]
+    # the last share of each secret is the difference between the secret and the sum of its random shares
+    shares.append([(secret - sum(random_shares)) % FIELD_MODULUS for secret, *random_shares in zip(secrets, *shares)])
+    return shares
+
+
+def reconstruct_secrets(shares: List[List[int]]) -> List[int]:
+    """
+    Reconstruct many secrets at once from the values of the shares of each party, see share_secrets.
+    """
+    return [sum(values) % FIELD_MODULUS for values in zip(*shares)]
+
+
 def share_secret(secret: int, num_shares: int) -> List[Share]:
     """Generate secret shares."""
-    shares = [Share(randint(0, FIELD_MODULUS - 1)) for _ in range(num_shares - 1)]
-    shares.append(Share((secret - sum([share.value for share in shares])) % FIELD_MODULUS))
-    return shares
+    return [_share(values[0]) for values in share_secrets([secret], num_shares)]
 
 
 def reconstruct_secret(shares: List[Share]) -> int:
     """Reconstruct the secret from shares."""
     return sum([share.value for share in shares]) % FIELD_MODULUS
+
+
+def share_secret_vector(secret: List[int], num_shares: int) -> List[ShareVector]:
+    """Generate secret shares of every element of a vector."""
+    return [_share_vector(values) for values in share_secrets(secret, num_shares)]
+
+
+def reconstruct_secret_vector(shares: List[ShareVector]) -> List[int]:
+    """Reconstruct a vector of secrets from shares."""
+    return reconstruct_secrets([share.values for share in shares])
@@ -3,108 +3,588 @@ Trusted server that should help SMC client to communicate.
 You should not need to change this file.
 """
 
-import collections
+import base64
+import logging
+import select
+import socket
 import sys
-from typing import Dict, List, Optional, Tuple
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
-from flask import Flask, request, Response, jsonify
+from flask import Blueprint, Flask, abort, g, has_request_context, request, Response, jsonify
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
 
+from log_utils import configure_logging, get_logger, log_event
+from message_store import MessageStore, StoreFullError, DEFAULT_NAMESPACE
+from secret_sharing import Share, ShareVector
 from ttp import TrustedParamGenerator
+from wire_format import CODECS, DEFAULT_CODEC, SharesList
 
 
+LOG = get_logger("server")
+
 app: Flask = Flask("Trusted Third Party Server")
-store: Dict[str, Dict[Tuple[str, str], bytes]] = collections.defaultdict(dict)
+# The routes of a protocol run, served both at the root (default session) and under /session/<session_id>.
+routes: Blueprint = Blueprint("routes", __name__)
+store: MessageStore = MessageStore()
 ttp: TrustedParamGenerator = TrustedParamGenerator()
+# The server is threaded, so the triplets of an operation must not be generated twice by concurrent requests.
+ttp_lock = threading.Lock()
+# Participants that finished the run, its messages are dropped once all participants did. Guarded by ttp_lock.
+finished: Set[str] = set()
+# Sessions created through the API, by id.
+sessions: Dict[str, "Session"] = {}
+sessions_lock = threading.Lock()
+
+# Upper bound on how long a single long-polling request may block, in seconds.
+MAX_LONG_POLL_TIMEOUT = 30.0
+# Default number of worker threads. Long-polling requests and idle keep-alive connections hold a worker, but they
+# give it back as soon as a connection waits for one, so this bounds the concurrency of the server, not the number
+# of parties.
+DEFAULT_WORKERS = 64
+# Time in seconds after which an idle keep-alive connection is closed, so that it gives its worker back.
+KEEP_ALIVE_TIMEOUT = 5.0
+# Key of the WSGI environ holding the ThreadPoolWSGIServer serving the request, if any.
+POOL_ENVIRON_KEY = "smc.pool"
+
+
+class Session:
+    """
+    A protocol run: its id (also the namespace of its messages in the store), the trusted parameter generator of
+    its participants with the lock guarding it, and the participants that finished the run.
+    """
+
+    def __init__(
+            self,
+            session_id: str,
+            participants: List[str],
+            session_ttp: Optional[TrustedParamGenerator] = None,
+            lock: Optional[threading.Lock] = None,
+            session_finished: Optional[Set[str]] = None
+    ):
+        self.session_id = session_id
+        self.ttp = session_ttp if session_ttp is not None else TrustedParamGenerator()
+        self.lock = lock if lock is not None else threading.Lock()
+        self.finished = session_finished if session_finished is not None else set()
+        with self.lock:
+            for participant in participants:
+                self.ttp.add_participant(participant)
+
+
+# The session of the requests outside of /session/<session_id>, on the generator, lock and participants above.
+default_session = Session(DEFAULT_NAMESPACE, [], ttp, ttp_lock, finished)
+
+
+@routes.url_value_preprocessor
+def pull_session_id(endpoint: Optional[str], values: Optional[dict]) -> None:
+    """
+    Take the session id out of the URL, so that the routes do not need it as an argument.
+    """
+    g.session_id = values.pop("session_id", DEFAULT_NAMESPACE) if values else DEFAULT_NAMESPACE
+
+
+def _current_session() -> Session:
+    """
+    Returns the session of the request, aborts with 404 if it does not exist.
+    """
+    if g.session_id == DEFAULT_NAMESPACE:
+        return default_session
+    with sessions_lock:
+        session = sessions.get(g.session_id)
+    if session is None:
+        abort(404)
+    return session
+
+
+@app.errorhandler(StoreFullError)
+def store_full(error: StoreFullError):
+    """
+    Reject a message that does not fit in the store, instead of evicting unread messages.
+    """
+    log_event(LOG, logging.WARNING, "store.full", error=str(error))
+    return Response(status=507)
 
 
-@app.route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
+@app.route("/sessions", methods=["POST"])
+def create_session():
+    """
+    Create a session for a new protocol run. The body is a JSON object {"participants": [...], "session_id": ...},
+    where the session id is optional (a random one is generated). Returns {"session_id": ...}.
+    """
+    body = request.get_json()
+    session_id = body.get("session_id") or uuid.uuid4().hex
+    with sessions_lock:
+        if session_id in sessions:
+            return Response(status=409)
+        sessions[session_id] = Session(session_id, body["participants"])
+    log_event(LOG, logging.INFO, "session.create", session=session_id, participants=len(body["participants"]))
+    return jsonify({"session_id": session_id}), 201
+
+
+@routes.route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
 def send_private_message(sender_id: str, receiver_id: str, label: str):
     """
     The client send a private message to the server.
     """
-    print(
-        f"[ SEND     ] SENDER {sender_id} / LABEL {label} / RECEIVER {receiver_id}"
-    )
+    log_event(LOG, logging.DEBUG, "private.send", sender=sender_id, label=label, receiver=receiver_id)
     _set_value("private", (receiver_id, label), request.get_data())
     return Response(status=200)
 
 
-@app.route("/private/<receiver_id>/<label>", methods=["GET"])
+@routes.route("/private/<receiver_id>/<label>", methods=["GET"])
 def retrieve_private_message(receiver_id: str, label: str):
     """
-    The client retrieve a private message from the server.
+    The client retrieve a private message from the server. The messages given as repeated `ack` query parameters,
+    which the client already received, are removed first.
+    With a `timeout` query parameter, the request blocks until the message is ready or the timeout expires.
     """
-    res = _get_value("private", (receiver_id, label))
+    _remove_acknowledged(receiver_id)
+    res = _get_value("private", (receiver_id, label), _long_poll_timeout(), interrupted=_interrupted())
     if res is not None:
-        print(f"[ RETRIEVE ] RECEIVER {receiver_id} / LABEL {label}")
+        log_event(LOG, logging.DEBUG, "private.retrieve", receiver=receiver_id, label=label)
         return res, 200
 
     return Response(status=404)
 
 
-@app.route("/public/<sender_id>/<label>", methods=["POST"])
+@routes.route("/public/<sender_id>/<label>", methods=["POST"])
 def publish_message(sender_id: str, label: str):
     """
     The client publish a public message on the server.
     """
-    print(f"[ PUBLISH  ] SENDER {sender_id} / LABEL {label}")
+    log_event(LOG, logging.DEBUG, "public.publish", sender=sender_id, label=label)
     _set_value("public", (sender_id, label), request.get_data())
     return Response(status=200)
 
 
-@app.route("/public/<receiver_id>/<sender_id>/<label>", methods=["GET"])
+@routes.route("/public/<receiver_id>/<sender_id>/<label>", methods=["GET"])
 def retrieve_public_message(receiver_id: str, sender_id: str, label: str):
     """
     The client retrieve a public message from the server.
+    With a `timeout` query parameter, the request blocks until the message is ready or the timeout expires.
     """
-    res = _get_value("public", (sender_id, label))
+    res = _get_value("public", (sender_id, label), _long_poll_timeout(), interrupted=_interrupted())
     if res is not None:
-        print(
-            f"[ RETRIEVE ] RECEIVER {receiver_id}. LABEL {label} / SENDER {sender_id}"
-        )
+        log_event(LOG, logging.DEBUG, "public.retrieve", receiver=receiver_id, label=label, sender=sender_id)
         return res, 200
     return Response(status=404)
 
 
-@app.route("/shares/<client_id>/<op_id>", methods=["GET"])
+@routes.route("/shares/<client_id>/<op_id>", methods=["GET"])
 def retrieve_share(client_id: str, op_id: str):
     """
-    The client retrieve Beaver triplets generated by the server.
+    The client retrieve Beaver triplets generated by the server, encoded with the wire format given by the `codec`
+    query parameter (default: json).
+    """
+    codec_name = request.args.get("codec", DEFAULT_CODEC)
+    if codec_name not in CODECS:
+        return Response(status=400)
+    session = _current_session()
+    with session.lock:
+        shares = session.ttp.retrieve_share(client_id, op_id)
+    return CODECS[codec_name].encode(SharesList(shares)), 200
+
+
+@routes.route("/shares/<client_id>", methods=["POST"])
+def retrieve_shares(client_id: str):
+    """
+    The client retrieve the Beaver triplets of many operations at once, before the evaluation (offline phase).
+    The body is a JSON object {"op_ids": [...], "lengths": [...]}, where the optional lengths are the vector lengths
+    of the operations. The first request generates the triplets of all the operations. The response holds the a, b
+    and c shares of each operation one after the other (all the elements of a vector share in a row), encoded with
+    the wire format given by the `codec` query parameter (default: json).
+    """
+    codec_name = request.args.get("codec", DEFAULT_CODEC)
+    if codec_name not in CODECS:
+        return Response(status=400)
+    session = _current_session()
+    body = request.get_json()
+    op_ids = body["op_ids"]
+    with session.lock:
+        triplets = session.ttp.retrieve_shares(client_id, op_ids, body.get("lengths"))
+    log_event(LOG, logging.DEBUG, "shares.retrieve", receiver=client_id, operations=len(op_ids))
+    shares = SharesList()
+    for triplet in triplets:
+        for share in triplet:
+            if isinstance(share, ShareVector):
+                shares.extend(Share(value) for value in share.values)
+            else:
+                shares.append(share)
+    return CODECS[codec_name].encode(shares), 200
+
+
+@routes.route("/finish/<client_id>", methods=["POST"])
+def finish(client_id: str):
+    """
+    The client tells the server it is done with the run. Once all participants are, the messages and the
+    triplets of the run are dropped, as well as the session itself if it was created through the API.
+    Only the participants of the run can finish it (403 otherwise), so that a run without registered participants
+    is never dropped while it is in progress.
+    """
+    session = _current_session()
+    with session.lock:
+        if client_id not in session.ttp.participant_ids:
+            return Response(status=403)
+        session.finished.add(client_id)
+        if not session.finished.issuperset(session.ttp.participant_ids):
+            return Response(status=200)
+        session.finished.clear()
+        session.ttp.clear()
+    if session.session_id != DEFAULT_NAMESPACE:
+        with sessions_lock:
+            sessions.pop(session.session_id, None)
+    dropped = store.drop_namespace(session.session_id)
+    log_event(LOG, logging.INFO, "session.finish", session=session.session_id, dropped=dropped)
+    return Response(status=200)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    The memory usage of the server: messages in the store, triplets held by the trusted parameter generator of the
+    default session, and number of open sessions. With a pool of workers, also the number of TCP connections it
+    accepted (None otherwise).
+    """
+    with ttp_lock:
+        ttp_metrics = ttp.metrics()
+    with sessions_lock:
+        num_sessions = len(sessions)
+    pool = request.environ.get(POOL_ENVIRON_KEY)
+    return jsonify({
+        "store": store.metrics(),
+        "ttp": ttp_metrics,
+        "sessions": num_sessions,
+        "connections": pool.num_accepted if pool is not None else None,
+    }), 200
+
+
+@routes.route("/codecs", methods=["GET"])
+def supported_codecs():
+    """
+    The client retrieve the wire formats supported by the server.
+    """
+    return jsonify(list(CODECS)), 200
+
+
+@routes.route("/batch/private/<sender_id>", methods=["POST"])
+def send_private_messages(sender_id: str):
+    """
+    The client send many private messages to the server at once.
+    The body is a JSON list of {"receiver": ..., "label": ..., "payload": <base64>} objects.
+    """
+    messages = request.get_json()
+    log_event(LOG, logging.DEBUG, "private.send_batch", sender=sender_id, messages=len(messages))
+    _set_values("private", [
+        ((message["receiver"], message["label"]), base64.b64decode(message["payload"])) for message in messages
+    ])
+    return Response(status=200)
+
+
+@routes.route("/batch/private/<receiver_id>", methods=["GET"])
+def retrieve_private_messages(receiver_id: str):
+    """
+    The client retrieve many private messages from the server at once, given as repeated `label` query parameters.
+    Returns a JSON list of {"label": ..., "payload": <base64>} objects for the messages that are ready. The messages
+    given as repeated `ack` query parameters, which the client already received, are removed first.
+    With a `timeout` query parameter, the request blocks until all messages are ready or the timeout expires.
+    """
+    _remove_acknowledged(receiver_id)
+    labels = request.args.getlist("label")
+    channels = [(receiver_id, label) for label in labels]
+    values = _get_values("private", channels, _long_poll_timeout(), interrupted=_interrupted())
+    res = []
+    for label, value in zip(labels, values):
+        if value is not None:
+            res.append({"label": label, "payload": base64.b64encode(value).decode("ascii")})
+    log_event(LOG, logging.DEBUG, "private.retrieve_batch", receiver=receiver_id, asked=len(labels), ready=len(res))
+    return jsonify(res), 200
+
+
+@routes.route("/batch/public/<receiver_id>", methods=["GET"])
+def retrieve_public_messages(receiver_id: str):
+    """
+    The client retrieve many public messages from the server at once, given as pairs of repeated `sender` and
+    `label` query parameters.
+    Returns a JSON list of {"sender": ..., "label": ..., "payload": <base64>} objects for the messages that are ready.
+    With a `timeout` query parameter, the request blocks until all messages are ready or the timeout expires.
     """
-    shares = ttp.retrieve_share(client_id, op_id)
-    return jsonify([share.serialize() for share in shares]), 200
+    channels = list(zip(request.args.getlist("sender"), request.args.getlist("label")))
+    values = _get_values("public", channels, _long_poll_timeout(), interrupted=_interrupted())
+    res = []
+    for (sender_id, label), value in zip(channels, values):
+        if value is not None:
+            res.append({"sender": sender_id, "label": label, "payload": base64.b64encode(value).decode("ascii")})
+    log_event(LOG, logging.DEBUG, "public.retrieve_batch", receiver=receiver_id, asked=len(channels), ready=len(res))
+    return jsonify(res), 200
+
+
+def _long_poll_timeout() -> Optional[float]:
+    """
+    Returns the long-polling timeout requested by the client, if any.
+    """
+    timeout = request.args.get("timeout", type=float)
+    if timeout is None or timeout <= 0:
+        return None
+    return min(timeout, MAX_LONG_POLL_TIMEOUT)
+
+
+def _interrupted() -> Optional[Callable[[], bool]]:
+    """
+    Returns the check telling a long-polling request to give its worker back, if the request is served by a pool of
+    workers (see ThreadPoolWSGIServer.saturated).
+    """
+    pool = request.environ.get(POOL_ENVIRON_KEY)
+    return pool.saturated if pool is not None else None
+
+
+def _remove_acknowledged(receiver_id: str) -> None:
+    """
+    Remove the private messages of the receiver that it acknowledged with `ack` query parameters.
+    Removing a message twice does nothing, so a retried request is harmless.
+    """
+    labels = request.args.getlist("ack")
+    if labels:
+        store.remove_values(_namespace(), "private", [(receiver_id, label) for label in labels])
+
+
+def _namespace() -> str:
+    """
+    Returns the namespace of the messages of the current session (the default one outside of a request).
+    """
+    return g.session_id if has_request_context() else DEFAULT_NAMESPACE
 
 
 def _set_value(pool: str, channel: Tuple[str, str], data: bytes) -> None:
     """
     Push data to a channel in a given pool and send an event.
     """
-    store[pool][channel] = data
+    store.set_values(_namespace(), pool, [(channel, data)])
+
+
+def _set_values(pool: str, items: List[Tuple[Tuple[str, str], bytes]]) -> None:
+    """
+    Push data to many channels in a given pool and send a single event.
+    """
+    store.set_values(_namespace(), pool, items)
 
 
-def _get_value(pool: str, channel: Tuple[str, str]) -> Optional[bytes]:
+def _get_values(
+        pool: str,
+        channels: List[Tuple[str, str]],
+        timeout: Optional[float] = None,
+        interrupted: Optional[Callable[[], bool]] = None
+) -> List[Optional[bytes]]:
+    """
+    Subscribe to many channels in a given pool and get them once all are ready.
+    Without a timeout, returns right away, otherwise waits at most timeout seconds, or until interrupted returns True.
+    Missing values are None.
+    """
+    return store.get_values(_namespace(), pool, channels, timeout, interrupted)
+
+
+def _get_value(
+        pool: str,
+        channel: Tuple[str, str],
+        timeout: Optional[float] = None,
+        interrupted: Optional[Callable[[], bool]] = None
+) -> Optional[bytes]:
     """
     Subscribe to a channel in a given pool and get it once ready.
+    Without a timeout, returns None right away if the channel is empty, otherwise waits for it at most timeout seconds,
+    or until interrupted returns True.
     """
-    if channel not in store[pool]:
-        return None
-    return store[pool][channel]
+    return store.get_values(_namespace(), pool, [channel], timeout, interrupted)[0]
+
+
+@routes.before_request
+def check_session() -> None:
+    """
+    Reject the requests of a session that does not exist.
+    """
+    _current_session()
+
+
+app.register_blueprint(routes)
+app.register_blueprint(routes, url_prefix="/session/<session_id>", name="session")
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    Request handler speaking HTTP/1.1. Note that werkzeug's handler still answers every request with
+    "Connection: close" (http.server cannot drain a request body before reading the next one), so each request
+    of a client opens a new TCP connection, see Communication.connection_stats.
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = KEEP_ALIVE_TIMEOUT
+
+
+class PooledRequestHandler(KeepAliveRequestHandler):
+    """
+    Request handler of ThreadPoolWSGIServer. It gives its worker back when other connections wait for one: its
+    long-polling requests return early, and it closes its connection instead of waiting for the next request.
+    """
+
+    def setup(self):
+        super().setup()
+        self.requests_handled = 0
+
+    def make_environ(self):
+        environ = super().make_environ()
+        environ[POOL_ENVIRON_KEY] = self.server
+        return environ
+
+    def handle_one_request(self):
+        if self.requests_handled > 0:
+            # The connection is idle until the client sends its next request. The server shuts it down if a
+            # connection waits for a worker meanwhile, which makes it readable (end of stream) and closes it.
+            if not self.server.add_idle(self.connection):
+                self.close_connection = True
+                return
+            try:
+                readable, _, _ = select.select([self.connection], [], [], self.timeout)
+            finally:
+                self.server.remove_idle(self.connection)
+            if not readable:
+                self.close_connection = True
+                return
+        self.requests_handled += 1
+        super().handle_one_request()
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    """
+    WSGI server handling each connection in a bounded pool of worker threads, instead of a new thread per
+    connection (werkzeug's threaded server) or a single thread (its default).
+    Once a connection waits for a worker, the pool is saturated: on_saturated is called (run wakes up the long-polling
+    requests of the store, which return early) and the idle keep-alive connections are closed, so that the workers
+    they hold are given back.
+    """
+    request_queue_size = 128
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            app,
+            workers: int = DEFAULT_WORKERS,
+            handler=PooledRequestHandler,
+            on_saturated: Optional[Callable[[], None]] = None
+    ):
+        super().__init__(host, port, app, handler=handler)
+        self.workers = workers
+        self.on_saturated = on_saturated
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="server-worker")
+        # Number of connections accepted, number of them not closed yet (waiting for a worker or held by one), and the
+        # idle keep-alive connections, guarded by pool_lock.
+        self.pool_lock = threading.Lock()
+        self.num_accepted = 0
+        self.num_connections = 0
+        self.idle: Set[socket.socket] = set()
+
+    def saturated(self) -> bool:
+        """ Whether a connection waits for a worker. """
+        with self.pool_lock:
+            return self.num_connections > self.workers
+
+    def add_idle(self, connection: socket.socket) -> bool:
+        """ Marks the connection as idle, unless the pool is saturated. Returns whether it was marked. """
+        with self.pool_lock:
+            if self.num_connections > self.workers:
+                return False
+            self.idle.add(connection)
+            return True
+
+    def remove_idle(self, connection: socket.socket) -> None:
+        """ Marks the connection as no longer idle. """
+        with self.pool_lock:
+            self.idle.discard(connection)
+
+    def process_request(self, request, client_address):
+        with self.pool_lock:
+            self.num_accepted += 1
+            self.num_connections += 1
+            saturated = self.num_connections > self.workers
+            idle = list(self.idle) if saturated else []
+        if saturated:
+            for connection in idle:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            if self.on_saturated is not None:
+                self.on_saturated()
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.pool_lock:
+                self.num_connections -= 1
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
-def run(host: str, port: int, participants: List[str]) -> None:
+def run(
+        host: str,
+        port: int,
+        participants: List[str],
+        workers: int = DEFAULT_WORKERS,
+        debug: bool = False
+) -> None:
     """
-    Register the participants, then run the server.
+    Register the participants of the default session, then run the server. More sessions can be created through
+    the API, see create_session.
+    The production mode serves the requests with a pool of workers threads, long-polling requests block a worker
+    while they wait for a message, until another connection waits for a worker. The debug mode runs the Flask
+    development server instead.
     """
-    for participant in participants:
-        ttp.add_participant(participant)
-    app.run(host, port, debug=True, threaded=False, processes=1, use_reloader=False)
+    with ttp_lock:
+        for participant in participants:
+            ttp.add_participant(participant)
+    log_event(LOG, logging.INFO, "server.start", host=host, port=port, participants=len(participants),
+              workers=workers, debug=debug)
+    if debug:
+        app.run(host, port, debug=True, threaded=True, processes=1, use_reloader=False,
+                request_handler=KeepAliveRequestHandler)
+        return
+    # werkzeug logs a line per request at INFO, which is far too costly outside of debugging
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = ThreadPoolWSGIServer(host, port, app, workers, on_saturated=store.wake_waiters)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
 
 
 def main(args: List[str]) -> None:
     """
-    Entrypoint of the program.
+    Entrypoint of the program: the arguments are the participants, optionally preceded by --workers N and --debug.
     """
-    run("localhost", 5000, args)
+    workers = DEFAULT_WORKERS
+    debug = False
+    while args and args[0].startswith("--"):
+        if args[0] == "--workers":
+            workers = int(args[1])
+            args = args[2:]
+        elif args[0] == "--debug":
+            debug = True
+            args = args[1:]
+        else:
+            raise ValueError(f"Unknown option {args[0]}")
+    listener = configure_logging(asynchronous=True)
+    try:
+        run("localhost", 5000, args, workers=workers, debug=debug)
+    finally:
+        if listener is not None:
+            listener.stop()
 
 
 if __name__ == "__main__":
@@ -3,27 +3,45 @@ Implementation of an SMC client.
 
 MODIFY THIS FILE.
 """
+import asyncio
+import logging
+import zlib
 from typing import (
-    Dict, List
+    Awaitable, Dict, List, Optional, Sequence, Tuple, TypeVar, Union
 )
 
-from communication import Communication
+from circuit import Circuit, DataflowSchedule, compile_expression, OP_ADD, OP_ADD_CONSTANT, OP_MULT, OP_SECRET, \
+    OP_SCALAR, OP_SUB, OP_SUB_CONSTANT, OP_CONSTANT_SUB
+from communication import Communication, AsyncCommunication, DEFAULT_LONG_POLL_TIMEOUT
 from expression import (
     Expression,
     Secret,
-    Scalar,
-    AddOperation,
-    MultOperation,
-    collect_secret_ids
+    SecretVector,
 )
+from log_utils import get_logger, log_event
 from message_utils import ShareMessage, SECRET_SHARE_LABEL, RESULT_SHARE_LABEL, ResultShareMessage, Message, \
-    PUBLISH_RESULT_LABEL, BEAVER_CONST_SHARE_LABEL, BeaverConstShareMessage, BEAVER_CONST_RESULT_LABEL, \
-    BeaverConstResultMessage
-from protocol import ProtocolSpec
+    PUBLISH_RESULT_LABEL, BEAVER_CONST_SHARE_LABEL, BeaverConstSharesMessage, BEAVER_CONST_RESULT_LABEL, \
+    BeaverConstResultsMessage
+from protocol import ProtocolSpec, OPENING_BROADCAST
 from secret_sharing import (
-    share_secret, Share, Constant, reconstruct_secret, FIELD_MODULUS, )
+    share_secrets, reconstruct_secrets, Share, Constant, reconstruct_secret, FIELD_MODULUS, ShareVector,
+    reconstruct_secret_vector, )
 from timeit import default_timer as timer
 
+LOG = get_logger("smc_party")
+
+# Protocol phases of the communication cost report, see SMCParty.communication_report.
+PHASE_SETUP = "setup"
+PHASE_SHARES = "shares"
+PHASE_TRIPLETS = "triplets"
+PHASE_CIRCUIT = "circuit"
+PHASE_RESULT = "result"
+
+T = TypeVar("T")
+
+# Public operand of the parties other than the leader when a secret is subtracted from a constant.
+ZERO = Constant(0)
+
 class SMCParty:
     """
     A client that executes an SMC protocol to collectively compute a value of an expression together
@@ -43,9 +61,12 @@ class SMCParty:
             server_host: str,
             server_port: int,
             protocol_spec: ProtocolSpec,
-            value_dict: Dict[Secret, int]
+            value_dict: Dict[Secret, Union[int, List[int]]]
     ):
-        self.comm = Communication(server_host, server_port, client_id)
+        self.comm = Communication(server_host, server_port, client_id, long_poll_timeout=DEFAULT_LONG_POLL_TIMEOUT,
+                                  session_id=protocol_spec.session_id)
+        # awaitable view of the same connections, used by run_async
+        self.async_comm = AsyncCommunication(self.comm)
 
         self.client_id = client_id
         self.protocol_spec = protocol_spec
@@ -53,16 +74,42 @@ class SMCParty:
         self.protocol_spec.participant_ids.sort()
         self.num_participants = len(self.protocol_spec.participant_ids)
         self.value_dict = value_dict
-        self.bytes_consumed = 0
+        self.codec = self.comm.codec
+        self.beaver_triplets: Dict[str, Tuple[Union[Share, ShareVector], ...]] = {}
         self.time_consumed = 0
 
-    def is_leader(self) -> bool:
-        """ Should the party do the operations that are done by one party exclusively. """
-        return self.client_id == self.protocol_spec.participant_ids[0]
+    @property
+    def bytes_consumed(self) -> int:
+        """ Number of bytes sent to and received from the server, see communication_report. """
+        return self.comm.metrics.bytes_sent + self.comm.metrics.bytes_received
 
-    def get_leader(self) -> str:
-        """ Returns the leader client id. """
-        return self.protocol_spec.participant_ids[0]
+    def communication_report(self) -> Dict[str, Dict[str, object]]:
+        """
+        Communication cost of the run per protocol phase (setup, shares, triplets, circuit, result) and in total:
+        requests, bytes sent and received, poll retries, time spent and request latencies.
+        """
+        return self.comm.metrics.report()
+
+    def is_leader(self, op_id: Optional[bytes] = None) -> bool:
+        """
+        Should the party do the operations that are done by one party exclusively: adding the public constants or,
+        for the provided operation id, opening its values (see get_leader).
+        """
+        return self.client_id == self.get_leader(op_id)
+
+    def get_leader(self, op_id: Optional[bytes] = None) -> str:
+        """
+        Returns the leader client id. Without an operation id, it is the first participant, which adds the public
+        constants. The leader that opens the values of an operation rotates over the participants with a hash of the
+        operation id, so that the openings are spread over all the parties.
+        """
+        if op_id is None:
+            return self.protocol_spec.participant_ids[0]
+        return self.protocol_spec.participant_ids[zlib.crc32(op_id) % self.num_participants]
+
+    def result_leader(self) -> str:
+        """ Returns the leader that opens the final result. """
+        return self.get_leader(self.protocol_spec.expr.id)
 
     def is_self(self, participant: str) -> bool:
         """ Is the current party the one with the provided client id. """
@@ -72,125 +119,441 @@ class SMCParty:
         """ Returns list of client ids of the other participants in the protocol. """
         return [participant for participant in self.protocol_spec.participant_ids if participant != self.client_id]
 
-    def get_personal_shares(self) -> Dict[bytes, list[Share]]:
-        """ Returns dict of personal secret ids as keys and list of shares as values. """
-        return {secret.id: share_secret(value, self.num_participants) for secret, value in self.value_dict.items()}
+    def get_personal_shares(self) -> Dict[bytes, list[Union[Share, ShareVector]]]:
+        """
+        Returns dict of personal secret ids as keys and list of shares as values. All the values (elements of vectors
+        included) are shared at once.
+        """
+        lengths = [len(value) if isinstance(secret, SecretVector) else 1 for secret, value in self.value_dict.items()]
+        values = [
+            element for secret, value in self.value_dict.items()
+            for element in (value if isinstance(secret, SecretVector) else [value])
+        ]
+        party_values = share_secrets(values, self.num_participants)
+
+        personal_shares = {}
+        offset = 0
+        for secret, length in zip(self.value_dict, lengths):
+            if isinstance(secret, SecretVector):
+                personal_shares[secret.id] = [ShareVector(party[offset:offset + length]) for party in party_values]
+            else:
+                personal_shares[secret.id] = [Share(party[offset]) for party in party_values]
+            offset += length
+        return personal_shares
 
     def disseminate_personal_shares(self, personal_shares: Dict[bytes, list[Share]]) -> Dict[bytes, Share]:
-        """ Disseminates shares of personal secrets to the other participants in the protocol. """
+        """
+        Disseminates shares of personal secrets to the other participants in the protocol, in a single request.
+        """
+        shares_dict, share_messages = self.split_personal_shares(personal_shares)
+        self.send_secret_shares(share_messages)
+        return shares_dict
+
+    def split_personal_shares(
+            self,
+            personal_shares: Dict[bytes, list[Share]]
+    ) -> Tuple[Dict[bytes, Share], List[Tuple[ShareMessage, str]]]:
+        """ Splits the shares of personal secrets into the party's own shares and the messages to the others. """
         shares_dict = {}
+        share_messages = []
         for i in range(self.num_participants):
             for (id, shares) in personal_shares.items():
                 if self.is_self(self.protocol_spec.participant_ids[i]):
                     shares_dict[id] = shares[i]
                 else:
-                    self.send_secret_share(ShareMessage(id, shares[i]), self.protocol_spec.participant_ids[i])
-        return shares_dict
+                    share_messages.append((ShareMessage(id, shares[i]), self.protocol_spec.participant_ids[i]))
+        return shares_dict, share_messages
 
     def collect_secret_ids_other_parties(self):
         """ Returns ids of all secrets in the expression except for the personal ones. """
-        personal_secret_ids = [secret.id for secret in self.value_dict.keys()]
-        all_secret_ids = collect_secret_ids(self.protocol_spec.expr)
+        personal_secret_ids = {secret.id for secret in self.value_dict.keys()}
+        all_secret_ids = self.protocol_spec.circuit.secret_ids
         return [secret_id for secret_id in all_secret_ids if secret_id not in personal_secret_ids]
 
-    def send_secret_share(self, share: ShareMessage, destination: str):
-        """ Sends a share to the provided destination. """
-        self.comm.send_private_message(destination, SECRET_SHARE_LABEL + share.id, share.serialize())
+    def send_secret_shares(self, shares: List[Tuple[ShareMessage, str]]):
+        """ Sends each share to its destination, in a single request. """
+        self.comm.send_private_messages(self.encode_secret_shares(shares))
 
-    def retrieve_secret_share(self, secret_id: str) -> ShareMessage:
-        """ Retrieves a share for the provided secret id. """
-        msg = self.comm.retrieve_private_message(SECRET_SHARE_LABEL + secret_id)
-        return ShareMessage.deserialize(msg)
+    def encode_secret_shares(self, shares: List[Tuple[ShareMessage, str]]) -> List[Tuple[str, str, bytes]]:
+        """ Returns the (destination, label, payload) private message of each share. """
+        return [
+            (destination, SECRET_SHARE_LABEL + share.id, self.codec.encode(share)) for share, destination in shares
+        ]
+
+    def retrieve_secret_shares(self, secret_ids: List[str]) -> List[ShareMessage]:
+        """ Retrieves the shares for the provided secret ids. """
+        msgs = self.comm.retrieve_private_messages([SECRET_SHARE_LABEL + secret_id for secret_id in secret_ids])
+        return [self.codec.decode(msg, ShareMessage) for msg in msgs]
 
     def send_result_share(self, share: ResultShareMessage, destination: str):
         """ Sends a share of the final result to the provided destination. """
-        self.comm.send_private_message(destination, RESULT_SHARE_LABEL + self.client_id, share.serialize())
+        self.comm.send_private_message(destination, RESULT_SHARE_LABEL + self.client_id, self.codec.encode(share))
 
-    def retrieve_result_share(self, participant: str) -> ResultShareMessage:
-        """ Retrieves a share of the final result from the provided participant. """
-        msg = self.comm.retrieve_private_message(RESULT_SHARE_LABEL + participant)
-        return ResultShareMessage.deserialize(msg)
+    def retrieve_result_shares(self, participants: List[str]) -> List[ResultShareMessage]:
+        """ Retrieves the shares of the final result from the provided participants. """
+        msgs = self.comm.retrieve_private_messages([RESULT_SHARE_LABEL + participant for participant in participants])
+        return [self.codec.decode(msg, ResultShareMessage) for msg in msgs]
 
     def publish_final_result(self, message: Message):
         """ Sends the final result as public message. """
-        self.comm.publish_message(PUBLISH_RESULT_LABEL, message.serialize())
+        self.comm.publish_message(PUBLISH_RESULT_LABEL, self.codec.encode(message))
 
     def retrieve_final_result(self, sender: str) -> Message:
         """ Retrieves the final result from the provided participant. """
         msg = self.comm.retrieve_public_message(sender, PUBLISH_RESULT_LABEL)
-        return Message.deserialize(msg)
-
-    def send_beaver_const_share(self, share: BeaverConstShareMessage, op_id: str, destination: str):
-        """ Sends shares of beaver constants for the provided operation id to the provided destination. """
-        self.comm.send_private_message(destination, BEAVER_CONST_SHARE_LABEL + op_id + "_" + self.client_id,
-                                       share.serialize())
-
-    def retrieve_beaver_const_share(self, op_id: str, participant: str) -> BeaverConstShareMessage:
-        """ Retrieves shares of beaver constants for the provided operation id from the provided participant. """
-        msg = self.comm.retrieve_private_message(BEAVER_CONST_SHARE_LABEL + op_id + "_" + participant)
-        self.bytes_consumed += len(msg)
-        return BeaverConstShareMessage.deserialize(msg)
-
-    def publish_beaver_const_result(self, message: BeaverConstResultMessage, op_id: str):
-        """ Sends the final beaver constants for the provided operation id as public message. """
-        self.comm.publish_message(BEAVER_CONST_RESULT_LABEL + op_id, message.serialize())
-
-    def retrieve_beaver_const_result(self, sender: str, op_id: str) -> BeaverConstResultMessage:
-        """ Retrieves the final beaver constants for the provided operation id from the provided participant. """
-        msg = self.comm.retrieve_public_message(sender, BEAVER_CONST_RESULT_LABEL + op_id)
-        self.bytes_consumed += len(msg)
-        return BeaverConstResultMessage.deserialize(msg)
-
-    def retrieve_beaver_triplets(self, op_id: str):
-        """ Retrieves the shares of beaver triplets for the provided operation id. """
-        triplets = self.comm.retrieve_beaver_triplet_shares(op_id)
-        self.bytes_consumed += triplets.__sizeof__()
+        return self.codec.decode(msg, Message)
+
+    def publish_result_share(self, share: ResultShareMessage):
+        """ Sends the share of the final result as public message, for the broadcast opening. """
+        self.comm.publish_message(RESULT_SHARE_LABEL, self.codec.encode(share))
+
+    def retrieve_published_result_shares(self, participants: List[str]) -> List[ResultShareMessage]:
+        """ Retrieves the published shares of the final result of the provided participants. """
+        msgs = self.comm.retrieve_public_messages([(participant, RESULT_SHARE_LABEL) for participant in participants])
+        return [self.codec.decode(msg, ResultShareMessage) for msg in msgs]
+
+    def send_beaver_const_shares(self, shares: Dict[str, BeaverConstSharesMessage], opening: int):
+        """
+        Sends shares of beaver constants for the provided opening to each of the provided destinations, in a single
+        request. An opening is identified by its level in execute_circuit and by its batch in execute_circuit_async.
+        """
+        self.comm.send_private_messages(self.encode_beaver_const_shares(shares, opening))
+
+    def encode_beaver_const_shares(
+            self,
+            shares: Dict[str, BeaverConstSharesMessage],
+            opening: int
+    ) -> List[Tuple[str, str, bytes]]:
+        """ Returns the (destination, label, payload) private message of the shares of each destination. """
+        return [
+            (destination, self.beaver_const_share_label(opening, self.client_id), self.codec.encode(message))
+            for destination, message in shares.items()
+        ]
+
+    @staticmethod
+    def beaver_const_share_label(opening: int, sender: str) -> str:
+        """ Label of the shares of beaver constants for the provided opening that sender sends to a leader. """
+        return BEAVER_CONST_SHARE_LABEL + str(opening) + "_" + sender
+
+    @staticmethod
+    def beaver_const_share_channels(opening: int, participants: List[str]) -> List[Tuple[str, str]]:
+        """ Channels of the shares of beaver constants for the provided opening published by the participants. """
+        return [(participant, BEAVER_CONST_SHARE_LABEL + str(opening)) for participant in participants]
+
+    @staticmethod
+    def beaver_const_result_channels(opening: int, leaders: List[str]) -> List[Tuple[str, str]]:
+        """ Channels of the beaver constants for the provided opening published by the leaders. """
+        return [(leader, BEAVER_CONST_RESULT_LABEL + str(opening)) for leader in leaders]
+
+    def decode_messages(self, msgs: List[bytes], message_type: type) -> list:
+        """ Decodes the provided payloads into messages of the provided type. """
+        return [self.codec.decode(msg, message_type) for msg in msgs]
+
+    def retrieve_beaver_const_shares(self, opening: int, participants: List[str]) -> List[BeaverConstSharesMessage]:
+        """ Retrieves shares of beaver constants for the provided opening from the provided participants. """
+        msgs = self.comm.retrieve_private_messages([
+            self.beaver_const_share_label(opening, participant) for participant in participants
+        ])
+        return self.decode_messages(msgs, BeaverConstSharesMessage)
+
+    def publish_beaver_const_shares(self, shares: BeaverConstSharesMessage, opening: int):
+        """ Sends shares of beaver constants for the provided opening as public message. """
+        self.comm.publish_message(BEAVER_CONST_SHARE_LABEL + str(opening), self.codec.encode(shares))
+
+    def retrieve_published_beaver_const_shares(
+            self,
+            opening: int,
+            participants: List[str]
+    ) -> List[BeaverConstSharesMessage]:
+        """
+        Retrieves the published shares of beaver constants for the provided opening of the provided participants.
+        """
+        msgs = self.comm.retrieve_public_messages(self.beaver_const_share_channels(opening, participants))
+        return self.decode_messages(msgs, BeaverConstSharesMessage)
+
+    def publish_beaver_const_results(self, message: BeaverConstResultsMessage, opening: int):
+        """ Sends the final beaver constants for the provided opening as public message. """
+        self.comm.publish_message(BEAVER_CONST_RESULT_LABEL + str(opening), self.codec.encode(message))
+
+    def retrieve_beaver_const_results(self, senders: List[str], opening: int) -> List[BeaverConstResultsMessage]:
+        """ Retrieves the final beaver constants for the provided opening from the provided participants. """
+        msgs = self.comm.retrieve_public_messages(self.beaver_const_result_channels(opening, senders))
+        return self.decode_messages(msgs, BeaverConstResultsMessage)
+
+    def retrieve_beaver_triplets(self, op_ids: List[str], lengths: List[int]):
+        """
+        Retrieves the shares of beaver triplets for the provided operation ids (on vectors of the provided lengths),
+        in a single request.
+        """
+        triplets = self.comm.retrieve_all_beaver_triplet_shares(op_ids, lengths)
         return triplets
 
+    def preprocess_beaver_triplets(self, op_ids: List[bytes], lengths: List[int]):
+        """
+        Offline phase: downloads the beaver triplets of all the provided multiplications of secrets (on vectors of the
+        provided lengths) that are not downloaded yet, so that the evaluation never has to ask the trusted server.
+        """
+        op_ids, lengths = self.missing_beaver_triplets(op_ids, lengths)
+        for op_id, triplet in zip(op_ids, self.retrieve_beaver_triplets(op_ids, lengths)):
+            self.beaver_triplets[op_id] = triplet
+
+    def missing_beaver_triplets(self, op_ids: List[bytes], lengths: List[int]) -> Tuple[List[str], List[int]]:
+        """ Returns the operation ids and lengths of the provided multiplications that have no triplet yet. """
+        missing = [(op_id.decode(), length) for op_id, length in zip(op_ids, lengths)
+                   if op_id.decode() not in self.beaver_triplets]
+        return [op_id for op_id, _ in missing], [length for _, length in missing]
+
     def run(self) -> int:
         """
         The method the client use to do the SMC.
         """
+        with self.comm.phase(PHASE_SETUP):
+            self.codec = self.comm.negotiate_codec(self.protocol_spec.wire_format)
         expression = self.protocol_spec.expr
         personal_shares = self.get_personal_shares()
-        # send personal shares and create map of secret Share(s) per ID
-        shares_dict = self.disseminate_personal_shares(personal_shares)
+        with self.comm.phase(PHASE_SHARES):
+            # send personal shares and create map of secret Share(s) per ID
+            shares_dict = self.disseminate_personal_shares(personal_shares)
 
-        secret_ids_to_receive = self.collect_secret_ids_other_parties()
-        for sid in secret_ids_to_receive:
-            secret_share = self.retrieve_secret_share(sid.decode())
-            shares_dict[secret_share.id.encode()] = secret_share.share
+            secret_ids_to_receive = self.collect_secret_ids_other_parties()
+            for secret_share in self.retrieve_secret_shares([sid.decode() for sid in secret_ids_to_receive]):
+                shares_dict[secret_share.id.encode()] = secret_share.share
+
+        # offline phase
+        circuit = self.protocol_spec.circuit
+        with self.comm.phase(PHASE_TRIPLETS):
+            self.preprocess_beaver_triplets(circuit.op_ids, circuit.op_lengths())
 
         # process locally
         start = timer()
-        final_result_share = self.process_expression(expression, shares_dict)
+        with self.comm.phase(PHASE_CIRCUIT):
+            final_result_share = self.process_expression(expression, shares_dict)
         end = timer()
         self.time_consumed = end - start
+        log_event(LOG, logging.INFO, "circuit.executed", client=self.client_id, seconds=self.time_consumed,
+                  multiplications=len(circuit.op_ids))
 
         # edge case where the expression to be computed consists of scalars only.
         # every party will have the same result share, so we can just return it.
         if isinstance(final_result_share, Constant):
+            with self.comm.phase(PHASE_RESULT):
+                self.comm.finish()
             return final_result_share.value
+        # expressions involving a SecretVector result in a list of values
+        reconstruct = reconstruct_secret_vector if isinstance(final_result_share, ShareVector) else reconstruct_secret
+
+        with self.comm.phase(PHASE_RESULT):
+            if self.protocol_spec.opening == OPENING_BROADCAST:
+                # every party publishes its result share and reconstructs the result itself
+                self.publish_result_share(ResultShareMessage(final_result_share))
+                other_result_shares = self.retrieve_published_result_shares(self.get_other_participants_list())
+                result = reconstruct([final_result_share] + [share.share for share in other_result_shares])
+                self.comm.finish()
+                return result
+
+            leader = self.result_leader()
+            # protocol phase one
+            all_result_shares = [final_result_share]
+            if not self.is_self(leader):
+                self.send_result_share(ResultShareMessage(final_result_share), leader)
+            else:
+                other_participants = self.get_other_participants_list()
+                for result_share in self.retrieve_result_shares(other_participants):
+                    all_result_shares.append(result_share.share)
 
-        # protocol phase one
-        all_result_shares = [final_result_share]
-        if not self.is_leader():
-            self.send_result_share(ResultShareMessage(final_result_share), self.get_leader())
-        else:
-            other_participants = self.get_other_participants_list()
-            for participant in other_participants:
-                all_result_shares.append(self.retrieve_result_share(participant).share)
+            # protocol phase two
+            if self.is_self(leader):
+                result = reconstruct(all_result_shares)
+                self.publish_final_result(Message(result))
+            else:
+                result = self.retrieve_final_result(leader).value
+            self.comm.finish()
+        return result
 
-        # protocol phase two
-        if self.is_leader():
-            result = reconstruct_secret(all_result_shares)
-            self.publish_final_result(Message(result))
-            return result
+    async def run_async(self) -> int:
+        """
+        Asynchronous variant of run, over the blocking requests run in worker threads (see AsyncCommunication). The
+        requests that do not depend on each other overlap: the personal shares are sent while the other parties'
+        shares and the beaver triplets are downloaded, and the circuit is executed by dataflow, so that independent
+        parts of the expression proceed while the openings of the others are in flight (see execute_circuit_async).
+        """
+        with self.async_comm.phase(PHASE_SETUP):
+            self.codec = await self.async_comm.negotiate_codec(self.protocol_spec.wire_format)
+        circuit = self.protocol_spec.circuit
+        shares_dict, share_messages = self.split_personal_shares(self.get_personal_shares())
+        secret_ids_to_receive = [sid.decode() for sid in self.collect_secret_ids_other_parties()]
+
+        _, received_shares, _ = await asyncio.gather(
+            self.in_phase(PHASE_SHARES,
+                          self.async_comm.send_private_messages(self.encode_secret_shares(share_messages))),
+            self.in_phase(PHASE_SHARES, self.async_comm.retrieve_private_messages(
+                [SECRET_SHARE_LABEL + sid for sid in secret_ids_to_receive])),
+            self.in_phase(PHASE_TRIPLETS, self.preprocess_beaver_triplets_async(circuit.op_ids, circuit.op_lengths())),
+        )
+        for msg in received_shares:
+            secret_share = self.codec.decode(msg, ShareMessage)
+            shares_dict[secret_share.id.encode()] = secret_share.share
+
+        start = timer()
+        with self.async_comm.phase(PHASE_CIRCUIT):
+            final_result_share = await self.execute_circuit_async(circuit, shares_dict)
+        end = timer()
+        self.time_consumed = end - start
+        log_event(LOG, logging.INFO, "circuit.executed", client=self.client_id, seconds=self.time_consumed,
+                  multiplications=len(circuit.op_ids))
+
+        with self.async_comm.phase(PHASE_RESULT):
+            return await self.open_result_async(final_result_share)
+
+    async def open_result_async(self, final_result_share: Union[Share, ShareVector, Constant]) -> int:
+        """
+        Reconstructs the result from the final shares of all the parties, then tells the server the run is over.
+        """
+        if isinstance(final_result_share, Constant):
+            await self.async_comm.finish()
+            return final_result_share.value
+        reconstruct = reconstruct_secret_vector if isinstance(final_result_share, ShareVector) else reconstruct_secret
+
+        if self.protocol_spec.opening == OPENING_BROADCAST:
+            _, msgs = await asyncio.gather(
+                self.async_comm.publish_message(RESULT_SHARE_LABEL,
+                                                self.codec.encode(ResultShareMessage(final_result_share))),
+                self.async_comm.retrieve_public_messages([
+                    (participant, RESULT_SHARE_LABEL) for participant in self.get_other_participants_list()
+                ]),
+            )
+            await self.async_comm.finish()
+            other_result_shares = [self.codec.decode(msg, ResultShareMessage).share for msg in msgs]
+            return reconstruct([final_result_share] + other_result_shares)
+
+        leader = self.result_leader()
+        if not self.is_self(leader):
+            # the final result is asked for while the result share is being sent
+            _, msg = await asyncio.gather(
+                self.async_comm.send_private_message(leader, RESULT_SHARE_LABEL + self.client_id,
+                                                     self.codec.encode(ResultShareMessage(final_result_share))),
+                self.async_comm.retrieve_public_message(leader, PUBLISH_RESULT_LABEL),
+            )
+            await self.async_comm.finish()
+            return self.codec.decode(msg, Message).value
+
+        msgs = await self.async_comm.retrieve_private_messages([
+            RESULT_SHARE_LABEL + participant for participant in self.get_other_participants_list()
+        ])
+        all_result_shares = [final_result_share] + [self.codec.decode(msg, ResultShareMessage).share for msg in msgs]
+        result = reconstruct(all_result_shares)
+        await self.async_comm.publish_message(PUBLISH_RESULT_LABEL, self.codec.encode(Message(result)))
+        await self.async_comm.finish()
+        return result
+
+    async def in_phase(self, phase: str, awaitable: Awaitable[T]) -> T:
+        """ Awaits the provided awaitable with its requests attributed to the provided phase. """
+        with self.async_comm.phase(phase):
+            return await awaitable
+
+    async def preprocess_beaver_triplets_async(self, op_ids: List[bytes], lengths: List[int]):
+        """ Asynchronous variant of preprocess_beaver_triplets. """
+        op_ids, lengths = self.missing_beaver_triplets(op_ids, lengths)
+        triplets = await self.async_comm.retrieve_all_beaver_triplet_shares(op_ids, lengths)
+        for op_id, triplet in zip(op_ids, triplets):
+            self.beaver_triplets[op_id] = triplet
+
+    async def execute_circuit_async(
+            self,
+            circuit: Circuit,
+            shares: Dict[bytes, Share]
+    ):
+        """
+        Asynchronous variant of execute_circuit, scheduled by dataflow instead of level by level (see
+        DataflowSchedule): each batch of multiplications is opened as soon as the batches it waits for are open, and
+        each local instruction is executed as soon as its operands are computed. With the leader strategy, the
+        multiplications of a batch have the same leader, so a slow leader only delays the parts of the expression
+        that depend on its openings.
+        """
+        await self.preprocess_beaver_triplets_async(circuit.op_ids, circuit.op_lengths())
+
+        if self.protocol_spec.opening == OPENING_BROADCAST:
+            schedule = DataflowSchedule(circuit)
         else:
-            result_deserialized = self.retrieve_final_result(self.get_leader())
-            return result_deserialized.value
+            schedule = DataflowSchedule(circuit, lambda register: self.multiplication_leader(circuit, register))
+        registers: List[Union[Share, ShareVector, Constant, None]] = [None] * len(circuit)
+        self.execute_local_instructions(circuit, schedule.ready, registers, shares)
+        # number of batches each group of local instructions still waits for
+        counts = list(schedule.counts)
+        tasks: List[asyncio.Task] = []
+
+        async def open_batch(batch: int):
+            await asyncio.gather(*(tasks[dependency] for dependency in schedule.dependencies[batch]))
+            beaver_registers = schedule.batches[batch]
+            log_event(LOG, logging.DEBUG, "batch.open", client=self.client_id, batch=batch,
+                      multiplications=len(beaver_registers))
+            x_const_shares, y_const_shares = self.beaver_const_shares(circuit, beaver_registers, registers)
+            leaders = self.beaver_const_leaders(circuit, beaver_registers)
+            x_consts, y_consts = await self.open_beaver_constants_async(batch, x_const_shares, y_const_shares, leaders)
+            self.finish_multiplication_level(circuit, beaver_registers, registers, x_consts, y_consts)
+            # the local instructions are executed before the batch is done, so they are computed for the batches
+            # waiting for this one
+            ready = []
+            for group in schedule.releases[batch]:
+                counts[group] -= 1
+                if counts[group] == 0:
+                    ready.extend(schedule.groups[group])
+            self.execute_local_instructions(circuit, sorted(ready), registers, shares)
+
+        tasks.extend(asyncio.ensure_future(open_batch(batch)) for batch in range(len(schedule)))
+        await asyncio.gather(*tasks)
+        return registers[circuit.output]
+
+    async def open_beaver_constants_async(
+            self,
+            opening: int,
+            x_const_shares: List[Share],
+            y_const_shares: List[Share],
+            leaders: Optional[List[str]] = None
+    ) -> Tuple[List[int], List[int]]:
+        """
+        Asynchronous variant of open_beaver_constants. The shares are sent (or published) while the constants are
+        retrieved, and a leader opens its own constants while it waits for those of the other leaders.
+        """
+        if self.protocol_spec.opening == OPENING_BROADCAST:
+            _, msgs = await asyncio.gather(
+                self.async_comm.publish_message(
+                    BEAVER_CONST_SHARE_LABEL + str(opening),
+                    self.codec.encode(BeaverConstSharesMessage(x_const_shares, y_const_shares))),
+                self.async_comm.retrieve_public_messages(
+                    self.beaver_const_share_channels(opening, self.get_other_participants_list())),
+            )
+            other_shares = self.decode_messages(msgs, BeaverConstSharesMessage)
+            return self.reconstruct_beaver_constants(x_const_shares, y_const_shares, other_shares)
+
+        groups = self.group_by_leader(leaders or [self.get_leader()] * len(x_const_shares))
+        other_leaders = [leader for leader in groups if not self.is_self(leader)]
+
+        async def lead() -> Optional[BeaverConstResultsMessage]:
+            if self.client_id not in groups:
+                return None
+            msgs = await self.async_comm.retrieve_private_messages([
+                self.beaver_const_share_label(opening, participant)
+                for participant in self.get_other_participants_list()
+            ])
+            results = self.lead_beaver_constants(groups, x_const_shares, y_const_shares,
+                                                 self.decode_messages(msgs, BeaverConstSharesMessage))
+            await self.async_comm.publish_message(BEAVER_CONST_RESULT_LABEL + str(opening),
+                                                  self.codec.encode(results))
+            return results
+
+        # the shares are sent to the other leaders while this party opens its own constants and waits for theirs
+        _, own_results, msgs = await asyncio.gather(
+            self.async_comm.send_private_messages(self.encode_beaver_const_shares(
+                self.beaver_const_shares_by_leader(groups, x_const_shares, y_const_shares), opening)),
+            lead(),
+            self.async_comm.retrieve_public_messages(self.beaver_const_result_channels(opening, other_leaders)),
+        )
+        results = dict(zip(other_leaders, self.decode_messages(msgs, BeaverConstResultsMessage)))
+        if own_results is not None:
+            results[self.client_id] = own_results
+        return self.merge_beaver_const_results(groups, results, len(x_const_shares))
 
-    # Suggestion: To process expressions, make use of the *visitor pattern* like so:
     def process_expression(
             self,
             expr: Expression,
@@ -200,68 +563,256 @@ class SMCParty:
         Processes an expression and returns party's share. Possibly includes communication in case of multiplication of
         secrets.
         """
-        # Complex operation
-        if isinstance(expr, AddOperation):
-            left_addend = self.process_expression(expr.left, shares)
-            right_addend = self.process_expression(expr.right, shares)
-            if isinstance(left_addend, Share) and isinstance(right_addend, Constant):
-                if self.is_leader():
-                    return left_addend + right_addend
-                else:
-                    return left_addend
-            elif isinstance(left_addend, Constant) and isinstance(right_addend, Share):
-                if self.is_leader():
-                    return left_addend + right_addend
-                else:
-                    return right_addend
+        # the protocol's own expression is already compiled
+        circuit = self.protocol_spec.circuit if expr is self.protocol_spec.expr else compile_expression(expr)
+        return self.execute_circuit(circuit, shares)
+
+    def execute_circuit(
+            self,
+            circuit: Circuit,
+            shares: Dict[bytes, Share]
+    ):
+        """
+        Executes a compiled expression and returns party's share. Multiplications of secrets are executed level by
+        level and the beaver constants of a whole level are opened in a single exchange, so the number of
+        communication rounds follows the depth of the expression and not the number of multiplications.
+        """
+        self.preprocess_beaver_triplets(circuit.op_ids, circuit.op_lengths())
+
+        registers: List[Union[Share, ShareVector, Constant, None]] = [None] * len(circuit)
+        for level in range(circuit.num_levels):
+            beaver_registers, local_registers = circuit.level(level)
+            if beaver_registers:
+                self.process_multiplication_level(level, circuit, beaver_registers, registers)
+            self.execute_local_instructions(circuit, local_registers, registers, shares)
+        return registers[circuit.output]
+
+    def execute_local_instructions(
+            self,
+            circuit: Circuit,
+            local_registers: Sequence[int],
+            registers: List[Union[Share, ShareVector, Constant, None]],
+            shares: Dict[bytes, Share]
+    ):
+        """ Executes the instructions of a level that need no communication. """
+        opcodes, left, right, args = circuit.opcodes, circuit.left, circuit.right, circuit.args
+        secret_ids, scalars = circuit.secret_ids, circuit.scalars
+        is_leader = self.is_leader()
+        for i in local_registers:
+            opcode = opcodes[i]
+            if opcode == OP_ADD:
+                registers[i] = registers[left[i]] + registers[right[i]]
+            elif opcode == OP_ADD_CONSTANT:
+                # a constant is added by the leader only, otherwise it would be counted once per party
+                registers[i] = registers[left[i]] + registers[right[i]] if is_leader else registers[left[i]]
+            elif opcode == OP_SUB:
+                registers[i] = registers[left[i]] - registers[right[i]]
+            elif opcode == OP_SUB_CONSTANT:
+                registers[i] = registers[left[i]] - registers[right[i]] if is_leader else registers[left[i]]
+            elif opcode == OP_CONSTANT_SUB:
+                registers[i] = (registers[left[i]] if is_leader else ZERO) - registers[right[i]]
+            elif opcode == OP_MULT:
+                registers[i] = registers[left[i]] * registers[right[i]]
+            elif opcode == OP_SECRET:
+                registers[i] = shares[secret_ids[args[i]]]
+            elif opcode == OP_SCALAR:
+                registers[i] = Constant(scalars[args[i]])
             else:
-                return left_addend + right_addend
-        elif isinstance(expr, MultOperation):
-            left_multiplier = self.process_expression(expr.left, shares)
-            right_multiplier = self.process_expression(expr.right, shares)
-            if isinstance(left_multiplier, Share) and isinstance(right_multiplier, Share):
-                # use beaver triplets
-                op_id = expr.id.decode()
-                other_participants = self.get_other_participants_list()
-                (a_share, b_share, c_share) = self.retrieve_beaver_triplets(op_id)
-                x_const_share = left_multiplier - a_share
-                y_const_share = right_multiplier - b_share
-
-                # exchange beaver constant shares
-                all_x_const_shares = [x_const_share]
-                all_y_const_shares = [y_const_share]
-                if not self.is_leader():
-                    self.send_beaver_const_share(BeaverConstShareMessage(x_const_share, y_const_share), op_id,
-                                                 self.get_leader())
-                else:
-                    for participant in other_participants:
-                        beaver_const_share = self.retrieve_beaver_const_share(op_id, participant)
-                        all_x_const_shares.append(beaver_const_share.x_part)
-                        all_y_const_shares.append(beaver_const_share.y_part)
-
-                # exchange final beaver constants
-                if self.is_leader():
-                    x_const = reconstruct_secret(all_x_const_shares)
-                    y_const = reconstruct_secret(all_y_const_shares)
-                    self.publish_beaver_const_result(BeaverConstResultMessage(x_const, y_const), op_id)
-                else:
-                    result_deserialized = self.retrieve_beaver_const_result(self.get_leader(), op_id)
-                    x_const = result_deserialized.x_part
-                    y_const = result_deserialized.y_part
+                raise ValueError(f"Unsupported instruction {opcode}")
 
-                # compute and return share
-                return self.compute_secret_multiplication_share(left_multiplier, right_multiplier, c_share, x_const,
-                                                                y_const)
+    def process_multiplication_level(
+            self,
+            level: int,
+            circuit: Circuit,
+            beaver_registers: Sequence[int],
+            registers: List[Union[Share, ShareVector, Constant, None]]
+    ):
+        """
+        Computes the shares of all multiplications of secrets of one level with beaver triplets.
+        The operands only depend on lower levels, which are already stored in registers.
+        """
+        log_event(LOG, logging.DEBUG, "level.open", client=self.client_id, level=level,
+                  multiplications=len(beaver_registers))
+        x_const_shares, y_const_shares = self.beaver_const_shares(circuit, beaver_registers, registers)
+        leaders = self.beaver_const_leaders(circuit, beaver_registers)
+        x_consts, y_consts = self.open_beaver_constants(level, x_const_shares, y_const_shares, leaders)
+        self.finish_multiplication_level(circuit, beaver_registers, registers, x_consts, y_consts)
+
+    def beaver_const_shares(
+            self,
+            circuit: Circuit,
+            beaver_registers: Sequence[int],
+            registers: List[Union[Share, ShareVector, Constant, None]]
+    ) -> Tuple[List[Share], List[Share]]:
+        """
+        Returns this party's shares of the beaver constants x - a and y - b of all multiplications of secrets of one
+        level. The elements of vector multiplications are flattened, so they are opened with the other multiplications.
+        """
+        x_const_shares = []
+        y_const_shares = []
+        for i in beaver_registers:
+            a_share, b_share, _ = self.beaver_triplets[circuit.op_ids[circuit.args[i]].decode()]
+            x_const_shares.append(registers[circuit.left[i]] - a_share)
+            y_const_shares.append(registers[circuit.right[i]] - b_share)
+        return self.flatten_shares(x_const_shares), self.flatten_shares(y_const_shares)
+
+    def beaver_const_leaders(self, circuit: Circuit, beaver_registers: Sequence[int]) -> List[str]:
+        """
+        Returns the leader opening each beaver constant of one level, in the order of beaver_const_shares: the leader
+        of the multiplication, for each of its elements.
+        """
+        leaders = []
+        for i in beaver_registers:
+            leaders.extend([self.multiplication_leader(circuit, i)] * circuit.lengths[i])
+        return leaders
+
+    def multiplication_leader(self, circuit: Circuit, register: int) -> str:
+        """ Returns the leader opening the beaver constants of the multiplication of secrets of a register. """
+        return self.get_leader(circuit.op_ids[circuit.args[register]])
+
+    def group_by_leader(self, leaders: List[str]) -> Dict[str, List[int]]:
+        """ Returns the indices of the beaver constants opened by each leader, in the order of the participants. """
+        groups: Dict[str, List[int]] = {leader: [] for leader in self.protocol_spec.participant_ids}
+        for i, leader in enumerate(leaders):
+            groups[leader].append(i)
+        return {leader: indices for leader, indices in groups.items() if indices}
+
+    def beaver_const_shares_by_leader(
+            self,
+            groups: Dict[str, List[int]],
+            x_const_shares: List[Share],
+            y_const_shares: List[Share]
+    ) -> Dict[str, BeaverConstSharesMessage]:
+        """ Returns the shares of beaver constants to send to each of the other leaders. """
+        return {
+            leader: BeaverConstSharesMessage([x_const_shares[i] for i in indices], [y_const_shares[i] for i in indices])
+            for leader, indices in groups.items() if not self.is_self(leader)
+        }
+
+    def lead_beaver_constants(
+            self,
+            groups: Dict[str, List[int]],
+            x_const_shares: List[Share],
+            y_const_shares: List[Share],
+            other_shares: List[BeaverConstSharesMessage]
+    ) -> BeaverConstResultsMessage:
+        """
+        Reconstructs the beaver constants this party leads from its own shares and the shares the other parties sent
+        it, see beaver_const_shares_by_leader.
+        """
+        own = groups[self.client_id]
+        return BeaverConstResultsMessage(*self.reconstruct_beaver_constants(
+            [x_const_shares[i] for i in own], [y_const_shares[i] for i in own], other_shares))
+
+    @staticmethod
+    def merge_beaver_const_results(
+            groups: Dict[str, List[int]],
+            results: Dict[str, BeaverConstResultsMessage],
+            count: int
+    ) -> Tuple[List[int], List[int]]:
+        """ Puts the beaver constants opened by each leader back in the order of the level. """
+        x_consts = [0] * count
+        y_consts = [0] * count
+        for leader, indices in groups.items():
+            for j, i in enumerate(indices):
+                x_consts[i] = results[leader].x_parts[j]
+                y_consts[i] = results[leader].y_parts[j]
+        return x_consts, y_consts
+
+    def finish_multiplication_level(
+            self,
+            circuit: Circuit,
+            beaver_registers: Sequence[int],
+            registers: List[Union[Share, ShareVector, Constant, None]],
+            x_consts: List[int],
+            y_consts: List[int]
+    ):
+        """
+        Computes the shares of all multiplications of secrets of one level (or batch, see execute_circuit_async) once
+        its beaver constants are open.
+        """
+        left_multipliers = [registers[circuit.left[i]] for i in beaver_registers]
+        right_multipliers = [registers[circuit.right[i]] for i in beaver_registers]
+        triplets = [self.beaver_triplets[circuit.op_ids[circuit.args[i]].decode()] for i in beaver_registers]
+        lengths = [circuit.lengths[i] for i in beaver_registers]
+        x_consts = self.split_values(x_consts, lengths)
+        y_consts = self.split_values(y_consts, lengths)
+
+        for j, i in enumerate(beaver_registers):
+            if lengths[j] == 1:
+                registers[i] = self.compute_secret_multiplication_share(
+                    left_multipliers[j], right_multipliers[j], triplets[j][2], x_consts[j], y_consts[j])
             else:
-                return left_multiplier * right_multiplier
-        # Secret
-        elif isinstance(expr, Secret):
-            return shares[expr.id]
-        # Scalar
-        elif isinstance(expr, Scalar):
-            return Constant(expr.value)
-        else:
-            raise ValueError("Unsupported expression type")
+                registers[i] = self.compute_secret_vector_multiplication_share(
+                    left_multipliers[j], right_multipliers[j], triplets[j][2], x_consts[j], y_consts[j])
+
+    @staticmethod
+    def flatten_shares(shares: List[Union[Share, ShareVector]]) -> List[Share]:
+        """ Returns the shares with every ShareVector replaced by the shares of its elements. """
+        flat_shares = []
+        for share in shares:
+            if isinstance(share, ShareVector):
+                flat_shares.extend(Share(value) for value in share.values)
+            else:
+                flat_shares.append(share)
+        return flat_shares
+
+    @staticmethod
+    def split_values(values: List[int], lengths: List[int]) -> List[Union[int, List[int]]]:
+        """ Splits flat values into one value (length 1) or one list of values (longer lengths) per length. """
+        split = []
+        offset = 0
+        for length in lengths:
+            split.append(values[offset] if length == 1 else values[offset:offset + length])
+            offset += length
+        return split
+
+    def open_beaver_constants(
+            self,
+            level: int,
+            x_const_shares: List[Share],
+            y_const_shares: List[Share],
+            leaders: Optional[List[str]] = None
+    ) -> Tuple[List[int], List[int]]:
+        """
+        Reconstructs the beaver constants of all multiplications of one level, see ProtocolSpec.opening: in a single
+        exchange with the leaders, or locally from the shares that every party broadcasts.
+        With the leader strategy, each constant is opened by its leader (default: the first participant). A party
+        sends its shares to every other leader in one request, opens the constants it leads, then gets the other
+        constants from their leaders in one request.
+        """
+        if self.protocol_spec.opening == OPENING_BROADCAST:
+            self.publish_beaver_const_shares(BeaverConstSharesMessage(x_const_shares, y_const_shares), level)
+            other_shares = self.retrieve_published_beaver_const_shares(level, self.get_other_participants_list())
+            return self.reconstruct_beaver_constants(x_const_shares, y_const_shares, other_shares)
+
+        groups = self.group_by_leader(leaders or [self.get_leader()] * len(x_const_shares))
+        self.send_beaver_const_shares(self.beaver_const_shares_by_leader(groups, x_const_shares, y_const_shares), level)
+
+        results = {}
+        if self.client_id in groups:
+            other_shares = self.retrieve_beaver_const_shares(level, self.get_other_participants_list())
+            results[self.client_id] = self.lead_beaver_constants(groups, x_const_shares, y_const_shares, other_shares)
+            self.publish_beaver_const_results(results[self.client_id], level)
+
+        other_leaders = [leader for leader in groups if not self.is_self(leader)]
+        results.update(zip(other_leaders, self.retrieve_beaver_const_results(other_leaders, level)))
+        return self.merge_beaver_const_results(groups, results, len(x_const_shares))
+
+    @staticmethod
+    def reconstruct_beaver_constants(
+            x_const_shares: List[Share],
+            y_const_shares: List[Share],
+            other_shares: List[BeaverConstSharesMessage]
+    ) -> Tuple[List[int], List[int]]:
+        """ Reconstructs the beaver constants from the party's own shares and the other parties' shares. """
+        x_consts = reconstruct_secrets([[share.value for share in x_const_shares]] + [
+            [share.value for share in beaver_const_shares.x_parts] for beaver_const_shares in other_shares
+        ])
+        y_consts = reconstruct_secrets([[share.value for share in y_const_shares]] + [
+            [share.value for share in beaver_const_shares.y_parts] for beaver_const_shares in other_shares
+        ])
+        return x_consts, y_consts
 
     def compute_secret_multiplication_share(self, left_multiplier: Share, right_multiplier: Share, c_share: Share,
                                             x_const: int, y_const: int):
@@ -274,3 +825,28 @@ class SMCParty:
             return Share((base_value - ((x_const * y_const) % FIELD_MODULUS)) % FIELD_MODULUS)
         else:
             return Share(base_value)
+
+    def compute_secret_vector_multiplication_share(
+            self,
+            left_multiplier: Union[Share, ShareVector],
+            right_multiplier: Union[Share, ShareVector],
+            c_share: ShareVector,
+            x_consts: List[int],
+            y_consts: List[int]
+    ) -> ShareVector:
+        """
+        Locally computes the final share of an element-wise secret multiplication. A Share multiplier is broadcast to
+        every element.
+        """
+        length = len(c_share)
+        left_values = left_multiplier.values if isinstance(left_multiplier, ShareVector) \
+            else [left_multiplier.value] * length
+        right_values = right_multiplier.values if isinstance(right_multiplier, ShareVector) \
+            else [right_multiplier.value] * length
+        values = [
+            c + left * y_const + right * x_const
+            for c, left, right, x_const, y_const in zip(c_share.values, left_values, right_values, x_consts, y_consts)
+        ]
+        if self.is_leader():
+            values = [value - x_const * y_const for value, x_const, y_const in zip(values, x_consts, y_consts)]
+        return ShareVector(values)
@@ -0,0 +1,40 @@
+"""
+Tests of the benchmark harness.
+"""
+import csv
+import json
+
+import pytest
+
+import benchmark
+
+
+def test_confidence_interval():
+    assert benchmark.confidence_interval([2.0]) == (2.0, 2.0, 2.0)
+    mean, low, high = benchmark.confidence_interval([1.0, 2.0, 3.0])
+    assert mean == 2.0
+    assert high - mean == pytest.approx(4.303 / 3 ** 0.5)
+    assert mean - low == pytest.approx(high - mean)
+
+
+def test_benchmark(tmp_path):
+    records = benchmark.main([
+        "--experiment", "multiplications", "parties", "--values", "3", "--repeats", "2",
+        "--opening", "leader", "broadcast",
+        "--json", str(tmp_path / "results.json"), "--csv", str(tmp_path / "results.csv"),
+    ])
+    assert [(record["experiment"], record["opening"], record["parties"]) for record in records] == [
+        ("multiplications", "leader", 2), ("multiplications", "broadcast", 2),
+        ("parties", "leader", 3), ("parties", "broadcast", 3),
+    ]
+    for record in records:
+        assert record["repeats"] == 2
+        assert record["bytes"]["ci95_low"] <= record["bytes"]["mean"] <= record["bytes"]["ci95_high"]
+        assert record["wall_s"]["mean"] > 0
+        assert record["rounds"]["mean"] >= 2
+    assert json.loads((tmp_path / "results.json").read_text()) == records
+    with open(tmp_path / "results.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [int(row["value"]) for row in rows] == [3, 3, 3, 3]
+    assert float(rows[0]["requests_mean"]) == records[0]["requests"]["mean"]
+    assert float(rows[0]["rounds_mean"]) == records[0]["rounds"]["mean"]
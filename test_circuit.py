@@ -0,0 +1,120 @@
+"""
+Unit tests for the compiled form of expressions.
+"""
+import functools
+
+from circuit import Circuit, DataflowSchedule, compile_expression, OP_SECRET, OP_SCALAR, OP_ADD, OP_ADD_CONSTANT, OP_MULT, \
+    OP_BEAVER_MULT
+from expression import Secret, Scalar, SecretVector
+
+
+def test_compile_simple():
+    """
+    f(a, b) = a + b * K
+    """
+    a, b = Secret(), Secret()
+    circuit = compile_expression(a + b * Scalar(3))
+
+    assert list(circuit.opcodes) == [OP_SECRET, OP_SECRET, OP_SCALAR, OP_MULT, OP_ADD]
+    assert circuit.secret_ids == [a.id, b.id]
+    assert circuit.scalars == [3]
+    assert circuit.op_ids == []
+    assert circuit.num_levels == 1
+    assert circuit.output == 4
+    assert (circuit.left[3], circuit.right[3]) == (1, 2)
+    assert (circuit.left[4], circuit.right[4]) == (0, 3)
+
+
+def test_compile_levels():
+    """
+    f(a, b, c) = (a * b + K) * c + a * c
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    inner = a * b
+    second = a * c
+    outer = (inner + Scalar(1)) * c
+    circuit = compile_expression(outer + second)
+
+    assert circuit.num_levels == 3
+    assert circuit.op_ids == [inner.id, second.id, outer.id]
+    level0, level1, level2 = (circuit.level(level) for level in range(3))
+    assert len(level0[0]) == 0
+    assert [circuit.opcodes[i] for i in level1[0]] == [OP_BEAVER_MULT, OP_BEAVER_MULT]
+    assert [circuit.opcodes[i] for i in level1[1]] == [OP_ADD_CONSTANT]
+    assert [circuit.opcodes[i] for i in level2[0]] == [OP_BEAVER_MULT]
+    assert [circuit.opcodes[i] for i in level2[1]] == [OP_ADD]
+    # every operand is computed before the instruction using it
+    for i in range(len(circuit)):
+        assert circuit.left[i] < i and circuit.right[i] < i
+
+
+def test_dataflow_schedule():
+    """
+    f(a, b, c) = (a * b + K) * c + a * c
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    inner = a * b
+    second = a * c
+    outer = (inner + Scalar(1)) * c
+    circuit = compile_expression(outer + second)
+
+    schedule = DataflowSchedule(circuit)
+    assert len(schedule) == 2
+    assert [[circuit.op_ids[circuit.args[i]] for i in batch] for batch in schedule.batches] == [
+        [inner.id, second.id], [outer.id]
+    ]
+    assert schedule.dependencies == [[], [0]]
+    assert sorted(circuit.opcodes[i] for i in schedule.ready) == [OP_SECRET, OP_SECRET, OP_SECRET, OP_SCALAR]
+    # the addition of the constant waits for the first batch, the output for both
+    assert [[circuit.opcodes[i] for i in group] for group in schedule.groups] == [[OP_ADD_CONSTANT], [OP_ADD]]
+    assert schedule.groups[1] == [circuit.output]
+    assert schedule.counts == [1, 2]
+    assert schedule.releases == [[0, 1], [1]]
+
+    # with one key per multiplication, the outer multiplication only waits for the inner one
+    schedule = DataflowSchedule(circuit, lambda register: circuit.args[register])
+    assert len(schedule) == 3
+    assert schedule.dependencies == [[], [], [0]]
+
+
+def test_compile_add_constant_secret_on_left():
+    a = Secret()
+    circuit = compile_expression(Scalar(2) + a)
+    assert circuit.opcodes[circuit.output] == OP_ADD_CONSTANT
+    assert circuit.opcodes[circuit.left[circuit.output]] == OP_SECRET
+
+
+def test_compile_shared_node():
+    a, b = Secret(), Secret()
+    product = a * b
+    circuit = compile_expression(product + product)
+    assert len(circuit) == 4
+    assert circuit.op_ids == [product.id]
+
+
+def test_compile_vector_lengths():
+    a, b = SecretVector(3), Secret()
+    circuit = compile_expression(a * b)
+    assert circuit.op_lengths() == [3]
+
+
+def test_compile_deep_expression():
+    secrets = [Secret() for _ in range(50000)]
+    circuit = compile_expression(functools.reduce(lambda left, right: left + right, secrets))
+    assert len(circuit) == 2 * 50000 - 1
+
+
+def test_serialize():
+    a, b = Secret(), Secret()
+    circuit = compile_expression(a * b + Scalar(5))
+    deserialized = Circuit.deserialize(circuit.serialize())
+
+    assert deserialized.opcodes == circuit.opcodes
+    assert deserialized.left == circuit.left
+    assert deserialized.right == circuit.right
+    assert deserialized.args == circuit.args
+    assert deserialized.secret_ids == circuit.secret_ids
+    assert deserialized.op_ids == circuit.op_ids
+    assert deserialized.scalars == circuit.scalars
+    assert deserialized.level_bounds == circuit.level_bounds
+    assert deserialized.output == circuit.output
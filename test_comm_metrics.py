@@ -0,0 +1,58 @@
+"""
+Unit tests for the communication cost metrics.
+"""
+import asyncio
+import threading
+
+from comm_metrics import CommunicationMetrics, LatencyHistogram, DEFAULT_PHASE
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram([0.01, 0.1, 1.0])
+    for seconds in [0.005, 0.05, 0.06, 0.5, 3.0]:
+        histogram.observe(seconds)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(1.0) == 3.0
+    assert histogram.to_dict()["max"] == 3.0
+
+
+def test_phases():
+    metrics = CommunicationMetrics()
+    metrics.record_request(10, 100, 0.01)
+    with metrics.phase("shares"):
+        metrics.record_round()
+        metrics.record_request(20, 5, 0.02)
+        metrics.record_poll_retry()
+    report = metrics.report()
+    assert list(report) == [DEFAULT_PHASE, "shares", "total"]
+    assert report["shares"]["bytes_sent"] == 20
+    assert report["shares"]["poll_retries"] == 1
+    assert report["total"] == {"requests": 2, "rounds": 1, "bytes_sent": 30, "bytes_received": 105, "poll_retries": 1}
+    assert metrics.bytes_sent == 30
+    assert metrics.bytes_received == 105
+
+
+def test_phases_of_concurrent_tasks():
+    metrics = CommunicationMetrics()
+
+    async def request(phase, size):
+        with metrics.phase(phase):
+            await asyncio.sleep(0.01)
+            # requests made in worker threads keep the phase of the task
+            await asyncio.to_thread(metrics.record_request, size, 0, 0.0)
+
+    async def run():
+        await asyncio.gather(request("shares", 1), request("triplets", 2), request("shares", 4))
+
+    asyncio.run(run())
+    report = metrics.report()
+    assert report["shares"]["bytes_sent"] == 5
+    assert report["triplets"]["bytes_sent"] == 2
+
+    # a plain thread starts outside of any phase
+    with metrics.phase("shares"):
+        thread = threading.Thread(target=metrics.record_request, args=(8, 0, 0.0))
+        thread.start()
+        thread.join()
+    assert metrics.report()[DEFAULT_PHASE]["bytes_sent"] == 8
@@ -0,0 +1,99 @@
+"""
+Tests for the client side of the communication with the trusted server.
+"""
+
+import asyncio
+import time
+from multiprocessing import Process
+
+import pytest
+import requests
+
+from communication import Communication, AsyncCommunication, header_size
+from server import run
+
+
+def smc_server(args):
+    run("localhost", 5000, args)
+
+
+def test_connection_stats():
+    server = Process(target=smc_server, args=(["Alice", "Bob"],))
+    server.start()
+    time.sleep(3)
+    try:
+        accepted = requests.get("http://localhost:5000/metrics").json()["connections"]
+        alice = Communication("localhost", 5000, "Alice", long_poll_timeout=1)
+        bob = Communication("localhost", 5000, "Bob", long_poll_timeout=1)
+        for i in range(5):
+            alice.send_private_message("Bob", f"label_{i}", f"message_{i}")
+            assert bob.retrieve_private_message(f"label_{i}") == f"message_{i}".encode()
+
+        alice.send_private_messages([("Bob", f"batch_{i}", f"message_{i}") for i in range(3)])
+        assert bob.retrieve_private_messages([f"batch_{i}" for i in range(3)]) == [b"message_0", b"message_1", b"message_2"]
+
+        # the server closes the connection after every response, so every request opens a new one
+        assert alice.connection_stats() == {"requests": 6, "connections": 6, "reused": 0}
+        assert bob.connection_stats() == {"requests": 6, "connections": 6, "reused": 0}
+        # the connections of alice and bob, and the one of this request
+        assert requests.get("http://localhost:5000/metrics").json()["connections"] == accepted + 12 + 1
+        assert alice.metrics.report()["total"]["requests"] == 6
+        bob_total = bob.metrics.report()["total"]
+        assert bob_total["poll_retries"] == 0
+        assert bob_total["bytes_received"] > sum(len(f"message_{i}") for i in range(5))
+        alice.close()
+        bob.close()
+    finally:
+        server.terminate()
+        server.join()
+
+
+def test_header_size():
+    assert header_size("GET /codecs HTTP/1.1", []) == len(b"GET /codecs HTTP/1.1\r\n\r\n")
+    assert header_size("HTTP/1.1 200 OK", [("Content-Length", 2)]) == len(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n")
+
+
+def test_retrieval_errors():
+    server = Process(target=smc_server, args=(["Alice", "Bob"],))
+    server.start()
+    time.sleep(3)
+    try:
+        unknown = Communication("localhost", 5000, "Bob", session_id="unknown")
+        with pytest.raises(requests.HTTPError):
+            unknown.retrieve_private_messages(["label"])
+        bob = Communication("localhost", 5000, "Bob")
+        bob._acknowledge(["received"])
+        # the server rejects a request line over 64 KiB (414)
+        with pytest.raises(requests.HTTPError):
+            bob.retrieve_private_messages(["x" * 100000])
+        # the acks stay queued until a request carrying them succeeds
+        assert bob._pending_acks() == ["received"]
+        unknown.close()
+        bob.close()
+    finally:
+        server.terminate()
+        server.join()
+
+
+def test_async_communication():
+    server = Process(target=smc_server, args=(["Alice", "Bob"],))
+    server.start()
+    time.sleep(3)
+    try:
+        alice = AsyncCommunication(Communication("localhost", 5000, "Alice", long_poll_timeout=1))
+        bob = AsyncCommunication(Communication("localhost", 5000, "Bob", long_poll_timeout=1))
+
+        async def exchange():
+            # Bob waits for both messages while Alice sends them
+            received = asyncio.gather(bob.retrieve_private_message("first"), bob.retrieve_public_message("Alice", "second"))
+            await asyncio.sleep(0.5)
+            await alice.send_private_message("Bob", "first", "message_0")
+            await alice.publish_message("second", "message_1")
+            return await received
+
+        assert asyncio.run(exchange()) == [b"message_0", b"message_1"]
+        asyncio.run(alice.close())
+        asyncio.run(bob.close())
+    finally:
+        server.terminate()
+        server.join()
@@ -5,7 +5,12 @@ Testing expressions is not obligatory.
 MODIFY THIS FILE.
 """
 
-from expression import Secret, Scalar, count_num_secrets, collect_secret_ids
+import functools
+
+import pytest
+
+from expression import Secret, Scalar, SecretVector, count_num_secrets, collect_secret_ids, multiplication_levels, \
+    postorder
 
 
 # Example test, you can adapt it to your needs.
@@ -39,6 +44,14 @@ def test_expr_construction_2():
     assert repr(expr) == "((Secret(1) + Secret(2)) * Secret(3) * Scalar(4) + Scalar(3))"
 
 
+def test_expr_construction_sub():
+    a = Secret(1)
+    b = Secret(2)
+    expr = a - b * Scalar(2)
+    assert repr(expr) == "(Secret(1) - Secret(2) * Scalar(2))"
+    assert count_num_secrets(expr) == 2
+
+
 def test_num_secrets_1():
     """
     f(a1, a2, a3, b) = a1 + a2 + a3 + b
@@ -59,3 +72,72 @@ def test_num_secrets_2():
 
     expr = alice_secret + bob_secret * (Scalar(15) + Scalar(15) * Scalar(3))
     assert count_num_secrets(expr) == 2
+
+
+def test_multiplication_levels_1():
+    """
+    f(a, b, c, d) = a * b + c * d
+    """
+    a, b, c, d = Secret(), Secret(), Secret(), Secret()
+    left = a * b
+    right = c * d
+
+    levels = multiplication_levels(left + right)
+    assert len(levels) == 1
+    assert levels[0] == [left, right]
+
+
+def test_multiplication_levels_2():
+    """
+    f(a, b, c) = (a * b * K) * c + a * K
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    inner = a * b
+    outer = inner * Scalar(3) * c
+
+    levels = multiplication_levels(outer + a * Scalar(2))
+    assert len(levels) == 2
+    assert levels[0] == [inner]
+    assert levels[1] == [outer]
+
+
+def test_multiplication_levels_shared_node():
+    a, b = Secret(), Secret()
+    product = a * b
+
+    levels = multiplication_levels(product + product)
+    assert levels == [[product]]
+
+
+def test_secret_vector_length():
+    a = SecretVector(3)
+    b = Secret()
+    assert (a * b + Scalar(1)).length == 3
+    assert (b + Scalar(1)).length == 1
+    assert repr(SecretVector(2, [1, 2])) == "SecretVector(2, [1, 2])"
+    with pytest.raises(ValueError):
+        a + SecretVector(4)
+    with pytest.raises(ValueError):
+        SecretVector(2, [1, 2, 3])
+
+
+def test_deep_expression():
+    """
+    f(a1, ..., an) = a1 + ... + an, a left-deep tree deeper than the recursion limit
+    """
+    secrets = [Secret() for _ in range(50000)]
+    expr = functools.reduce(lambda left, right: left + right, secrets) * secrets[0]
+
+    assert count_num_secrets(expr) == 50001
+    assert set(collect_secret_ids(expr)) == {secret.id for secret in secrets}
+    assert multiplication_levels(expr) == [[expr]]
+
+
+def test_postorder_shared_node():
+    a, b = Secret(), Secret()
+    product = a * b
+    expr = product + product
+
+    assert list(postorder(expr)) == [a, b, product, expr]
+    assert list(postorder(expr, skip={id(product)})) == [expr]
+
@@ -1,8 +1,10 @@
+import asyncio
 import time
 from multiprocessing import Process, Queue
 
-from expression import Scalar, Secret
-from protocol import ProtocolSpec
+from communication import create_session
+from expression import Scalar, Secret, SecretVector
+from protocol import ProtocolSpec, OPENING_BROADCAST, DEFAULT_OPENING
 from server import run
 from smc_party import SMCParty
 from secret_sharing import FIELD_MODULUS
@@ -21,15 +23,28 @@ def smc_client(client_id, prot, value_dict, queue):
     print(f"{client_id} has finished!")
 
 
+def smc_client_async(client_id, prot, value_dict, queue):
+    cli = SMCParty(
+        client_id,
+        "localhost",
+        5000,
+        protocol_spec=prot,
+        value_dict=value_dict
+    )
+    res = asyncio.run(cli.run_async())
+    queue.put(res)
+    print(f"{client_id} has finished!")
+
+
 def smc_server(args):
     run("localhost", 5000, args)
 
 
-def run_processes(server_args, *client_args):
+def run_processes(server_args, *client_args, client=smc_client):
     queue = Queue()
 
     server = Process(target=smc_server, args=(server_args,))
-    clients = [Process(target=smc_client, args=(*args, queue)) for args in client_args]
+    clients = [Process(target=client, args=(*args, queue)) for args in client_args]
 
     server.start()
     time.sleep(3)
@@ -54,13 +69,13 @@ def run_processes(server_args, *client_args):
     return results
 
 
-def suite(parties, expr, expected):
+def suite(parties, expr, expected, client=smc_client, opening=DEFAULT_OPENING):
     participants = list(parties.keys())
 
-    prot = ProtocolSpec(expr=expr, participant_ids=participants)
+    prot = ProtocolSpec(expr=expr, participant_ids=participants, opening=opening)
     clients = [(name, prot, value_dict) for name, value_dict in parties.items()]
 
-    results = run_processes(participants, *clients)
+    results = run_processes(participants, *clients, client=client)
 
     for result in results:
         assert result == expected
@@ -588,3 +603,187 @@ def test_suite22():
     expr = (alice_secret + Scalar(5)) + Scalar(5)
     expected = (504 + 5 + 5) % FIELD_MODULUS
     suite(parties, expr, expected)
+
+
+def test_vector0():
+    """
+    f(a, b, c) = a * b + c * K - K, element-wise over vectors with a broadcast secret c
+    """
+    alice_secret = SecretVector(3)
+    bob_secret = SecretVector(3)
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: [1, 2, 3]},
+        "Bob": {bob_secret: [40, 50, 60]},
+        "Charlie": {charlie_secret: 7},
+    }
+
+    expr = alice_secret * bob_secret + charlie_secret * Scalar(2) - Scalar(1)
+    expected = [1 * 40 + 7 * 2 - 1, 2 * 50 + 7 * 2 - 1, 3 * 60 + 7 * 2 - 1]
+    suite(parties, expr, expected)
+
+
+def test_vector1():
+    """
+    f(a, b) = (a * b) * b + a * (b + K), mixing vector and scalar multiplications
+    """
+    alice_secret = SecretVector(4)
+    bob_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: [5, 6, 7, 8]},
+        "Bob": {bob_secret: 3},
+    }
+
+    expr = (alice_secret * bob_secret) * bob_secret + alice_secret * (bob_secret + Scalar(10))
+    expected = [(a * 3 * 3 + a * (3 + 10)) % FIELD_MODULUS for a in [5, 6, 7, 8]]
+    suite(parties, expr, expected)
+
+
+def test_async0():
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 3},
+        "Bob": {bob_secret: 14},
+        "Charlie": {charlie_secret: 2},
+    }
+
+    expr = (alice_secret * bob_secret * charlie_secret + Scalar(5)) * alice_secret - bob_secret
+    expected = ((3 * 14 * 2 + 5) * 3 - 14) % FIELD_MODULUS
+    suite(parties, expr, expected, client=smc_client_async)
+
+
+def test_async_vector():
+    alice_secret = SecretVector(3)
+    bob_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: [1, 2, 3]},
+        "Bob": {bob_secret: 4},
+    }
+
+    expr = alice_secret * bob_secret + Scalar(1)
+    expected = [5, 9, 13]
+    suite(parties, expr, expected, client=smc_client_async)
+
+
+def test_async_independent_branches():
+    """
+    Branches of different depths are opened by dataflow, each multiplication by its own leader.
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+    dave_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 5},
+        "Bob": {bob_secret: 6},
+        "Charlie": {charlie_secret: 2},
+        "Dave": {dave_secret: 3},
+    }
+
+    expr = (
+        alice_secret * bob_secret * charlie_secret * dave_secret
+        + (alice_secret + bob_secret) * (charlie_secret - dave_secret)
+        - charlie_secret * dave_secret * Scalar(2)
+    )
+    expected = (5 * 6 * 2 * 3 + (5 + 6) * (2 - 3) - 2 * 3 * 2) % FIELD_MODULUS
+    suite(parties, expr, expected, client=smc_client_async)
+
+
+def test_broadcast0():
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+    dave_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 5},
+        "Bob": {bob_secret: 6},
+        "Charlie": {charlie_secret: 2},
+        "Dave": {dave_secret: 3},
+    }
+
+    expr = (alice_secret * bob_secret + charlie_secret * dave_secret) * alice_secret - Scalar(7)
+    expected = ((5 * 6 + 2 * 3) * 5 - 7) % FIELD_MODULUS
+    suite(parties, expr, expected, opening=OPENING_BROADCAST)
+
+
+def test_broadcast_async_vector():
+    alice_secret = SecretVector(3)
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: [1, 2, 3]},
+        "Bob": {bob_secret: 4},
+        "Charlie": {charlie_secret: 2},
+    }
+
+    expr = alice_secret * bob_secret * charlie_secret + Scalar(1)
+    expected = [9, 17, 25]
+    suite(parties, expr, expected, client=smc_client_async, opening=OPENING_BROADCAST)
+
+
+def test_concurrent_sessions():
+    """
+    Two runs with the same participants share one server, each in its own session.
+    """
+    server = Process(target=smc_server, args=([],))
+    server.start()
+    time.sleep(3)
+    try:
+        runs = []
+        for value in (3, 7):
+            alice_secret, bob_secret = Secret(), Secret()
+            session_id = create_session("localhost", 5000, ["Alice", "Bob"])
+            prot = ProtocolSpec(expr=alice_secret * bob_secret + Scalar(1), participant_ids=["Alice", "Bob"],
+                                session_id=session_id)
+            queue = Queue()
+            clients = [
+                Process(target=smc_client, args=("Alice", prot, {alice_secret: value}, queue)),
+                Process(target=smc_client, args=("Bob", prot, {bob_secret: 10}, queue)),
+            ]
+            runs.append((clients, queue, value * 10 + 1))
+        for clients, _, _ in runs:
+            for client in clients:
+                client.start()
+        for clients, queue, expected in runs:
+            for client in clients:
+                client.join()
+            assert [queue.get(), queue.get()] == [expected, expected]
+    finally:
+        server.terminate()
+        server.join()
+
+
+def smc_client_report(client_id, prot, value_dict, queue):
+    cli = SMCParty(
+        client_id,
+        "localhost",
+        5000,
+        protocol_spec=prot,
+        value_dict=value_dict
+    )
+    cli.run()
+    queue.put((cli.bytes_consumed, cli.communication_report()))
+
+
+def test_communication_report():
+    alice_secret = Secret()
+    bob_secret = Secret()
+    prot = ProtocolSpec(expr=alice_secret * bob_secret, participant_ids=["Alice", "Bob"])
+
+    results = run_processes(["Alice", "Bob"], ("Alice", prot, {alice_secret: 3}), ("Bob", prot, {bob_secret: 4}),
+                            client=smc_client_report)
+    for bytes_consumed, report in results:
+        assert list(report) == ["setup", "shares", "triplets", "circuit", "result", "total"]
+        assert bytes_consumed == report["total"]["bytes_sent"] + report["total"]["bytes_received"]
+        assert report["triplets"]["requests"] == 1
+        assert report["triplets"]["bytes_received"] > 0
+        assert report["circuit"]["latency"]["count"] == report["circuit"]["requests"]
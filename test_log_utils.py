@@ -0,0 +1,39 @@
+"""
+Unit tests for the structured logging.
+"""
+import io
+import logging
+
+from log_utils import configure_logging, get_logger, log_event, SamplingFilter, StructuredFormatter
+
+
+def test_structured_formatter():
+    record = logging.LogRecord("smc.test", logging.INFO, __file__, 0, "private.send", None, None)
+    record.fields = {"sender": "Alice", "label": "x"}
+    assert StructuredFormatter().format(record).endswith("INFO smc.test private.send sender=Alice label=x")
+
+
+def test_sampling_filter():
+    sampling = SamplingFilter(3)
+    debug = logging.LogRecord("smc.test", logging.DEBUG, __file__, 0, "poll", None, None)
+    warning = logging.LogRecord("smc.test", logging.WARNING, __file__, 0, "poll", None, None)
+    assert [sampling.filter(debug) for _ in range(6)] == [True, False, False, True, False, False]
+    assert sampling.filter(warning)
+
+
+def test_configure_logging():
+    stream = io.StringIO()
+    listener = configure_logging("DEBUG", asynchronous=True, stream=stream, poll_sample_rate=2)
+    try:
+        log_event(get_logger("test"), logging.DEBUG, "event", level=1)
+        for i in range(4):
+            log_event(get_logger("communication.poll"), logging.DEBUG, "poll", iteration=i)
+    finally:
+        listener.stop()
+        root = logging.getLogger("smc")
+        root.setLevel(logging.NOTSET)
+        for handler in [handler for handler in root.handlers if not isinstance(handler, logging.NullHandler)]:
+            root.removeHandler(handler)
+    lines = stream.getvalue().splitlines()
+    assert lines[0].endswith("smc.test event level=1")
+    assert [line.split()[-1] for line in lines[1:]] == ["iteration=0", "iteration=2"]
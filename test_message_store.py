@@ -0,0 +1,61 @@
+"""
+Unit tests for the message store of the trusted server.
+"""
+import time
+
+import pytest
+
+from message_store import MessageStore, StoreFullError
+
+
+def test_set_get_values():
+    store = MessageStore()
+    store.set_values("", "private", [(("Bob", "one"), b"1"), (("Bob", "two"), b"22")])
+    assert store.get_values("", "private", [("Bob", "one"), ("Bob", "three")]) == [b"1", None]
+    assert store.get_values("other", "private", [("Bob", "one")]) == [None]
+    assert store.num_bytes == 3
+
+
+def test_remove_values():
+    store = MessageStore()
+    store.set_values("", "private", [(("Bob", "one"), b"1")])
+    assert store.get_values("", "private", [("Bob", "one")]) == [b"1"]
+    assert store.get_values("", "private", [("Bob", "one")]) == [b"1"]
+    assert store.remove_values("", "private", [("Bob", "one"), ("Bob", "two")]) == 1
+    assert store.remove_values("", "private", [("Bob", "one")]) == 0
+    assert store.get_values("", "private", [("Bob", "one")]) == [None]
+    assert store.num_bytes == 0
+
+
+def test_ttl():
+    store = MessageStore(ttl=0.2)
+    store.set_values("idle", "public", [(("Alice", "old"), b"old")])
+    store.set_values("active", "public", [(("Alice", "old"), b"old")])
+    time.sleep(0.15)
+    store.get_values("active", "public", [("Alice", "old")])
+    time.sleep(0.1)
+    store.set_values("active", "public", [(("Alice", "new"), b"new")])
+    assert store.metrics()["namespaces"] == {"active": 2}
+    assert store.metrics()["expired"] == 1
+
+
+def test_max_bytes():
+    store = MessageStore(max_bytes=10)
+    store.set_values("", "public", [(("Alice", "0"), b"abcd"), (("Alice", "1"), b"abcd")])
+    with pytest.raises(StoreFullError):
+        store.set_values("", "public", [(("Alice", "2"), b"abcd")])
+    # overwriting a message only counts the difference
+    store.set_values("", "public", [(("Alice", "1"), b"abcdef")])
+    assert store.num_bytes == 10
+    assert store.get_values("", "public", [("Alice", "0"), ("Alice", "2")]) == [b"abcd", None]
+    assert store.metrics()["rejected"] == 1
+
+
+def test_overwrite_and_drop_namespace():
+    store = MessageStore()
+    store.set_values("run1", "public", [(("Alice", "x"), b"first")])
+    store.set_values("run1", "public", [(("Alice", "x"), b"2nd")])
+    store.set_values("run2", "public", [(("Alice", "x"), b"other")])
+    assert store.num_bytes == 8
+    assert store.drop_namespace("run1") == 1
+    assert store.metrics()["namespaces"] == {"run2": 1}
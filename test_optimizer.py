@@ -0,0 +1,154 @@
+"""
+Unit tests for the optimization passes of expressions.
+"""
+import functools
+
+from circuit import compile_expression, OP_BEAVER_MULT
+from expression import Secret, Scalar, SecretVector, AddOperation, SubOperation, MultOperation, \
+    count_num_secrets, collect_secret_ids, multiplication_levels, postorder
+from optimizer import simplify, eliminate_common_subexpressions, rebalance
+from protocol import ProtocolSpec
+from secret_sharing import FIELD_MODULUS
+
+
+def test_fold_scalars():
+    a = Secret()
+    expr = a + (Scalar(3) * Scalar(4) + Scalar(5) - Scalar(2))
+    simplified = simplify(expr)
+    assert isinstance(simplified, AddOperation)
+    assert simplified.left is a
+    assert isinstance(simplified.right, Scalar)
+    assert simplified.right.value == 15
+
+
+def test_fold_scalars_modulo():
+    simplified = simplify(Scalar(FIELD_MODULUS - 1) * Scalar(2) + Scalar(-1))
+    assert simplified.value == FIELD_MODULUS - 3
+
+
+def test_identities():
+    a = Secret()
+    assert simplify(a + Scalar(0)) is a
+    assert simplify(Scalar(0) + a) is a
+    assert simplify(a * Scalar(1)) is a
+    assert simplify(Scalar(FIELD_MODULUS + 1) * a) is a
+    assert simplify(a - Scalar(0)) is a
+    assert simplify(a * (Scalar(2) - Scalar(2))).value == 0
+
+
+def test_vector_times_zero_stays_vector():
+    a = SecretVector(3)
+    simplified = simplify(a * Scalar(0))
+    assert simplified.length == 3
+    assert isinstance(simplified, MultOperation)
+
+
+def test_collapse_scalar_multiplications():
+    a = Secret()
+    expr = Scalar(2) * (a * Scalar(3)) * Scalar(5)
+    simplified = simplify(expr)
+    assert isinstance(simplified, MultOperation)
+    assert simplified.left is a
+    assert simplified.right.value == 30
+    assert simplified.id == expr.id
+    assert simplified.right.id != expr.id
+    assert simplify(expr).right.id == simplified.right.id
+
+
+def test_negation_to_subtraction():
+    a, b = Secret(), Secret()
+    expr = a + b * Scalar(-1)
+    simplified = simplify(expr)
+    assert isinstance(simplified, SubOperation)
+    assert simplified.left is a
+    assert simplified.right is b
+    assert simplified.id == expr.id
+
+    simplified = simplify(b * Scalar(-1) + a)
+    assert isinstance(simplified, SubOperation)
+    assert (simplified.left, simplified.right) == (a, b)
+
+
+def test_unchanged_expression():
+    a, b = Secret(), Secret()
+    expr = a * b + a
+    assert simplify(expr) is expr
+
+
+def test_keeps_beaver_ids():
+    a, b, c = Secret(), Secret(), Secret()
+    product = a * b
+    expr = (product * Scalar(1) + Scalar(0)) * (c + Scalar(2) * Scalar(3))
+    circuit = compile_expression(simplify(expr))
+    assert circuit.op_ids == [product.id, expr.id]
+    assert len(circuit) < len(compile_expression(expr))
+    assert list(circuit.opcodes).count(OP_BEAVER_MULT) == 2
+
+
+def test_merge_common_subexpressions():
+    a, b, c = Secret(), Secret(), Secret()
+    first = a * b
+    expr = first + (b * a) * c + (a * b) * c
+    merged = eliminate_common_subexpressions(expr)
+    assert count_num_secrets(merged) == count_num_secrets(expr)
+    assert len(list(postorder(merged))) == 7
+
+    circuit = compile_expression(merged)
+    assert circuit.op_ids == [first.id, (expr.left.right).id]
+    assert circuit.secret_ids == [a.id, b.id, c.id]
+
+
+def test_merge_keeps_subtraction_order():
+    a, b = Secret(), Secret()
+    expr = (a - b) * (b - a)
+    merged = eliminate_common_subexpressions(expr)
+    assert merged.left is not merged.right
+
+
+def test_merge_scalars():
+    a = Secret()
+    expr = a * Scalar(3) + a * Scalar(3 + FIELD_MODULUS)
+    merged = eliminate_common_subexpressions(expr)
+    assert merged.left is merged.right
+    assert hash(Scalar(3)) == hash(Scalar(3))
+    assert Scalar(3) == Scalar(3) and Scalar(3) != Scalar(4)
+    assert len({Scalar(3), Scalar(3), Scalar(4)}) == 2
+
+
+def test_rebalance_product():
+    secrets = [Secret() for _ in range(8)]
+    expr = functools.reduce(lambda left, right: left * right, secrets)
+    assert len(multiplication_levels(expr)) == 7
+
+    balanced = rebalance(expr)
+    assert len(multiplication_levels(balanced)) == 3
+    assert balanced.id == expr.id
+    assert collect_secret_ids(balanced) == [secret.id for secret in secrets]
+
+
+def test_rebalance_is_deterministic():
+    secrets = [Secret() for _ in range(5)]
+    expr = functools.reduce(lambda left, right: left * right, secrets) * Scalar(3)
+    first = ProtocolSpec(participant_ids=["Alice"], expr=expr).circuit
+    second = ProtocolSpec(participant_ids=["Bob"], expr=expr).circuit
+    assert first.op_ids == second.op_ids
+    assert len(first.op_ids) == 4
+    assert first.num_levels == 4
+
+
+def test_rebalance_sum_of_products():
+    a, b, c, d = Secret(), Secret(), Secret(), Secret()
+    expr = a * b * c + d + a * b * c * d
+    balanced = rebalance(expr)
+    assert len(multiplication_levels(balanced)) == 2
+    assert count_num_secrets(balanced) == count_num_secrets(expr)
+
+
+def test_rebalance_keeps_shared_nodes():
+    a, b, c, d = Secret(), Secret(), Secret(), Secret()
+    shared = a * b
+    expr = shared * c * d + shared
+    balanced = rebalance(expr)
+    assert balanced.right is shared
+    assert len(multiplication_levels(balanced)) == 2
+    assert shared in multiplication_levels(balanced)[0]
@@ -0,0 +1,68 @@
+"""
+Unit tests for the sources of randomness.
+"""
+import multiprocessing
+
+import pytest
+
+import randomness
+from expression import gen_id
+from randomness import RandomSource, SeededRandomSource, SystemRandomSource
+from secret_sharing import random_field_elements, share_secret
+
+
+@pytest.fixture
+def restore_source():
+    source = randomness.get_source()
+    yield
+    randomness.set_source(source)
+
+
+def test_sources():
+    for source in [SystemRandomSource(), SeededRandomSource(1)]:
+        draws = [source.random_bytes(count) for count in [0, 5, 16, 40]]
+        assert [len(draw) for draw in draws] == [0, 5, 16, 40]
+        assert draws[1] != source.random_bytes(5)
+    with pytest.raises(TypeError):
+        RandomSource()
+
+
+def test_seeded_source_deterministic():
+    first, second = SeededRandomSource(7), SeededRandomSource(7)
+    assert first.random_bytes(3) + first.random_bytes(40000) == second.random_bytes(40003)
+    assert SeededRandomSource(8).random_bytes(32) != SeededRandomSource(7).random_bytes(32)
+
+
+def test_seed(restore_source):
+    randomness.seed(42)
+    draws = random_field_elements(10), share_secret(5, 3), gen_id()
+    randomness.seed(42)
+    assert (random_field_elements(10), share_secret(5, 3), gen_id()) == draws
+    randomness.set_source()
+    assert isinstance(randomness.get_source(), SystemRandomSource)
+
+
+def draw_in_child(index, queue):
+    queue.put((index, randomness.random_bytes(16)))
+
+
+def forked_draws():
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [context.Process(target=draw_in_child, args=(index, queue)) for index in range(3)]
+    for process in processes:
+        process.start()
+    draws = dict(queue.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return [draws[index] for index in range(3)], randomness.random_bytes(16)
+
+
+def test_seeded_source_fork(restore_source):
+    randomness.seed(5)
+    children, parent = forked_draws()
+    # the children draw different bytes, and forking does not change the stream of the parent
+    assert len(set(children + [parent])) == 4
+    assert parent == SeededRandomSource(5).random_bytes(16)
+    randomness.seed(5)
+    assert forked_draws() == (children, parent)
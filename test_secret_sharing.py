@@ -4,9 +4,15 @@ Testing secret sharing is not obligatory.
 
 MODIFY THIS FILE.
 """
+import copy
+import pickle
 import random
 
-from secret_sharing import share_secret, reconstruct_secret, Share, FIELD_MODULUS
+import pytest
+
+from secret_sharing import share_secret, reconstruct_secret, Share, FIELD_MODULUS, Constant, ShareVector, \
+    share_secret_vector, reconstruct_secret_vector, share_secrets, reconstruct_secrets, random_field_elements, \
+    ShareArray
 
 
 def test_share_secret():
@@ -52,3 +58,76 @@ def test_reconstruct_secret_2():
 def test_reconstruct_secret_3():
     shares = [Share(random.randint(0, FIELD_MODULUS)) for _ in range(10000)]
     assert reconstruct_secret(shares) == sum([share.value for share in shares]) % FIELD_MODULUS
+
+
+# Batches
+def test_share_secrets():
+    secrets = [random.randint(0, FIELD_MODULUS - 1) for _ in range(1000)] + [-1, FIELD_MODULUS]
+    shares = share_secrets(secrets, 3)
+    assert len(shares) == 3
+    assert all(len(party_shares) == len(secrets) for party_shares in shares)
+    assert reconstruct_secrets(shares) == [secret % FIELD_MODULUS for secret in secrets]
+    assert share_secrets([5], 1) == [[5]]
+    assert share_secrets([], 3) == [[], [], []]
+
+
+def test_random_field_elements():
+    elements = random_field_elements(10000)
+    assert len(elements) == 10000
+    assert all(0 <= element < FIELD_MODULUS for element in elements)
+    assert len(set(elements)) > 9900
+
+
+# Vectors
+def test_share_secret_vector():
+    secret = [1, 2, FIELD_MODULUS - 1]
+    shares = share_secret_vector(secret, 4)
+    assert len(shares) == 4
+    assert all(len(share) == 3 for share in shares)
+    assert reconstruct_secret_vector(shares) == secret
+
+
+def test_share_vector_operations():
+    vector = ShareVector([1, 2, 3])
+    assert (vector + ShareVector([10, 20, 30])).values == [11, 22, 33]
+    assert (vector + Share(1)).values == [2, 3, 4]
+    assert (Constant(5) - vector).values == [4, 3, 2]
+    assert (vector - Constant(2)).values == [FIELD_MODULUS - 1, 0, 1]
+    assert (Constant(2) * vector).values == [2, 4, 6]
+
+
+def test_share_vector_invalid_operations():
+    with pytest.raises(TypeError):
+        ShareVector([1, 2]) * Share(3)
+    with pytest.raises(TypeError):
+        Share(3) * ShareVector([1, 2])
+    with pytest.raises(ValueError):
+        ShareVector([1, 2]) + ShareVector([1, 2, 3])
+
+
+# Representation
+def test_share_immutable():
+    share = Share(FIELD_MODULUS + 1)
+    with pytest.raises(AttributeError):
+        share.value = 2
+    with pytest.raises(AttributeError):
+        share.other = 2
+    assert share == Share(1)
+    assert share != Constant(1)
+    assert Constant(3) + Constant(FIELD_MODULUS - 1) == Constant(2)
+    assert pickle.loads(pickle.dumps(share)) == share
+    assert copy.deepcopy(Constant(4)) == Constant(4)
+    assert Share.deserialize(share.serialize()) == share
+
+
+def test_share_array():
+    shares = share_secret(42, 5)
+    share_array = ShareArray.from_shares(shares)
+    assert len(share_array) == 5
+    assert list(share_array) == shares
+    assert share_array[2] == shares[2]
+    assert list(share_array[1:3]) == shares[1:3]
+    assert reconstruct_secret(list(share_array)) == 42
+    share_array.append(Share(1))
+    assert share_array.to_vector().values == [share.value for share in shares] + [1]
+    assert ShareArray([-1]).values.tolist() == [FIELD_MODULUS - 1]
@@ -1,4 +1,5 @@
-from message_utils import Message, ShareMessage, ResultShareMessage, BeaverConstShareMessage, BeaverConstResultMessage
+from message_utils import Message, ShareMessage, ResultShareMessage, BeaverConstShareMessage, BeaverConstResultMessage, \
+    BeaverConstSharesMessage, BeaverConstResultsMessage
 from secret_sharing import Share, Constant
 
 
@@ -51,3 +52,21 @@ def test_serialize_beaver_const_result_message():
 
     assert deserialized.x_part == 2
     assert deserialized.y_part == 5
+
+
+def test_serialize_beaver_const_shares_message():
+    beaver_const_shares = BeaverConstSharesMessage([Share(2), Share(3)], [Share(5), Share(7)])
+    serialized = beaver_const_shares.serialize()
+    deserialized = BeaverConstSharesMessage.deserialize(serialized)
+
+    assert [share.value for share in deserialized.x_parts] == [2, 3]
+    assert [share.value for share in deserialized.y_parts] == [5, 7]
+
+
+def test_serialize_beaver_const_results_message():
+    beaver_const_results = BeaverConstResultsMessage([2, 3], [5, 7])
+    serialized = beaver_const_results.serialize()
+    deserialized = BeaverConstResultsMessage.deserialize(serialized)
+
+    assert deserialized.x_parts == [2, 3]
+    assert deserialized.y_parts == [5, 7]
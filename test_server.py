@@ -0,0 +1,235 @@
+"""
+Unit tests for the trusted server.
+"""
+import base64
+import threading
+import time
+
+import pytest
+import requests
+
+import server
+from message_store import MessageStore, DEFAULT_NAMESPACE
+from ttp import TrustedParamGenerator
+from wire_format import BinaryCodec, SharesList
+
+
+@pytest.fixture(autouse=True)
+def fresh_server_state(monkeypatch):
+    # Integration tests fork the server from this process, so the module state must not leak into them.
+    monkeypatch.setattr(server, "store", MessageStore())
+    default_ttp, default_finished = TrustedParamGenerator(), set()
+    monkeypatch.setattr(server, "ttp", default_ttp)
+    monkeypatch.setattr(server, "finished", default_finished)
+    monkeypatch.setattr(server, "default_session",
+                        server.Session(DEFAULT_NAMESPACE, [], default_ttp, server.ttp_lock, default_finished))
+    monkeypatch.setattr(server, "sessions", {})
+
+
+def test_retrieve_private_message_missing():
+    client = server.app.test_client()
+    res = client.get("/private/Bob/test_missing")
+    assert res.status_code == 404
+
+
+def test_retrieve_private_message():
+    client = server.app.test_client()
+    client.post("/private/Alice/Bob/test_private", data=b"hello")
+    res = client.get("/private/Bob/test_private")
+    assert res.status_code == 200
+    assert res.data == b"hello"
+
+
+def test_long_poll_timeout():
+    client = server.app.test_client()
+    start = time.time()
+    res = client.get("/public/Bob/Alice/test_timeout?timeout=0.2")
+    assert res.status_code == 404
+    assert time.time() - start >= 0.2
+
+
+def test_long_poll_returns_once_stored():
+    client = server.app.test_client()
+    publisher = threading.Timer(0.1, server._set_value, args=("public", ("Alice", "test_long_poll"), b"hi"))
+    publisher.start()
+    res = client.get("/public/Bob/Alice/test_long_poll?timeout=5")
+    publisher.join()
+    assert res.status_code == 200
+    assert res.data == b"hi"
+
+
+def test_batch_private_messages():
+    client = server.app.test_client()
+    client.post("/batch/private/Alice", json=[
+        {"receiver": "Bob", "label": "test_batch_1", "payload": base64.b64encode(b"one").decode()},
+        {"receiver": "Charlie", "label": "test_batch_2", "payload": base64.b64encode(b"two").decode()},
+    ])
+    res = client.get("/batch/private/Bob?label=test_batch_1&label=test_batch_2")
+    assert res.status_code == 200
+    assert res.get_json() == [{"label": "test_batch_1", "payload": base64.b64encode(b"one").decode()}]
+
+    res = client.get("/private/Charlie/test_batch_2")
+    assert res.data == b"two"
+
+
+def test_batch_public_messages():
+    client = server.app.test_client()
+    client.post("/public/Alice/test_batch_public", data=b"one")
+    client.post("/public/Bob/test_batch_public", data=b"two")
+    res = client.get("/batch/public/Charlie?sender=Alice&label=test_batch_public&sender=Bob&label=test_batch_public")
+    assert res.status_code == 200
+    assert [base64.b64decode(entry["payload"]) for entry in res.get_json()] == [b"one", b"two"]
+
+
+def test_supported_codecs():
+    client = server.app.test_client()
+    res = client.get("/codecs")
+    assert set(res.get_json()) == {"json", "binary"}
+
+
+def test_retrieve_share_codecs():
+    client = server.app.test_client()
+    server.ttp.add_participant("Alice")
+    assert len(SharesList.deserialize(client.get("/shares/Alice/test_json_op").data)) == 3
+    res = client.get("/shares/Alice/test_binary_op?codec=binary")
+    assert len(BinaryCodec().decode(res.data, SharesList)) == 3
+    assert client.get("/shares/Alice/test_binary_op?codec=xml").status_code == 400
+
+
+def test_retrieve_shares_batch():
+    client = server.app.test_client()
+    server.ttp.add_participant("Alice")
+    server.ttp.add_participant("Bob")
+    res = client.post("/shares/Alice?codec=binary", json={"op_ids": ["test_op1", "test_op2"]})
+    assert len(BinaryCodec().decode(res.data, SharesList)) == 6
+    assert set(server.ttp.beaver_triplets) == {"test_op1", "test_op2"}
+
+    res = client.post("/shares/Alice", json={"op_ids": ["test_op1", "test_op3"], "lengths": [1, 4]})
+    assert len(SharesList.deserialize(res.data)) == 3 + 3 * 4
+
+
+def test_private_message_acknowledged():
+    client = server.app.test_client()
+    client.post("/private/Alice/Bob/test_ack", data=b"hello")
+    client.post("/private/Alice/Bob/test_next", data=b"world")
+    # a read does not remove the message, so that it can be retried
+    assert client.get("/private/Bob/test_ack").data == b"hello"
+    assert client.get("/private/Bob/test_ack").data == b"hello"
+    assert client.get("/private/Bob/test_next?ack=test_ack").data == b"world"
+    assert client.get("/private/Bob/test_ack").status_code == 404
+    assert client.get("/batch/private/Bob?label=test_next&ack=test_next").get_json() == []
+
+    client.post("/public/Alice/test_public", data=b"hi")
+    assert client.get("/public/Bob/Alice/test_public").data == b"hi"
+    assert client.get("/public/Charlie/Alice/test_public").data == b"hi"
+
+
+def test_finish_drops_messages():
+    client = server.app.test_client()
+    server.ttp.add_participant("Alice")
+    server.ttp.add_participant("Bob")
+    client.post("/public/Alice/test_result", data=b"42")
+    client.post("/shares/Alice", json={"op_ids": ["test_op"]})
+
+    client.post("/finish/Alice")
+    assert client.get("/public/Bob/Alice/test_result").data == b"42"
+    client.post("/finish/Bob")
+    assert client.get("/public/Bob/Alice/test_result").status_code == 404
+
+    metrics = client.get("/metrics").get_json()
+    assert metrics["store"]["messages"] == 0
+    assert metrics["ttp"] == {"participants": 2, "triplets": 0}
+
+
+def test_metrics():
+    client = server.app.test_client()
+    client.post("/private/Alice/Bob/test_metrics", data=b"hello")
+    client.post("/public/Alice/test_metrics", data=b"hi")
+    metrics = client.get("/metrics").get_json()["store"]
+    assert metrics["messages"] == 2
+    assert metrics["bytes"] == 7
+    assert metrics["pools"]["private"] == {"messages": 1, "bytes": 5}
+
+
+def test_store_full(monkeypatch):
+    monkeypatch.setattr(server, "store", MessageStore(max_bytes=4))
+    client = server.app.test_client()
+    assert client.post("/public/Alice/test_full", data=b"1234").status_code == 200
+    assert client.post("/public/Alice/test_other", data=b"5").status_code == 507
+    assert client.get("/public/Bob/Alice/test_full").data == b"1234"
+
+
+def test_thread_pool_server():
+    pool_server = server.ThreadPoolWSGIServer("localhost", 0, server.app, workers=4)
+    thread = threading.Thread(target=pool_server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://localhost:{pool_server.server_port}"
+    try:
+        # a long-polling request occupies a worker while another one stores the message it waits for
+        responses = []
+        waiter = threading.Thread(target=lambda: responses.append(
+            requests.get(f"{base_url}/private/Bob/test_pool?timeout=5")))
+        waiter.start()
+        time.sleep(0.2)
+        assert requests.post(f"{base_url}/private/Alice/Bob/test_pool", data=b"hello").status_code == 200
+        waiter.join()
+        assert responses[0].status_code == 200
+        assert responses[0].content == b"hello"
+    finally:
+        pool_server.shutdown()
+        pool_server.server_close()
+
+
+def test_thread_pool_server_saturated():
+    pool_server = server.ThreadPoolWSGIServer(
+        "localhost", 0, server.app, workers=1, on_saturated=server.store.wake_waiters)
+    thread = threading.Thread(target=pool_server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://localhost:{pool_server.server_port}"
+    try:
+        # the long-polling request holds the only worker, it gives it back once another connection waits for it
+        responses = []
+        waiter = threading.Thread(target=lambda: responses.append(
+            requests.get(f"{base_url}/public/Bob/Alice/test_saturated?timeout=10")))
+        waiter.start()
+        time.sleep(0.2)
+        start = time.time()
+        assert requests.post(f"{base_url}/public/Alice/test_other", data=b"hello").status_code == 200
+        waiter.join()
+        assert time.time() - start < 5
+        assert responses[0].status_code == 404
+    finally:
+        pool_server.shutdown()
+        pool_server.server_close()
+
+
+def test_sessions():
+    client = server.app.test_client()
+    res = client.post("/sessions", json={"participants": ["Alice", "Bob"], "session_id": "run1"})
+    assert res.status_code == 201
+    assert res.get_json() == {"session_id": "run1"}
+    assert client.post("/sessions", json={"participants": ["Alice"], "session_id": "run1"}).status_code == 409
+    other = client.post("/sessions", json={"participants": ["Alice"]}).get_json()["session_id"]
+
+    # the messages and triplets of a session are separate from the other sessions
+    client.post("/session/run1/public/Alice/test_session", data=b"one")
+    client.post(f"/session/{other}/public/Alice/test_session", data=b"two")
+    assert client.get("/session/run1/public/Bob/Alice/test_session").data == b"one"
+    assert client.get(f"/session/{other}/public/Bob/Alice/test_session").data == b"two"
+    assert client.get("/public/Bob/Alice/test_session").status_code == 404
+    client.post("/session/run1/shares/Alice", json={"op_ids": ["test_op"]})
+    assert set(server.sessions["run1"].ttp.beaver_triplets) == {"test_op"}
+    assert server.ttp.beaver_triplets == {}
+
+    # the session is dropped once all its participants finished
+    client.post("/session/run1/finish/Alice")
+    client.post("/session/run1/finish/Bob")
+    assert "run1" not in server.sessions
+    assert client.get("/session/run1/public/Bob/Alice/test_session").status_code == 404
+    assert client.get("/session/unknown/codecs").status_code == 404
+
+    # a session without participants is not dropped by a finish
+    client.post("/sessions", json={"participants": [], "session_id": "empty"})
+    client.post("/session/empty/public/Alice/test_session", data=b"three")
+    assert client.post("/session/empty/finish/Alice").status_code == 403
+    assert client.get("/session/empty/public/Bob/Alice/test_session").data == b"three"
@@ -0,0 +1,86 @@
+"""
+Unit tests for the local computations of an SMC party.
+"""
+import functools
+
+import pytest
+
+from expression import Secret, Scalar
+from message_utils import BeaverConstResultsMessage
+from protocol import ProtocolSpec
+from secret_sharing import Share, Constant, FIELD_MODULUS
+from smc_party import SMCParty
+
+
+def test_process_deep_expression():
+    secrets = [Secret() for _ in range(50000)]
+    expr = functools.reduce(lambda left, right: left + right, secrets) + Scalar(5)
+    shares = {secret.id: Share(i) for i, secret in enumerate(secrets)}
+
+    prot = ProtocolSpec(expr=expr, participant_ids=["Alice", "Bob"])
+    leader = SMCParty("Alice", "localhost", 5000, protocol_spec=prot, value_dict={})
+    other = SMCParty("Bob", "localhost", 5000, protocol_spec=prot, value_dict={})
+    expected = sum(range(50000)) % FIELD_MODULUS
+    assert leader.process_expression(expr, shares).value == (expected + 5) % FIELD_MODULUS
+    assert other.process_expression(expr, shares).value == expected
+
+
+def test_process_scalars():
+    expr = Scalar(3) * Scalar(4) + Scalar(5)
+    prot = ProtocolSpec(expr=expr, participant_ids=["Alice"])
+    party = SMCParty("Alice", "localhost", 5000, protocol_spec=prot, value_dict={})
+    result = party.process_expression(expr, {})
+    assert isinstance(result, Constant)
+    assert result.value == 17
+
+
+def test_collect_secret_ids_other_parties():
+    a, b, c = Secret(), Secret(), Secret()
+    expr = a * b + c + a
+    prot = ProtocolSpec(expr=expr, participant_ids=["Alice", "Bob"])
+    party = SMCParty("Alice", "localhost", 5000, protocol_spec=prot, value_dict={a: 1, c: 2})
+    assert party.collect_secret_ids_other_parties() == [b.id]
+
+
+def test_process_subtractions():
+    a, b = Secret(), Secret()
+    expr = Scalar(10) - a - b - Scalar(3)
+    shares = {a.id: Share(2), b.id: Share(4)}
+
+    prot = ProtocolSpec(expr=expr, participant_ids=["Alice", "Bob"])
+    leader = SMCParty("Alice", "localhost", 5000, protocol_spec=prot, value_dict={})
+    other = SMCParty("Bob", "localhost", 5000, protocol_spec=prot, value_dict={})
+    total = leader.process_expression(expr, shares).value + other.process_expression(expr, shares).value
+    assert total % FIELD_MODULUS == (10 - 2 * 2 - 2 * 4 - 3) % FIELD_MODULUS
+
+
+def test_unknown_opening_strategy():
+    with pytest.raises(ValueError):
+        ProtocolSpec(expr=Secret() * Secret(), participant_ids=["Alice", "Bob"], opening="tree")
+
+
+def test_rotating_leader():
+    participants = ["Alice", "Bob", "Charlie", "Dave"]
+    secrets = [Secret() for _ in range(400)]
+    expr = functools.reduce(lambda x, y: x + y, (secrets[i] * secrets[i + 1] for i in range(0, 400, 2)))
+    prot = ProtocolSpec(expr=expr, participant_ids=participants)
+    party = SMCParty("Bob", "localhost", 5000, protocol_spec=prot, value_dict={})
+    assert party.get_leader() == "Alice"
+    assert party.is_leader() is False
+
+    circuit = party.protocol_spec.circuit
+    beaver_registers, _ = circuit.level(1)
+    leaders = party.beaver_const_leaders(circuit, beaver_registers)
+    # every party opens some of the 200 multiplications (all but a 1e-24 chance), and every party agrees on who
+    # opens which
+    assert set(leaders) == set(participants)
+    other = SMCParty("Dave", "localhost", 5000, protocol_spec=prot, value_dict={})
+    assert leaders == other.beaver_const_leaders(circuit, beaver_registers)
+
+    groups = party.group_by_leader(leaders)
+    results = {
+        leader: BeaverConstResultsMessage(indices, [-i for i in indices]) for leader, indices in groups.items()
+    }
+    assert party.merge_beaver_const_results(groups, results, len(leaders)) == (
+        list(range(len(leaders))), [-i for i in range(len(leaders))]
+    )
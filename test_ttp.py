@@ -5,8 +5,97 @@ Testing ttp is not obligatory.
 MODIFY THIS FILE.
 """
 
+from secret_sharing import reconstruct_secret, reconstruct_secret_vector, FIELD_MODULUS, Share, ShareArray
 from ttp import TrustedParamGenerator
 
 
-def test():
-    raise NotImplementedError("You can create some tests.")
+def test_retrieve_share():
+    participants = ["Alice", "Bob", "Charlie"]
+    ttp = TrustedParamGenerator()
+    for participant in participants:
+        ttp.add_participant(participant)
+    triplets = [ttp.retrieve_share(participant, "op") for participant in participants]
+
+    a, b, c = (reconstruct_secret([triplet[i] for triplet in triplets]) for i in range(3))
+    assert a * b % FIELD_MODULUS == c
+
+
+def test_preprocess():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob"]:
+        ttp.add_participant(participant)
+    ttp.preprocess(["op1", "op2"])
+    assert set(ttp.beaver_triplets) == {"op1", "op2"}
+
+    triplet = ttp.beaver_triplets["op1"]
+    ttp.preprocess(["op1", "op3"])
+    assert ttp.beaver_triplets["op1"] is triplet
+    assert set(ttp.beaver_triplets) == {"op1", "op2", "op3"}
+
+
+def test_retrieve_shares():
+    participants = ["Alice", "Bob"]
+    ttp = TrustedParamGenerator()
+    for participant in participants:
+        ttp.add_participant(participant)
+    alice_triplets = ttp.retrieve_shares("Alice", ["op1", "op2"])
+    bob_triplets = ttp.retrieve_shares("Bob", ["op1", "op2"])
+    assert len(alice_triplets) == len(bob_triplets) == 2
+
+    for alice_triplet, bob_triplet in zip(alice_triplets, bob_triplets):
+        a, b, c = (reconstruct_secret([alice_triplet[i], bob_triplet[i]]) for i in range(3))
+        assert a * b % FIELD_MODULUS == c
+    # the triplets are kept until the run is over
+    assert set(ttp.beaver_triplets) == {"op1", "op2"}
+    ttp.clear()
+    assert ttp.beaver_triplets == {}
+
+
+def test_triplet_retrieved_again():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob"]:
+        ttp.add_participant(participant)
+    alice_triplet, = ttp.retrieve_shares("Alice", ["op"])
+    assert alice_triplet == ttp.retrieve_share("Alice", "op")
+    assert set(ttp.beaver_triplets) == {"op"}
+    bob_triplet = ttp.retrieve_share("Bob", "op")
+    # a retried request gets the same shares, which still match the shares of the other participants
+    assert ttp.retrieve_shares("Bob", ["op"]) == [bob_triplet]
+    assert ttp.metrics() == {"participants": 2, "triplets": 1}
+
+
+def test_retrieve_shares_vector():
+    participants = ["Alice", "Bob"]
+    ttp = TrustedParamGenerator()
+    for participant in participants:
+        ttp.add_participant(participant)
+    alice_triplet, = ttp.retrieve_shares("Alice", ["op"], [5])
+    bob_triplet, = ttp.retrieve_shares("Bob", ["op"], [5])
+
+    a, b, c = (reconstruct_secret_vector([alice_triplet[i], bob_triplet[i]]) for i in range(3))
+    assert len(a) == 5
+    assert [x * y % FIELD_MODULUS for x, y in zip(a, b)] == c
+
+
+def test_preprocess_batch():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob", "Charlie"]:
+        ttp.add_participant(participant)
+    ttp.preprocess(["op1", "op2", "op3"], [1, 3, 1])
+    reconstructs = {"op1": reconstruct_secret, "op2": reconstruct_secret_vector, "op3": reconstruct_secret}
+    for op_id, reconstruct in reconstructs.items():
+        triplet = ttp.beaver_triplets[op_id]
+        a, b, c = (reconstruct([triplet.get_shares(client)[i] for client in range(3)]) for i in range(3))
+        assert (a, b, c) == (triplet.a, triplet.b, triplet.c)
+    assert len(ttp.beaver_triplets["op2"].a) == 3
+    assert ttp.beaver_triplets["op1"].a != ttp.beaver_triplets["op3"].a
+
+
+def test_scalar_triplet_shares_compact():
+    ttp = TrustedParamGenerator()
+    for participant in ["Alice", "Bob"]:
+        ttp.add_participant(participant)
+    ttp.preprocess(["op"])
+    triplet = ttp.beaver_triplets["op"]
+    assert isinstance(triplet.a_shares, ShareArray)
+    assert all(isinstance(share, Share) for share in triplet.get_shares(0))
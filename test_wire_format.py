@@ -0,0 +1,87 @@
+"""
+Unit tests for the wire formats.
+"""
+import pytest
+
+from message_utils import Message, ShareMessage, ResultShareMessage, BeaverConstShareMessage, \
+    BeaverConstResultMessage, BeaverConstSharesMessage, BeaverConstResultsMessage
+from secret_sharing import Share, ShareVector, Constant, FIELD_MODULUS
+from wire_format import BinaryCodec, JsonCodec, SharesList, WireFormatError, get_codec
+
+
+@pytest.mark.parametrize("codec", [JsonCodec(), BinaryCodec()])
+def test_roundtrip(codec):
+    assert codec.decode(codec.encode(Share(FIELD_MODULUS - 1)), Share).value == FIELD_MODULUS - 1
+    assert codec.decode(codec.encode(Constant(7)), Constant).value == 7
+    assert codec.decode(codec.encode(Message(6)), Message).value == 6
+
+    share_message = codec.decode(codec.encode(ShareMessage("test".encode(), Share(11))), ShareMessage)
+    assert share_message.id == "test"
+    assert share_message.share.value == 11
+
+    assert codec.decode(codec.encode(ResultShareMessage(Share(6))), ResultShareMessage).share.value == 6
+
+    beaver_const_share = codec.decode(codec.encode(BeaverConstShareMessage(Share(2), Share(5))),
+                                      BeaverConstShareMessage)
+    assert (beaver_const_share.x_part.value, beaver_const_share.y_part.value) == (2, 5)
+
+    beaver_const_result = codec.decode(codec.encode(BeaverConstResultMessage(2, 5)), BeaverConstResultMessage)
+    assert (beaver_const_result.x_part, beaver_const_result.y_part) == (2, 5)
+
+    beaver_const_shares = codec.decode(
+        codec.encode(BeaverConstSharesMessage([Share(1), Share(2)], [Share(3), Share(4)])), BeaverConstSharesMessage)
+    assert [share.value for share in beaver_const_shares.x_parts] == [1, 2]
+    assert [share.value for share in beaver_const_shares.y_parts] == [3, 4]
+
+    beaver_const_results = codec.decode(codec.encode(BeaverConstResultsMessage([1, 2], [3, 4])),
+                                        BeaverConstResultsMessage)
+    assert (beaver_const_results.x_parts, beaver_const_results.y_parts) == ([1, 2], [3, 4])
+
+    shares = codec.decode(codec.encode(SharesList([Share(1), Share(2), Share(3)])), SharesList)
+    assert [share.value for share in shares] == [1, 2, 3]
+
+
+@pytest.mark.parametrize("codec", [JsonCodec(), BinaryCodec()])
+def test_roundtrip_vectors(codec):
+    assert codec.decode(codec.encode(ShareVector([1, 2])), ShareVector).values == [1, 2]
+    assert codec.decode(codec.encode(Message([1, 2])), Message).value == [1, 2]
+
+    share_message = codec.decode(codec.encode(ShareMessage("test".encode(), ShareVector([3, 4]))), ShareMessage)
+    assert share_message.share.values == [3, 4]
+
+    result_share = codec.decode(codec.encode(ResultShareMessage(ShareVector([5]))), ResultShareMessage)
+    assert isinstance(result_share.share, ShareVector)
+    assert result_share.share.values == [5]
+
+
+def test_binary_is_compact():
+    message = BeaverConstSharesMessage([Share(FIELD_MODULUS - 1)] * 100, [Share(FIELD_MODULUS - 1)] * 100)
+    # header, two lengths and two vectors of 100 32-bit elements
+    assert len(BinaryCodec().encode(message)) == 2 + 2 * (4 + 100 * 4)
+    assert len(BinaryCodec().encode(message)) < len(JsonCodec().encode(message)) / 4
+
+
+def test_binary_type_mismatch():
+    codec = BinaryCodec()
+    with pytest.raises(WireFormatError):
+        codec.decode(codec.encode(Share(1)), Constant)
+
+
+def test_binary_unknown_version():
+    codec = BinaryCodec()
+    data = bytearray(codec.encode(Share(1)))
+    data[0] = 255
+    with pytest.raises(WireFormatError):
+        codec.decode(bytes(data), Share)
+
+
+def test_binary_truncated():
+    codec = BinaryCodec()
+    with pytest.raises(WireFormatError):
+        codec.decode(codec.encode(Share(1))[:-1], Share)
+
+
+def test_get_codec():
+    assert get_codec("binary").name == "binary"
+    with pytest.raises(ValueError):
+        get_codec("xml")
@@ -5,15 +5,19 @@ MODIFY THIS FILE.
 """
 
 # Feel free to add as many imports as you want.
-from random import randint
 from typing import (
+    Dict,
+    List,
+    Optional,
     Set,
     Tuple,
+    Union,
 )
 
 from secret_sharing import (
-    share_secret,
-    Share, FIELD_MODULUS,
+    random_field_elements,
+    share_secrets,
+    Share, ShareArray, ShareVector, FIELD_MODULUS,
 )
 
 
@@ -47,18 +51,104 @@ class TrustedParamGenerator:
 
         return self.beaver_triplets[op_id].get_shares(self.clients[client_id])
 
+    def preprocess(self, op_ids: List[str], lengths: Optional[List[int]] = None) -> None:
+        """
+        Generate the triplets of all the provided operations at once (offline phase).
+        The operations on vectors get a vector triplet of the provided length (default: 1 for every operation).
+        Triplets that were already generated are kept.
+        """
+        if lengths is None:
+            lengths = [1] * len(op_ids)
+        missing = {op_id: length for op_id, length in zip(op_ids, lengths) if op_id not in self.beaver_triplets}
+        triplets = BeaverTriplet.generate(len(self.participant_ids), list(missing.values()))
+        self.beaver_triplets.update(zip(missing, triplets))
+
+    def retrieve_shares(
+            self,
+            client_id: str,
+            op_ids: List[str],
+            lengths: Optional[List[int]] = None
+    ) -> List[Tuple[Union[Share, ShareVector], ...]]:
+        """
+        Retrieve the triplets of shares of all the provided operations for a given client_id.
+        The triplets are kept until the run is over (see clear), so that asking again, e.g. when a request is retried,
+        returns the same shares.
+        """
+        self.preprocess(op_ids, lengths)
+        client = self.clients[client_id]
+        return [self.beaver_triplets[op_id].get_shares(client) for op_id in op_ids]
+
+    def clear(self) -> None:
+        """
+        Drop all the triplets, e.g. once a run is over.
+        """
+        self.beaver_triplets.clear()
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        Number of participants and of triplets held.
+        """
+        return {"participants": len(self.participant_ids), "triplets": len(self.beaver_triplets)}
+
+
+TripletValues = Tuple[
+    Union[int, List[int]], Union[int, List[int]], Union[int, List[int]],
+    Union[ShareArray, List[ShareVector]], Union[ShareArray, List[ShareVector]], Union[ShareArray, List[ShareVector]],
+]
+
+
+def generate_triplet_values(num_participants: int, lengths: List[int]) -> List[TripletValues]:
+    """
+    Generates the values (a, b, c) and the shares of the triplets of the provided lengths, with a single draw of
+    random values and a single batch secret sharing for all of them.
+    """
+    total = sum(lengths)
+    a_b = random_field_elements(2 * total)
+    a_values, b_values = a_b[:total], a_b[total:]
+    c_values = [a * b % FIELD_MODULUS for a, b in zip(a_values, b_values)]
+    # shares of each participant: the shares of all a values, then all b values, then all c values
+    party_values = share_secrets(a_values + b_values + c_values, num_participants)
+
+    def values(flat: List[int], offset: int, length: int) -> Union[int, List[int]]:
+        return flat[offset] if length == 1 else flat[offset:offset + length]
+
+    def shares(base: int, offset: int, length: int) -> Union[ShareArray, List[ShareVector]]:
+        if length == 1:
+            return ShareArray([party[base + offset] for party in party_values])
+        return [ShareVector(party[base + offset:base + offset + length]) for party in party_values]
+
+    triplets = []
+    offset = 0
+    for length in lengths:
+        triplets.append((
+            values(a_values, offset, length), values(b_values, offset, length), values(c_values, offset, length),
+            shares(0, offset, length), shares(total, offset, length), shares(2 * total, offset, length),
+        ))
+        offset += length
+    return triplets
+
 
 class BeaverTriplet:
-    """ Creates and holds beaver triplet shares for given number of participants. """
+    """
+    Creates and holds beaver triplet shares for given number of participants.
+    With a length above 1, every element of a vector multiplication gets its own triplet, held as ShareVector(s).
+    The shares of a scalar triplet are held compactly in ShareArray(s).
+    """
 
-    def __init__(self, num_participants) -> None:
-        self.a = randint(0, FIELD_MODULUS - 1)
-        self.b = randint(0, FIELD_MODULUS - 1)
-        self.c = self.a * self.b % FIELD_MODULUS
+    def __init__(self, num_participants, length: int = 1, values: Optional[TripletValues] = None) -> None:
+        if values is None:
+            values, = generate_triplet_values(num_participants, [length])
+        self.a, self.b, self.c, self.a_shares, self.b_shares, self.c_shares = values
 
-        self.a_shares = share_secret(self.a, num_participants)
-        self.b_shares = share_secret(self.b, num_participants)
-        self.c_shares = share_secret(self.c, num_participants)
+    @staticmethod
+    def generate(num_participants: int, lengths: List[int]) -> List["BeaverTriplet"]:
+        """
+        Creates the triplets of the provided lengths at once, see generate_triplet_values.
+        """
+        return [
+            BeaverTriplet(num_participants, length, values)
+            for length, values in zip(lengths, generate_triplet_values(num_participants, lengths))
+        ]
 
-    def get_shares(self, client_id) -> Tuple[Share, Share, Share]:
+    def get_shares(self, client_id) -> Tuple[Union[Share, ShareVector], ...]:
         return self.a_shares[client_id], self.b_shares[client_id], self.c_shares[client_id]
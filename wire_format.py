@@ -0,0 +1,228 @@
+"""
+Wire formats for the messages exchanged between the parties and with the server.
+
+Two codecs are available:
+* `json`—the objects' own `serialize`/`deserialize` methods.
+* `binary`—a compact, versioned binary format. Every payload starts with a version byte and a type tag byte,
+  field elements are fixed-width 32-bit unsigned integers (FIELD_MODULUS fits in 31 bits), vectors of field
+  elements are prefixed with their length, and strings with their length in bytes. A value that can be either a
+  single field element or a vector of them (e.g. a Share or a ShareVector) is prefixed with a kind byte.
+"""
+
+import json
+import struct
+from typing import Any, Callable, Dict, List, Tuple, Type, Union
+
+from message_utils import Message, ShareMessage, ResultShareMessage, BeaverConstShareMessage, \
+    BeaverConstResultMessage, BeaverConstSharesMessage, BeaverConstResultsMessage
+from secret_sharing import Share, ShareVector, Constant
+
+BINARY_FORMAT_VERSION = 2
+
+_KIND_ELEMENT = 0
+_KIND_VECTOR = 1
+
+_HEADER = struct.Struct(">BB")
+_KIND = struct.Struct(">B")
+_ELEMENT = struct.Struct(">I")
+_LENGTH = struct.Struct(">I")
+_STRING_LENGTH = struct.Struct(">H")
+
+
+class WireFormatError(ValueError):
+    """ Raised when a payload cannot be decoded. """
+
+
+class SharesList(list):
+    """ A plain list of shares, e.g. the shares of a beaver triplet sent by the server. """
+
+    def serialize(self):
+        """Generate a representation suitable for passing in a message."""
+        return json.dumps([share.serialize() for share in self])
+
+    @staticmethod
+    def deserialize(serialized) -> "SharesList":
+        """Restore object from its serialized representation."""
+        return SharesList(Share.deserialize(share) for share in json.loads(serialized))
+
+
+class JsonCodec:
+    """ Encodes objects with their own JSON serialization. """
+
+    name = "json"
+
+    def encode(self, obj) -> bytes:
+        """ Returns the serialized representation of the provided object. """
+        return obj.serialize().encode("utf-8")
+
+    def decode(self, data: bytes, cls: Type):
+        """ Restores an object of the provided class from its serialized representation. """
+        return cls.deserialize(data)
+
+
+def _pack_element(value: int) -> bytes:
+    return _ELEMENT.pack(value)
+
+
+def _pack_vector(values: List[int]) -> bytes:
+    return _LENGTH.pack(len(values)) + struct.pack(f">{len(values)}I", *values)
+
+
+def _pack_value(value: Union[int, List[int]]) -> bytes:
+    if isinstance(value, list):
+        return _KIND.pack(_KIND_VECTOR) + _pack_vector(value)
+    return _KIND.pack(_KIND_ELEMENT) + _pack_element(value)
+
+
+def _pack_share(share: Union[Share, ShareVector]) -> bytes:
+    if isinstance(share, ShareVector):
+        return _pack_value(share.values)
+    return _pack_value(share.value)
+
+
+def _pack_string(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    return _STRING_LENGTH.pack(len(encoded)) + encoded
+
+
+class _Reader:
+    """ Reads the fields of a binary payload one after the other. """
+
+    def __init__(self, data: bytes, offset: int):
+        self.data = data
+        self.offset = offset
+
+    def element(self) -> int:
+        (value,) = _ELEMENT.unpack_from(self.data, self.offset)
+        self.offset += _ELEMENT.size
+        return value
+
+    def vector(self) -> List[int]:
+        (length,) = _LENGTH.unpack_from(self.data, self.offset)
+        self.offset += _LENGTH.size
+        values = list(struct.unpack_from(f">{length}I", self.data, self.offset))
+        self.offset += length * _ELEMENT.size
+        return values
+
+    def value(self) -> Union[int, List[int]]:
+        (kind,) = _KIND.unpack_from(self.data, self.offset)
+        self.offset += _KIND.size
+        if kind == _KIND_ELEMENT:
+            return self.element()
+        if kind == _KIND_VECTOR:
+            return self.vector()
+        raise WireFormatError(f"Unknown value kind {kind}")
+
+    def share(self) -> Union[Share, ShareVector]:
+        value = self.value()
+        if isinstance(value, list):
+            return ShareVector(value)
+        return Share(value)
+
+    def string(self) -> str:
+        (length,) = _STRING_LENGTH.unpack_from(self.data, self.offset)
+        self.offset += _STRING_LENGTH.size
+        value = self.data[self.offset:self.offset + length].decode("utf-8")
+        self.offset += length
+        return value
+
+
+# For each supported class: type tag, encoder of the fields, decoder of the fields.
+_BINARY_TYPES: Dict[Type, Tuple[int, Callable[[Any], bytes], Callable[[_Reader], Any]]] = {
+    Share: (
+        1,
+        lambda obj: _pack_element(obj.value),
+        lambda reader: Share(reader.element()),
+    ),
+    Constant: (
+        2,
+        lambda obj: _pack_element(obj.value),
+        lambda reader: Constant(reader.element()),
+    ),
+    Message: (
+        3,
+        lambda obj: _pack_value(obj.value),
+        lambda reader: Message(reader.value()),
+    ),
+    ShareMessage: (
+        4,
+        lambda obj: _pack_string(obj.id) + _pack_share(obj.share),
+        lambda reader: ShareMessage(reader.string().encode(), reader.share()),
+    ),
+    ResultShareMessage: (
+        5,
+        lambda obj: _pack_share(obj.share),
+        lambda reader: ResultShareMessage(reader.share()),
+    ),
+    BeaverConstShareMessage: (
+        6,
+        lambda obj: _pack_element(obj.x_part.value) + _pack_element(obj.y_part.value),
+        lambda reader: BeaverConstShareMessage(Share(reader.element()), Share(reader.element())),
+    ),
+    BeaverConstResultMessage: (
+        7,
+        lambda obj: _pack_element(obj.x_part) + _pack_element(obj.y_part),
+        lambda reader: BeaverConstResultMessage(reader.element(), reader.element()),
+    ),
+    BeaverConstSharesMessage: (
+        8,
+        lambda obj: _pack_vector([share.value for share in obj.x_parts]) +
+                    _pack_vector([share.value for share in obj.y_parts]),
+        lambda reader: BeaverConstSharesMessage([Share(value) for value in reader.vector()],
+                                                [Share(value) for value in reader.vector()]),
+    ),
+    BeaverConstResultsMessage: (
+        9,
+        lambda obj: _pack_vector(obj.x_parts) + _pack_vector(obj.y_parts),
+        lambda reader: BeaverConstResultsMessage(reader.vector(), reader.vector()),
+    ),
+    SharesList: (
+        10,
+        lambda obj: _pack_vector([share.value for share in obj]),
+        lambda reader: SharesList(Share(value) for value in reader.vector()),
+    ),
+    ShareVector: (
+        11,
+        lambda obj: _pack_vector(obj.values),
+        lambda reader: ShareVector(reader.vector()),
+    ),
+}
+
+
+class BinaryCodec:
+    """ Encodes objects in the compact binary format. """
+
+    name = "binary"
+
+    def encode(self, obj) -> bytes:
+        """ Returns the binary representation of the provided object. """
+        if type(obj) not in _BINARY_TYPES:
+            raise WireFormatError(f"Unsupported type {type(obj).__name__}")
+        tag, encoder, _ = _BINARY_TYPES[type(obj)]
+        return _HEADER.pack(BINARY_FORMAT_VERSION, tag) + encoder(obj)
+
+    def decode(self, data: bytes, cls: Type):
+        """ Restores an object of the provided class from its binary representation. """
+        if cls not in _BINARY_TYPES:
+            raise WireFormatError(f"Unsupported type {cls.__name__}")
+        tag, _, decoder = _BINARY_TYPES[cls]
+        try:
+            version, data_tag = _HEADER.unpack_from(data, 0)
+            if version != BINARY_FORMAT_VERSION:
+                raise WireFormatError(f"Unsupported binary format version {version}")
+            if data_tag != tag:
+                raise WireFormatError(f"Expected type tag {tag} for {cls.__name__}, got {data_tag}")
+            return decoder(_Reader(data, _HEADER.size))
+        except (struct.error, UnicodeDecodeError) as e:
+            raise WireFormatError(f"Malformed {cls.__name__} payload") from e
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), BinaryCodec())}
+DEFAULT_CODEC = JsonCodec.name
+
+
+def get_codec(name: str):
+    """ Returns the codec with the provided name. """
+    if name not in CODECS:
+        raise ValueError(f"Unknown wire format {name}")
+    return CODECS[name]